@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ClassSense loop benchmark, for any Linux box
+
+Runs the real client loop (classsense/client.py) with simulated sensors and
+display (classsense/simulated.py) against a local stand-in for the web
+server, and reports
+    * loop jitter: how late every scheduled job started
+    * per-stage latency: each sensor read, the scheduled jobs (publish,
+      summary, ...), LCD draws, serialization, HTTP requests and whole
+      uploads (serialization + POST, retries included)
+    * CPU time and memory (RSS, and its growth) over the run
+
+    python3 benchmark.py --duration 600 --json bench.json
+    python3 benchmark.py --duration 600 --compare bench.json
+
+`--compare` exits with status 1 when a p95 latency, the CPU share or the
+memory growth regressed by more than `--tolerance` against a saved run.
+All other settings come from config.ini; `--set section.key=value`
+overrides any of them for the run.
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import threading
+from configparser import ConfigParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STARTED = time.monotonic()
+
+from classsense import client
+
+log = logging.getLogger("ClassSense")
+
+CLIENTS = {
+    "basic": "sensor_client",
+    "voc": "sensor_client_voc",
+}
+
+# Differences below this many ms (or percentage points) are noise
+MIN_REGRESSION = 1.0
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def summarize(values_s):
+    """Milliseconds summary of a list of durations in seconds."""
+    ms = sorted(v * 1000.0 for v in values_s)
+    if not ms:
+        return {"n": 0}
+    return {
+        "n": len(ms),
+        "p50": round(percentile(ms, 50), 3),
+        "p95": round(percentile(ms, 95), 3),
+        "p99": round(percentile(ms, 99), 3),
+        "max": round(ms[-1], 3),
+    }
+
+
+class Recorder(client.Probe):
+    """Keeps every timing the loop reports."""
+
+    def __init__(self):
+        self.lateness = {}
+        self.stages = {}
+        self.failures = {}
+        # When the loop was up: memory growth is measured from there on
+        self.running_since = None
+        self._lock = threading.Lock()
+
+    def _add(self, table, key, value):
+        with self._lock:
+            table.setdefault(key, []).append(value)
+
+    def job(self, name, late_s, seconds):
+        if self.running_since is None and name == "publish":
+            self.running_since = time.monotonic()
+        self._add(self.lateness, name, late_s)
+        self._add(self.stages, f"job {name}", seconds)
+
+    def read(self, channel, seconds, ok):
+        self._add(self.stages, f"read {channel}", seconds)
+        if not ok:
+            self._add(self.failures, f"read {channel}", 1)
+
+    def upload(self, samples, seconds, ok):
+        self._add(self.stages, "upload", seconds)
+        if not ok:
+            self._add(self.failures, "upload", 1)
+
+    def draw(self, seconds):
+        self._add(self.stages, "lcd draw", seconds)
+
+    def serialize(self, samples, size, seconds):
+        self._add(self.stages, "serialize", seconds)
+
+    def request(self, seconds, status):
+        self._add(self.stages, "http request", seconds)
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    Accepts everything the client sends: class creation, single samples and
+    batches (JSON, NDJSON or MessagePack, optionally gzipped). Responses can
+    be delayed and fail (503) at a given rate.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency_s=0.0, error_rate=0.0):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.latency_s = latency_s
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self.samples = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, body, content_type):
+        if "msgpack" in content_type:
+            # [version, shared, samples]
+            try:
+                import msgpack
+                return len(msgpack.unpackb(body, raw=False, strict_map_key=False)[2])
+            except Exception:
+                return 0
+        try:
+            text = body.decode("utf-8")
+            if "ndjson" in content_type:
+                return sum(1 for line in text.splitlines() if line.strip())
+            data = json.loads(text)
+            return len(data) if isinstance(data, list) else 1
+        except Exception:
+            return 0
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if server.latency_s > 0:
+            time.sleep(server.latency_s)
+        with server._lock:
+            server.requests += 1
+            server.bytes += len(body)
+        if self.path == "/api/classes":
+            return self._reply(200, {"pin": "00000"})
+        if random.random() < server.error_rate:
+            with server._lock:
+                server.errors += 1
+            return self._reply(503, {"error": "injected"})
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        n = server.count(body, self.headers.get("Content-Type", ""))
+        with server._lock:
+            server.samples += n
+        self._reply(200, {"status": "ingest_ok"})
+
+
+class ResourceSampler(threading.Thread):
+    """Samples the resident set size once per second, as (time, bytes)."""
+
+    def __init__(self, interval_s=1.0):
+        super().__init__(name="bench-rss", daemon=True)
+        self.interval_s = interval_s
+        self.rss = []
+        self._stop_event = threading.Event()
+
+    @staticmethod
+    def rss_bytes():
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.rss.append((time.monotonic(), self.rss_bytes()))
+            self._stop_event.wait(self.interval_s)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.rss.append((time.monotonic(), self.rss_bytes()))
+
+    def since(self, t):
+        """The first sample taken at or after `t` (the last one if none)."""
+        if t is not None:
+            for sample in self.rss:
+                if sample[0] >= t:
+                    return sample[1]
+        return self.rss[-1][1]
+
+
+def build_config(args, module, server_url, workdir):
+    cfg = ConfigParser()
+    if not cfg.read(args.config):
+        raise FileNotFoundError(f"Config file not found: {args.config}")
+
+    def put(section, key, value):
+        if not cfg.has_section(section):
+            cfg.add_section(section)
+        cfg.set(section, key, str(value))
+
+    put("server", "url", "")
+    put("server", "api_base", server_url)
+    put("server", "class_pin", "00000")
+    put("server", "auto_create_class", "false")
+    put("sampling", "drivers", ", ".join("sim_" + name for name in module.DRIVERS))
+    put("outbox", "path", os.path.join(workdir, "outbox.sqlite3"))
+    put("history", "path", os.path.join(workdir, "history.dat"))
+    put("sgp30", "baseline_path", "")
+    put("simulate", "display", "true")
+    if args.period:
+        put("sampling", "period_seconds", args.period)
+    if args.trace:
+        put("simulate", "trace", os.path.abspath(args.trace))
+    for key, value in (("latency_scale", args.latency_scale), ("fail_rate", args.fail_rate),
+                       ("hang_rate", args.hang_rate)):
+        if value is not None:
+            put("simulate", key, value)
+    for item in args.set:
+        name, _, value = item.partition("=")
+        section, _, key = name.partition(".")
+        if not key:
+            raise ValueError(f"--set expects section.key=value, got {item!r}")
+        put(section, key, value)
+
+    path = os.path.join(workdir, "config.ini")
+    with open(path, "w") as f:
+        cfg.write(f)
+    return path
+
+
+def run_benchmark(args, module):
+    server = StandInServer(latency_s=args.server_latency_ms / 1000.0, error_rate=args.server_error_rate)
+    threading.Thread(target=server.serve_forever, name="bench-server", daemon=True).start()
+    recorder = Recorder()
+    sampler = ResourceSampler()
+
+    with tempfile.TemporaryDirectory(prefix="classsense-bench-") as workdir:
+        config_path = build_config(args, module, server.url, workdir)
+        stopper = threading.Timer(args.duration, client.shutdown_event.set)
+        stopper.daemon = True
+
+        sampler.start()
+        cpu0 = os.times()
+        wall0 = time.monotonic()
+        stopper.start()
+        client.run(
+            module.APP_NAME, module.VERSION, module.DRIVERS,
+            driver_options=module.DRIVER_OPTIONS,
+            init_lcd=module.init_lcd,
+            config_path=config_path,
+            started=STARTED,
+            probe=recorder,
+        )
+        wall = time.monotonic() - wall0
+        cpu1 = os.times()
+        sampler.stop()
+    server.shutdown()
+
+    cpu_s = (cpu1.user - cpu0.user) + (cpu1.system - cpu0.system)
+    rss = [b for _, b in sampler.rss]
+    running = sampler.since(recorder.running_since)
+    return {
+        "client": args.client,
+        "duration_s": round(wall, 1),
+        "jitter_ms": {name: summarize(v) for name, v in sorted(recorder.lateness.items())},
+        "stages_ms": {name: summarize(v) for name, v in sorted(recorder.stages.items())},
+        "failures": {name: len(v) for name, v in sorted(recorder.failures.items())},
+        "cpu": {
+            "seconds": round(cpu_s, 3),
+            "percent": round(100.0 * cpu_s / wall, 2) if wall > 0 else None,
+        },
+        "memory_mib": {
+            "start": round(rss[0] / 2**20, 1),
+            "running": round(running / 2**20, 1),
+            "end": round(rss[-1] / 2**20, 1),
+            "max": round(max(rss) / 2**20, 1),
+            "growth": round((rss[-1] - running) / 2**20, 1),
+        },
+        "server": {
+            "requests": server.requests,
+            "errors": server.errors,
+            "samples": server.samples,
+            "kib": round(server.bytes / 1024.0, 1),
+        },
+    }
+
+
+def print_report(result):
+    def table(title, rows):
+        print(f"{title:<28}{'n':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+        for name, s in rows.items():
+            if not s["n"]:
+                continue
+            print(f"  {name:<26}{s['n']:>7}{s['p50']:>9.2f}{s['p95']:>9.2f}{s['p99']:>9.2f}{s['max']:>9.2f}")
+
+    print(f"ClassSense loop benchmark: {result['client']} client, {result['duration_s']} s")
+    table("Loop jitter (ms)", result["jitter_ms"])
+    table("Stage latency (ms)", result["stages_ms"])
+    if result["failures"]:
+        print("Failures: " + ", ".join(f"{k} {v}" for k, v in result["failures"].items()))
+    cpu, mem, srv = result["cpu"], result["memory_mib"], result["server"]
+    print(f"CPU: {cpu['seconds']:.2f} s ({cpu['percent']:.2f} % of one core)")
+    print(f"Memory: RSS {mem['start']} MiB before startup, {mem['running']} MiB once running,"
+          f" {mem['end']} MiB at end, max {mem['max']} MiB ({mem['growth']:+} MiB while running)")
+    print(f"Server: {srv['requests']} requests ({srv['errors']} failed), "
+          f"{srv['samples']} samples, {srv['kib']} KiB")
+
+
+def compare(result, baseline, tolerance):
+    """Regressions of `result` against `baseline`, as readable strings."""
+    found = []
+
+    def check(label, now, before):
+        if now is None or before is None:
+            return
+        if now > before * (1.0 + tolerance) and now - before > MIN_REGRESSION:
+            found.append(f"{label}: {before} -> {now}")
+
+    for group in ("jitter_ms", "stages_ms"):
+        for name, s in result[group].items():
+            before = baseline.get(group, {}).get(name, {})
+            check(f"{group} {name} p95", s.get("p95"), before.get("p95"))
+    check("cpu percent", result["cpu"]["percent"], baseline["cpu"]["percent"])
+    check("memory growth MiB", result["memory_mib"]["growth"], max(0.0, baseline["memory_mib"]["growth"]))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ClassSense loop with simulated hardware.")
+    parser.add_argument("--client", choices=sorted(CLIENTS), default="basic")
+    parser.add_argument("--config", default="config.ini")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds")
+    parser.add_argument("--period", type=float, help="[sampling] period_seconds")
+    parser.add_argument("--trace", help="JSON Lines payloads to replay instead of synthetic data")
+    parser.add_argument("--latency-scale", type=float, help="multiplies the declared read latencies")
+    parser.add_argument("--fail-rate", type=float, help="probability that a read fails")
+    parser.add_argument("--hang-rate", type=float, help="probability that a read hangs")
+    parser.add_argument("--server-latency-ms", type=float, default=20.0)
+    parser.add_argument("--server-error-rate", type=float, default=0.0)
+    parser.add_argument("--set", action="append", default=[], metavar="SECTION.KEY=VALUE")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results of an earlier run to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("-v", "--verbose", action="store_true", help="show the client's log")
+    args = parser.parse_args()
+
+    # The client script sets up its log on stdout; keep the report there alone
+    module = __import__(CLIENTS[args.client])
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("[%(asctime)s] %(levelname)s - %(message)s"))
+    log.handlers[:] = [handler]
+    log.setLevel(logging.INFO if args.verbose else logging.ERROR)
+
+    result = run_benchmark(args, module)
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r") as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+"""
+Shared building blocks for the ClassSense Pi clients
+(`sensor_client.py` and `sensor_client_voc.py`).
+"""
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Adaptive sampling and upload rate.
+
+Every reading of a watched metric goes into a short sliding window
+(`window_s`) that keeps running sums, so its standard deviation and its
+least-squares slope are available in O(1) per reading. Once a second the
+controller compares them with the metric's thresholds:
+
+- when a metric is active (its std or |slope| is above its threshold, or
+  was within the last `hold_s`), its channel is read at the metric's
+  ceiling rate and samples are published every `fast_period_s`;
+- when everything is stable, channels drop to their floor rates and
+  samples are published every `slow_period_s`.
+
+Readings that cover the publish period (the noise levels, unless
+`[noise] window_seconds` is set) follow the current period through
+`on_period`, so a slow-mode sample still covers its whole interval. The
+`[aggregate]` summary windows are fixed in time and do not depend on the
+publish period, so they stay as they are.
+
+Rules are set per sensors key in `[adaptive]`, e.g.
+
+    noise_db = std 4, slope 30, hz 0.5-2
+    eco2_ppm = slope 60
+
+`std` is in the metric's unit, `slope` in units per minute and `hz` the
+read rate while stable and active (without `hz` the read rate stays as
+configured and the metric only drives the publish period).
+"""
+
+import math
+import time
+import logging
+import threading
+from collections import deque
+
+log = logging.getLogger("ClassSense.adaptive")
+
+
+class Activity:
+    """Standard deviation and slope of the readings in the last `window_s`."""
+
+    def __init__(self, window_s):
+        self.window_s = window_s
+        self._points = deque()
+        self._t0 = None
+        self.n = 0
+        self._st = self._sx = self._stt = self._stx = self._sxx = 0.0
+
+    def _apply(self, t, x, sign):
+        self.n += sign
+        self._st += sign * t
+        self._sx += sign * x
+        self._stt += sign * t * t
+        self._stx += sign * t * x
+        self._sxx += sign * x * x
+
+    def add(self, now, x):
+        if self._t0 is None or not self.n:
+            # Small times keep the sums exact
+            self._t0 = now
+            self._st = self._sx = self._stt = self._stx = self._sxx = 0.0
+        t = now - self._t0
+        self._points.append((t, x))
+        self._apply(t, x, 1)
+        self.expire(now)
+
+    def expire(self, now):
+        if self._t0 is None:
+            return
+        horizon = now - self._t0 - self.window_s
+        while self._points and self._points[0][0] < horizon:
+            t, x = self._points.popleft()
+            self._apply(t, x, -1)
+
+    def std(self):
+        if self.n < 2:
+            return 0.0
+        var = (self._sxx - self._sx * self._sx / self.n) / (self.n - 1)
+        return math.sqrt(max(0.0, var))
+
+    def slope(self):
+        """Least-squares slope, units per second."""
+        if self.n < 2:
+            return 0.0
+        den = self.n * self._stt - self._st * self._st
+        if den <= 1e-12:
+            return 0.0
+        return (self.n * self._stx - self._st * self._sx) / den
+
+
+class Rule:
+    def __init__(self, metric, channel, extract, std=None, slope_per_min=None,
+                 floor_hz=None, ceiling_hz=None):
+        self.metric = metric
+        self.channel = channel
+        self.extract = extract
+        self.std = std
+        self.slope_per_min = slope_per_min
+        self.floor_hz = floor_hz
+        self.ceiling_hz = ceiling_hz
+
+    def triggered(self, activity):
+        """Why `activity` counts as active, or None."""
+        if self.std is not None:
+            std = activity.std()
+            if std > self.std:
+                return f"std {std:.2f} > {self.std:g}"
+        if self.slope_per_min is not None:
+            slope = activity.slope() * 60.0
+            if abs(slope) > self.slope_per_min:
+                return f"slope {slope:+.2f}/min beyond {self.slope_per_min:g}"
+        return None
+
+
+def parse_rule(metric, channel, extract, text):
+    """Rule from "std 4, slope 30, hz 0.5-2"; ValueError if invalid."""
+    kwargs = {}
+    for part in text.split(","):
+        words = part.split()
+        if not words:
+            continue
+        if len(words) != 2:
+            raise ValueError(f"[adaptive] {metric}: expected '<name> <value>', got {part.strip()!r}")
+        name, value = words
+        if name == "std":
+            kwargs["std"] = float(value)
+        elif name == "slope":
+            kwargs["slope_per_min"] = float(value)
+        elif name == "hz":
+            floor, _, ceiling = value.partition("-")
+            kwargs["floor_hz"] = float(floor)
+            kwargs["ceiling_hz"] = float(ceiling or floor)
+            if not 0 < kwargs["floor_hz"] <= kwargs["ceiling_hz"]:
+                raise ValueError(f"[adaptive] {metric}: hz needs 0 < floor <= ceiling, got {value}")
+        else:
+            raise ValueError(f"[adaptive] {metric}: unknown setting {name!r} (std, slope, hz)")
+    return Rule(metric, channel, extract, **kwargs)
+
+
+class AdaptiveRate:
+    """
+    Switches channel read rates and the publish period between their
+    stable and active values. `rates` maps channel names to their
+    configured read rate, `max_rates` to the highest rate they support.
+    """
+
+    SETTINGS = ("fast_period_seconds", "slow_period_seconds", "window_seconds", "hold_seconds")
+
+    def __init__(self, rules, rates, max_rates=None, fast_period_s=10.0, slow_period_s=60.0,
+                 window_s=30.0, hold_s=120.0):
+        self.rules = list(rules)
+        self.fast_period_s = fast_period_s
+        self.slow_period_s = max(fast_period_s, slow_period_s)
+        self.hold_s = hold_s
+        self._activity = {r.metric: Activity(window_s) for r in self.rules}
+        self._by_channel = {}
+        for r in self.rules:
+            self._by_channel.setdefault(r.channel, []).append(r)
+        max_rates = max_rates or {}
+        # channel -> (stable rate, active rate)
+        self._rates = {}
+        for channel, rate in rates.items():
+            rules = [r for r in self._by_channel.get(channel, []) if r.floor_hz is not None]
+            if not rules:
+                continue
+            floor = max(r.floor_hz for r in rules)
+            ceiling = min(max(r.ceiling_hz for r in rules), max_rates.get(channel, math.inf))
+            self._rates[channel] = (min(floor, ceiling), ceiling)
+        # Start fast, until there is a window of readings to judge
+        self._active_until = {r.metric: time.monotonic() + hold_s for r in self.rules}
+        self.active = True
+        self.period_s = fast_period_s
+        self.rates = dict(rates)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg, sources, rates, max_rates=None, period_s=10.0):
+        """
+        Returns None when [adaptive] slow_period_seconds is 0 (disabled).
+        `sources` maps sensors keys to (channel, extract).
+        """
+        slow_period_s = cfg.getfloat("adaptive", "slow_period_seconds", fallback=0)
+        if slow_period_s <= 0:
+            return None
+        rules = []
+        for key in cfg.options("adaptive"):
+            if key in cls.SETTINGS:
+                continue
+            if key not in sources:
+                log.warning(f"[adaptive] {key}: no such metric, ignored.")
+                continue
+            channel, extract = sources[key]
+            rules.append(parse_rule(key, channel, extract, cfg.get("adaptive", key)))
+        return cls(
+            rules,
+            rates,
+            max_rates=max_rates,
+            fast_period_s=cfg.getfloat("adaptive", "fast_period_seconds", fallback=period_s),
+            slow_period_s=slow_period_s,
+            window_s=cfg.getfloat("adaptive", "window_seconds", fallback=30),
+            hold_s=cfg.getfloat("adaptive", "hold_seconds", fallback=120),
+        )
+
+    def add(self, channel, value):
+        """Feed one channel reading (e.g. as `SamplingEngine.on_sample`)."""
+        rules = self._by_channel.get(channel)
+        if not rules:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for r in rules:
+                try:
+                    x = value if r.extract is None else r.extract(value)
+                except Exception:
+                    continue
+                if x is None or (isinstance(x, float) and math.isnan(x)):
+                    continue
+                self._activity[r.metric].add(now, float(x))
+
+    def _update(self):
+        """Re-evaluate the rules; True if the overall mode changed."""
+        now = time.monotonic()
+        with self._lock:
+            for r in self.rules:
+                activity = self._activity[r.metric]
+                activity.expire(now)
+                reason = r.triggered(activity)
+                if reason is None:
+                    continue
+                if now >= self._active_until[r.metric]:
+                    log.info(f"Activity on {r.metric} ({reason}).")
+                self._active_until[r.metric] = now + self.hold_s
+        active_metrics = {r.metric for r in self.rules if now < self._active_until[r.metric]}
+
+        for channel, (floor, ceiling) in self._rates.items():
+            channel_active = any(r.metric in active_metrics for r in self._by_channel[channel])
+            self.rates[channel] = ceiling if channel_active else floor
+        active = bool(active_metrics)
+        changed = active != self.active
+        self.active = active
+        self.period_s = self.fast_period_s if active else self.slow_period_s
+        return changed
+
+    def schedule(self, scheduler, engine, publish_job="publish", on_period=None):
+        """
+        Register the once-a-second evaluation that retunes `scheduler`.
+        `on_period(period_s)` is called whenever the publish period changes.
+        """
+        applied = [None]
+
+        def retune():
+            if self._update():
+                log.info(f"{'Active' if self.active else 'Stable'}: publishing every {self.period_s:g} s.")
+            scheduler.set_interval(publish_job, self.period_s)
+            if on_period is not None and self.period_s != applied[0]:
+                on_period(self.period_s)
+                applied[0] = self.period_s
+            for channel in self._rates:
+                ch = engine.channel(channel)
+                rate = self.rates[channel]
+                if ch.rate_hz != rate:
+                    log.debug(f"{channel}: reading at {rate:g} Hz")
+                    ch.rate_hz = rate
+                    scheduler.set_interval(channel, ch.interval_s)
+
+        scheduler.every(1.0, retune, name="adaptive")
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Windowed aggregation of sensor readings.
+
+Every reading is fed into streaming accumulators as it arrives, and once
+per window only the summary (count, min, max, mean, standard deviation and
+95th percentile per metric) is uploaded. Each update is O(1) in time and
+memory, whatever the read rate or window length:
+
+- mean and variance use Welford's algorithm, which stays numerically
+  stable without keeping the samples;
+- the percentile uses the P-square estimator (Jain & Chlamtac, 1985), which
+  tracks five markers instead of sorting the window.
+"""
+
+import math
+import logging
+import threading
+from datetime import datetime, timezone
+
+log = logging.getLogger("ClassSense.aggregate")
+
+
+class P2Quantile:
+    """Streaming estimate of the `p` quantile (P-square algorithm)."""
+
+    def __init__(self, p):
+        self.p = p
+        self._first = []
+        self._q = None
+        self._n = None
+        self._want = None
+        self._step = (0.0, p / 2.0, p, (1.0 + p) / 2.0, 1.0)
+
+    def add(self, x):
+        if self._q is None:
+            self._first.append(x)
+            if len(self._first) == 5:
+                self._q = sorted(self._first)
+                self._n = [0, 1, 2, 3, 4]
+                self._want = [0.0, 2.0 * self.p, 4.0 * self.p, 2.0 + 2.0 * self.p, 4.0]
+            return
+
+        q, n = self._q, self._n
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self._want[i] += self._step[i]
+
+        # Move the middle markers towards their desired positions
+        for i in (1, 2, 3):
+            d = self._want[i] - n[i]
+            if (d >= 1.0 and n[i + 1] - n[i] > 1) or (d <= -1.0 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                candidate = self._parabolic(i, d)
+                if q[i - 1] < candidate < q[i + 1]:
+                    q[i] = candidate
+                else:
+                    q[i] = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                n[i] += d
+
+    def _parabolic(self, i, d):
+        q, n = self._q, self._n
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self):
+        if self._q is not None:
+            return self._q[2]
+        if not self._first:
+            return None
+        # Fewer than five samples: exact, linearly interpolated
+        s = sorted(self._first)
+        pos = self.p * (len(s) - 1)
+        lo = int(pos)
+        hi = min(lo + 1, len(s) - 1)
+        return s[lo] + (s[hi] - s[lo]) * (pos - lo)
+
+
+class RunningStats:
+    """Count, min, max, mean, stddev and one percentile of a stream."""
+
+    def __init__(self, percentile=0.95):
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._quantile = P2Quantile(percentile)
+
+    def add(self, x):
+        """Add one reading; None and nan are ignored."""
+        if x is None:
+            return
+        x = float(x)
+        if math.isnan(x):
+            return
+        self.count += 1
+        delta = x - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (x - self._mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+        self._quantile.add(x)
+
+    def summary(self, digits=2):
+        """Summary dict, or None without readings."""
+        if self.count == 0:
+            return None
+        std = math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else 0.0
+        return {
+            "n": self.count,
+            "min": round(self.min, digits),
+            "max": round(self.max, digits),
+            "mean": round(self._mean, digits),
+            "std": round(std, digits),
+            "p95": round(self._quantile.value(), digits),
+        }
+
+
+class WindowAggregator:
+    """
+    Aggregates channel readings per metric until `flush()`.
+
+    `metrics` maps a metric name to (channel name, extract), where `extract`
+    turns the channel's value into the metric's number (None: as is).
+    """
+
+    def __init__(self, metrics, window_s=60.0, percentile=0.95):
+        self.window_s = window_s
+        self.percentile = percentile
+        self._by_channel = {}
+        for metric, (channel, extract) in metrics.items():
+            self._by_channel.setdefault(channel, []).append((metric, extract))
+        self._names = list(metrics)
+        self._lock = threading.Lock()
+        self._reset()
+
+    @classmethod
+    def from_config(cls, cfg, metrics):
+        """Returns None when [aggregate] window_seconds is 0 (disabled)."""
+        window_s = cfg.getfloat("aggregate", "window_seconds", fallback=0)
+        if window_s <= 0:
+            return None
+        return cls(
+            metrics,
+            window_s=window_s,
+            percentile=cfg.getfloat("aggregate", "percentile", fallback=95) / 100.0,
+        )
+
+    def _reset(self):
+        self._stats = {name: RunningStats(self.percentile) for name in self._names}
+        self._start = datetime.now(timezone.utc)
+
+    def add(self, channel, value):
+        """Feed one channel reading (e.g. as `SamplingEngine.on_sample`)."""
+        targets = self._by_channel.get(channel)
+        if not targets:
+            return
+        with self._lock:
+            for metric, extract in targets:
+                try:
+                    x = value if extract is None else extract(value)
+                except Exception as e:
+                    log.debug(f"{metric}: cannot aggregate {value!r}: {e}")
+                    continue
+                self._stats[metric].add(x)
+
+    def flush(self):
+        """
+        Summaries of the window that just ended, and start a new one:
+            {"start": <ISO UTC>, "end": <ISO UTC>, "metrics": {name: summary}}
+        """
+        with self._lock:
+            stats, start = self._stats, self._start
+            self._reset()
+            end = self._start
+        return {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "metrics": {name: s.summary() for name, s in stats.items()},
+        }
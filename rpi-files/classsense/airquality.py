@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+SGP30 with a persisted baseline and background warm-up.
+
+The SGP30 learns its eCO2 / VOC baseline on-chip, and forgets it on every
+restart. Without a stored baseline the readings drift for hours, so:
+
+- the baseline is saved to a small JSON file at regular intervals and on
+  shutdown, and restored right after the sensor is initialised;
+- as the datasheet recommends, a baseline is only saved after 12 hours of
+  operation when none was restored, and a stored baseline older than a
+  week is ignored;
+- creating the driver and `start_measurement()` (about 15 s of warm-up
+  readings) run on their own thread, so other sensors, the LCD and uploads
+  start immediately. `warming_up` is True meanwhile; reads fail if the
+  warm-up failed.
+
+All I2C access goes through one lock, so baseline reads on the scheduler
+thread never interleave with air-quality reads. `restart()` builds a new
+driver (e.g. after the old one hung) and warms it up again.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+log = logging.getLogger("ClassSense.airquality")
+
+FIRST_SAVE_AFTER_S = 12 * 3600
+MAX_BASELINE_AGE_S = 7 * 24 * 3600
+
+
+class AirQualitySensor:
+    def __init__(self, factory, baseline_path=None, save_interval_s=3600.0,
+                 first_save_after_s=FIRST_SAVE_AFTER_S,
+                 max_baseline_age_s=MAX_BASELINE_AGE_S):
+        self.factory = factory
+        self.sensor = None
+        self.baseline_path = baseline_path
+        self.save_interval_s = save_interval_s
+        self.first_save_after_s = first_save_after_s
+        self.max_baseline_age_s = max_baseline_age_s
+
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._started = None
+        self._restored = False
+        self._error = None
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, cfg, factory):
+        """`factory()` creates the SGP30 driver, e.g. the `SGP30` class."""
+        path = cfg.get("sgp30", "baseline_path", fallback="sgp30_baseline.json").strip()
+        return cls(
+            factory,
+            baseline_path=path or None,
+            save_interval_s=cfg.getfloat("sgp30", "baseline_save_minutes", fallback=60) * 60,
+        )
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    @property
+    def warming_up(self):
+        return not self._ready.is_set() and self._error is None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._warm_up, name="sgp30-warmup", daemon=True)
+        self._thread.start()
+
+    def restart(self):
+        """Drop the current driver and warm up a new one."""
+        self._ready.clear()
+        self._error = None
+        # A fresh lock: a hung call may still hold the old one
+        self._lock = threading.Lock()
+        self.start()
+
+    def _warm_up(self):
+        t0 = time.monotonic()
+        try:
+            with self._lock:
+                self.sensor = self.factory()
+                self.sensor.start_measurement()
+                self._started = time.monotonic()
+                self._restored = self._restore()
+        except Exception as e:
+            log.error(f"SGP30 warm-up failed: {e}")
+            self._error = e
+            return
+        self._ready.set()
+        log.info(f"SGP30: measurement started after {time.monotonic() - t0:.1f} s"
+                 f" ({'restored' if self._restored else 'no'} baseline).")
+
+    def _restore(self):
+        if not self.baseline_path:
+            return False
+        try:
+            with open(self.baseline_path, "r") as f:
+                saved = json.load(f)
+            eco2 = int(saved["eco2"])
+            tvoc = int(saved["tvoc"])
+            age = time.time() - float(saved["saved_at"])
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            log.warning(f"SGP30: ignoring unreadable baseline file: {e}")
+            return False
+        if age > self.max_baseline_age_s:
+            log.info(f"SGP30: stored baseline is {age / 86400:.1f} days old, not restoring it.")
+            return False
+        self.sensor.set_baseline(eco2, tvoc)
+        log.info(f"SGP30: restored baseline eCO2=0x{eco2:04x} TVOC=0x{tvoc:04x}.")
+        return True
+
+    def get_air_quality(self):
+        if self._error is not None:
+            raise RuntimeError(f"SGP30 not available: {self._error}")
+        if not self._ready.is_set():
+            raise RuntimeError("SGP30 is warming up")
+        with self._lock:
+            return self.sensor.get_air_quality()
+
+    def save_baseline(self):
+        """Write the current baseline to disk if it is trustworthy yet."""
+        if not self.baseline_path or not self._ready.is_set():
+            return
+        if not self._restored and time.monotonic() - self._started < self.first_save_after_s:
+            return
+        try:
+            with self._lock:
+                baseline = self.sensor.get_baseline()
+            data = {
+                "eco2": int(baseline.equivalent_co2),
+                "tvoc": int(baseline.total_voc),
+                "saved_at": time.time(),
+            }
+            tmp = self.baseline_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.baseline_path)
+            log.debug(f"SGP30: saved baseline {data}.")
+        except Exception as e:
+            log.warning(f"SGP30: saving baseline failed: {e}")
+
+    def schedule(self, scheduler):
+        if self.baseline_path and self.save_interval_s > 0:
+            scheduler.every(self.save_interval_s, self.save_baseline, name="sgp30-baseline",
+                            start_delay=self.save_interval_s)
+
+    def close(self):
+        self.save_baseline()
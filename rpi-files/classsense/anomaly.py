@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming anomaly detection.
+
+Every reading of a watched metric is compared with an exponentially
+weighted mean and variance (EWMA / EWMVar) of the readings before it:
+
+- z-score: |x - mean| / std above `z` fires at once (a noise spike);
+- CUSUM: the standardized deviations beyond a slack of `k` are summed
+  and fire once the sum exceeds `h` (a steady rise, such as CO2 building
+  up faster than usual, that no single reading gives away).
+
+Each detector is a handful of floats, so the cost per reading and the
+memory are constant. A detector stays quiet for its first `warmup`
+readings, whose plain mean and variance seed the EWMA / EWMVar, and for
+`cooldown_s` after it fired (the CUSUM starts over after both).
+`min_std` keeps a flat signal (quantized or idle sensors) from turning a
+tiny step into a huge z-score.
+
+Rules are set per sensors key in `[anomaly]`, e.g.
+
+    eco2_ppm = z 4, h 8, min_std 20
+    noise_db = z 3.5, dir both
+"""
+
+import math
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+
+log = logging.getLogger("ClassSense.anomaly")
+
+DIRECTIONS = ("up", "down", "both")
+
+
+class Detector:
+    def __init__(self, metric, alpha=0.05, z=4.0, k=0.5, h=8.0, min_std=0.0,
+                 direction="up", warmup=30, cooldown_s=300.0):
+        if not 0.0 < alpha < 1.0:
+            raise ValueError(f"[anomaly] {metric}: alpha must be in (0, 1), got {alpha}")
+        if direction not in DIRECTIONS:
+            raise ValueError(f"[anomaly] {metric}: dir must be one of {', '.join(DIRECTIONS)}")
+        self.metric = metric
+        self.alpha = alpha
+        self.z = z
+        self.k = k
+        self.h = h
+        self.min_std = min_std
+        self.direction = direction
+        # Two readings at least, for a variance to compare with
+        self.warmup = max(2, int(warmup))
+        self.cooldown_s = cooldown_s
+        self.mean = None
+        self.var = 0.0
+        self.n = 0
+        self._m2 = 0.0
+        self.cusum_up = 0.0
+        self.cusum_down = 0.0
+        self._quiet_until = 0.0
+
+    def _watch(self, sign):
+        return self.direction == "both" or (self.direction == "up") == (sign > 0)
+
+    def update(self, x, now):
+        """
+        Feed one reading; returns (detector, score, baseline) when it is
+        anomalous, else None.
+        """
+        self.n += 1
+        if self.n <= self.warmup:
+            # The warm-up readings seed the mean and variance (Welford)
+            if self.mean is None:
+                self.mean = x
+                return None
+            delta = x - self.mean
+            self.mean += delta / self.n
+            self._m2 += delta * (x - self.mean)
+            self.var = self._m2 / (self.n - 1)
+            return None
+
+        std = max(math.sqrt(self.var), self.min_std, 1e-9)
+        score = (x - self.mean) / std
+        baseline = self.mean
+
+        # EWMA / EWMVar, including this reading
+        delta = x - self.mean
+        self.mean += self.alpha * delta
+        self.var = (1.0 - self.alpha) * (self.var + self.alpha * delta * delta)
+
+        if now < self._quiet_until:
+            return None
+        self.cusum_up = max(0.0, self.cusum_up + score - self.k)
+        self.cusum_down = max(0.0, self.cusum_down - score - self.k)
+        hit = None
+        if abs(score) > self.z and self._watch(score):
+            hit = ("zscore", score)
+        elif self.cusum_up > self.h and self._watch(1):
+            hit = ("cusum", self.cusum_up)
+        elif self.cusum_down > self.h and self._watch(-1):
+            hit = ("cusum", -self.cusum_down)
+        if hit is None:
+            return None
+        self.cusum_up = self.cusum_down = 0.0
+        self._quiet_until = now + self.cooldown_s
+        return hit[0], hit[1], baseline
+
+
+def parse_detector(metric, text, **defaults):
+    """Detector from "z 4, k 0.5, h 8, min_std 20, dir up, alpha 0.05"."""
+    names = {"z": "z", "k": "k", "h": "h", "min_std": "min_std", "alpha": "alpha", "dir": "direction"}
+    kwargs = dict(defaults)
+    for part in text.split(","):
+        words = part.split()
+        if not words:
+            continue
+        if len(words) != 2 or words[0] not in names:
+            raise ValueError(f"[anomaly] {metric}: expected one of {', '.join(names)} and a value, "
+                             f"got {part.strip()!r}")
+        name, value = names[words[0]], words[1]
+        kwargs[name] = value if name == "direction" else float(value)
+    return Detector(metric, **kwargs)
+
+
+class AnomalyDetector:
+    """
+    Runs one `Detector` per metric over channel readings and calls
+    `on_event(event)` for every anomaly, on the thread that fed the reading.
+
+    `metrics` maps a metric name to (channel name, extract), like
+    `WindowAggregator`.
+    """
+
+    SETTINGS = ("alpha", "z", "k", "h", "warmup", "cooldown_seconds", "lcd_seconds")
+
+    def __init__(self, metrics, detectors, on_event=None, lcd_s=60.0):
+        self.detectors = {d.metric: d for d in detectors}
+        self._by_channel = {}
+        for metric, (channel, extract) in metrics.items():
+            if metric in self.detectors:
+                self._by_channel.setdefault(channel, []).append((metric, extract))
+        self.on_event = on_event
+        self.lcd_s = lcd_s
+        self.fired = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg, metrics, on_event=None):
+        """Returns None when [anomaly] watches no metric (disabled)."""
+        if not cfg.has_section("anomaly"):
+            return None
+        defaults = {
+            "alpha": cfg.getfloat("anomaly", "alpha", fallback=0.05),
+            "z": cfg.getfloat("anomaly", "z", fallback=4.0),
+            "k": cfg.getfloat("anomaly", "k", fallback=0.5),
+            "h": cfg.getfloat("anomaly", "h", fallback=8.0),
+            "warmup": cfg.getint("anomaly", "warmup", fallback=30),
+            "cooldown_s": cfg.getfloat("anomaly", "cooldown_seconds", fallback=300),
+        }
+        detectors = []
+        for key in cfg.options("anomaly"):
+            if key in cls.SETTINGS:
+                continue
+            if key not in metrics:
+                log.warning(f"[anomaly] {key}: no such metric, ignored.")
+                continue
+            detectors.append(parse_detector(key, cfg.get("anomaly", key), **defaults))
+        if not detectors:
+            return None
+        return cls(metrics, detectors, on_event=on_event,
+                   lcd_s=cfg.getfloat("anomaly", "lcd_seconds", fallback=60))
+
+    def add(self, channel, value):
+        """Feed one channel reading (e.g. as `SamplingEngine.on_sample`)."""
+        targets = self._by_channel.get(channel)
+        if not targets:
+            return
+        now = time.monotonic()
+        events = []
+        with self._lock:
+            for metric, extract in targets:
+                try:
+                    x = value if extract is None else extract(value)
+                except Exception:
+                    continue
+                if x is None or (isinstance(x, float) and math.isnan(x)):
+                    continue
+                hit = self.detectors[metric].update(float(x), now)
+                if hit is None:
+                    continue
+                kind, score, baseline = hit
+                self.fired += 1
+                events.append({
+                    "type": "anomaly",
+                    "timestamp": datetime.now(timezone.utc).isoformat(),
+                    "metric": metric,
+                    "value": round(float(x), 2),
+                    "baseline": round(baseline, 2),
+                    "detector": kind,
+                    "score": round(score, 2),
+                    "direction": "up" if score > 0 else "down",
+                })
+        for event in events:
+            log.warning(
+                f"Anomaly on {event['metric']}: {event['value']} vs {event['baseline']} "
+                f"({event['detector']} {event['score']:+.1f})"
+            )
+            if self.on_event is not None:
+                self.on_event(event)
@@ -0,0 +1,591 @@
+# -*- coding: utf-8 -*-
+"""
+The sampling client shared by `sensor_client.py` and `sensor_client_voc.py`.
+
+Both clients run the same loop: open the sensor drivers, read every one on
+its own schedule (classsense/sampling.py), publish the latest values to the
+LCD and the server. They only differ in which drivers they use by default,
+the drivers' options and the LCD layout, which they pass to `run()`.
+"""
+
+import time
+import signal
+import socket
+import logging
+import threading
+from configparser import ConfigParser
+
+# Sensor libraries, numpy, PIL, sounddevice and requests are imported lazily
+# by the init steps, which run in parallel (see classsense/startup.py)
+from classsense import drivers as sensor_drivers
+from classsense.adaptive import AdaptiveRate
+from classsense.aggregate import WindowAggregator
+from classsense.anomaly import AnomalyDetector
+from classsense.deadband import Deadband
+from classsense.filters import FilterBank
+from classsense.metrics import Metrics, MetricsServer
+from classsense.outbox import Outbox
+from classsense.sampling import SamplingEngine, Scheduler
+from classsense.startup import Startup
+from classsense.status import StatusHub, StatusServer
+from classsense.uploader import Uploader
+from classsense.watchdog import SystemdWatchdog, sensors_alive
+
+log = logging.getLogger("ClassSense.client")
+
+shutdown_event = threading.Event()
+
+
+def _handle_sig(signum, frame):
+    shutdown_event.set()
+
+
+# Config
+def load_config(path="config.ini"):
+    cfg = ConfigParser()
+    if not cfg.read(path):
+        raise FileNotFoundError(f"Config file not found: {path}")
+    return cfg
+
+
+# TODO: check - keep this helper commented until class code creation is required.
+def create_class(http, api_base, metadata=None, timeout=5):
+    metadata = metadata or {}
+    api_base = api_base.rstrip("/")
+    url = f"{api_base}/api/classes"
+    r = http.post_json(url, metadata, timeout=timeout)
+    data = r.json()
+    if not isinstance(data, dict) or "pin" not in data:
+        raise RuntimeError("create_class: unexpected response")
+    return str(data["pin"])
+
+
+def save_class_pin_to_config(path, class_pin):
+    """
+    Write the class PIN back into the [server] section of config.ini.
+    """
+    try:
+        cfg = ConfigParser()
+        if not cfg.read(path):
+            log.warning(f"save_class_pin_to_config: could not read {path}")
+            return
+        if not cfg.has_section("server"):
+            cfg.add_section("server")
+        cfg.set("server", "class_pin", str(class_pin))
+        with open(path, "w") as f:
+            cfg.write(f)
+        log.info(f"Saved class_pin {class_pin} to {path}")
+    except Exception as e:
+        log.warning(f"Could not save class_pin to config: {e}")
+
+
+def init_http(cfg):
+    from classsense import wire
+    from classsense.http_session import HttpClient
+
+    if cfg.get("upload", "batch_format", fallback="json").strip() == "msgpack" and not wire.available():
+        log.warning("msgpack not installed, samples are sent as JSON.")
+    return HttpClient.from_config(cfg)
+
+
+def create_drivers(cfg, default_names, options, window_s=None):
+    """
+    The drivers named in `[sampling] drivers` (default: `default_names`),
+    in payload order. `options` maps driver names to their options.
+    """
+    selected = cfg.get("sampling", "drivers", fallback="").strip()
+    names = [n.strip() for n in selected.split(",") if n.strip()] if selected else default_names
+    result = []
+    for name in names:
+        opts = options.get(name)
+        if opts is None and name.startswith("sim_"):
+            # Simulated drivers take the options of their real twin
+            opts = options.get(name[len("sim_"):])
+        drv = sensor_drivers.create(name, cfg, window_s=window_s, **(opts or {}))
+        for other in result:
+            if other.channel == drv.channel:
+                raise ValueError(f"Sensor drivers {other.name!r} and {name!r} both provide {drv.channel!r}")
+        result.append(drv)
+    return result
+
+
+class Probe:
+    """
+    Receives timings from the loop (benchmarks, instrumentation); this one
+    ignores them.
+    """
+
+    def job(self, name, late_s, seconds):
+        """A scheduled job ran `late_s` after its deadline for `seconds`."""
+
+    def read(self, channel, seconds, ok):
+        """A sensor read returned (or raised, ok=False) after `seconds`."""
+
+    def upload(self, samples, seconds, ok):
+        """A request with `samples` samples was sent, serialization included."""
+
+    def draw(self, seconds):
+        """The LCD drew a frame."""
+
+    def serialize(self, samples, size, seconds):
+        """A request body of `size` bytes was encoded (and compressed)."""
+
+    def request(self, seconds, status):
+        """One HTTP attempt got `status` (None: no response) after `seconds`."""
+
+
+def init_display(cfg):
+    """A simulated display with `[simulate] display`, else None (the ST7735)."""
+    if not cfg.getboolean("simulate", "display", fallback=False):
+        return None
+    from classsense.simulated import SimulatedDisplay
+    return SimulatedDisplay()
+
+
+def _field(extract, value):
+    if extract is None:
+        return value
+    try:
+        return extract(value)
+    except Exception:
+        # No reading yet (e.g. the default None)
+        return None
+
+
+# Main loop
+def run(app_name, version, drivers, driver_options=None, init_lcd=None,
+        config_path="config.ini", persist_class_pin=False, started=None, probe=None):
+    """
+    `drivers` names the sensor drivers (classsense/drivers.py) read by
+    default, `driver_options` maps driver names to this client's options
+    for them. `init_lcd(cfg, period_s, disp)` returns the LCD. With
+    `persist_class_pin`, an auto-created class PIN is written back to
+    `config_path`. `probe` (a `Probe`) gets the loop's timings.
+    """
+    probe = probe or Probe()
+    signal.signal(signal.SIGINT, _handle_sig)
+    signal.signal(signal.SIGTERM, _handle_sig)
+
+    startup = Startup(started)
+    cfg = startup.phase("config", lambda: load_config(config_path))
+
+    # Optional Prometheus endpoint: timings go to the metrics, then `probe`
+    metrics = Metrics.from_config(cfg, forward=probe)
+    if metrics is not None:
+        probe = metrics
+
+    device_id = cfg.get("device", "id", fallback=socket.gethostname())
+    post_url = cfg.get("server", "url", fallback="")
+    class_pin = cfg.get("server", "class_pin", fallback="").strip()
+    # TODO: check
+    api_base = cfg.get("server", "api_base", fallback="").rstrip("/")
+    auto_create_class = cfg.getboolean("server", "auto_create_class", fallback=False)
+    period_s = cfg.getfloat("sampling", "period_seconds", fallback=10)
+    post_every_n = cfg.getint("sampling", "post_every_n_samples", fallback=1)
+    batch_format = cfg.get("upload", "batch_format", fallback="json").strip()
+    compress = cfg.getboolean("upload", "compress", fallback=True)
+
+    # TODO: check - Newer API layout (api_base + class_pin)
+    if api_base and not post_url:
+        post_url = f"{api_base}/ingest"
+
+    # Readings cover the whole publish period, not a short snapshot. When
+    # aggregating, each read covers just its own interval instead.
+    aggregating = cfg.getfloat("aggregate", "window_seconds", fallback=0) > 0
+    sensors = create_drivers(cfg, drivers, driver_options or {}, window_s=None if aggregating else period_s)
+
+    # Every metric: payload key -> (channel, extract)
+    sources = {
+        key: (drv.channel, extract)
+        for drv in sensors
+        for key, (_, extract) in drv.metrics.items()
+    }
+    # Optional streaming filters ([filters]) on every reading; all consumers
+    # below then see the filtered values
+    filters = FilterBank.from_config(
+        cfg, sources, ignore=[key for cls in sensor_drivers.registered() for key in cls.filter_keys]
+    )
+    if filters is not None:
+        sources = {key: (channel, filters.extract(key, extract)) for key, (channel, extract) in sources.items()}
+
+    # Optional edge aggregation: every reading goes into per-window
+    # statistics and only the summaries are posted
+    aggregator = WindowAggregator.from_config(cfg, sources)
+    # Optional report by exception: post only on change, plus a heartbeat
+    deadband = Deadband.from_config(cfg)
+
+    def init_server():
+        # One keep-alive session for every request to the server
+        http = init_http(cfg)
+        pin = class_pin
+        if api_base and auto_create_class and (persist_class_pin or not pin):
+            if persist_class_pin:
+                # clear old PIN in memory and in the config file
+                pin = ""
+                save_class_pin_to_config(config_path, "")
+            try:
+                metadata = {"device_id": device_id}
+                pin = create_class(http, api_base, metadata=metadata)
+                log.info(f"Created class {pin} via /api/classes.")
+                if persist_class_pin:
+                    # Write the new PIN back into config.ini
+                    save_class_pin_to_config(config_path, pin)
+            except Exception as e:
+                log.error(f"Auto class creation failed: {e}")
+        return http, pin
+
+    def init_history():
+        from classsense.history import HistoryStore
+        return HistoryStore.from_config(cfg, [key for drv in sensors for key in drv.metrics])
+
+    # Network, sensors, LCD and microphone come up concurrently, the
+    # slowest drivers first
+    steps = {"HTTP client": init_server}
+    for drv in sorted(sensors, key=lambda d: d.init_cost_s, reverse=True):
+        steps[drv.label] = drv.open
+    if init_lcd is not None:
+        steps["LCD"] = lambda: init_lcd(cfg, period_s, init_display(cfg))
+    if cfg.get("history", "path", fallback="").strip():
+        steps["History"] = init_history
+    ready = startup.run_parallel(steps)
+    if ready["HTTP client"] is None:
+        raise RuntimeError("HTTP client not available")
+    http, class_pin = ready["HTTP client"]
+    http.on_serialize = probe.serialize
+    http.on_request = probe.request
+    lcd = ready.get("LCD")
+    if lcd:
+        lcd.on_draw = probe.draw
+
+    # Optional on-disk history of every metric (classsense/history.py),
+    # which also feeds the trend screen
+    history = ready.get("History")
+    if history is not None and lcd:
+        lcd.follow_history(history, {
+            field: key
+            for drv in sensors
+            for key, (field, _) in drv.metrics.items()
+        })
+
+    ingest_headers = {}
+    events_url = f"{post_url}/events" if post_url else ""
+    if class_pin:
+        ingest_headers["X-Class-Pin"] = class_pin
+        if api_base:
+            post_url = f"{api_base}/api/classes/{class_pin}/ingest"
+            events_url = f"{api_base}/api/classes/{class_pin}/events"
+
+    # Failed or hung reads mark a channel stale and reinitialise its driver
+    recovery = {
+        "max_failures": cfg.getint("sampling", "max_failures", fallback=3),
+        "backoff_s": cfg.getfloat("sampling", "reinit_backoff_seconds", fallback=5.0),
+    }
+
+    channels = [drv.sensor_channel(**recovery) for drv in sensors]
+
+    # Optional adaptive mode: faster reads and publishing while metrics
+    # change, slow floor rates while the room is stable
+    adaptive = AdaptiveRate.from_config(
+        cfg, sources,
+        rates={ch.name: ch.rate_hz for ch in channels},
+        max_rates={drv.channel: drv.native_rate_hz for drv in sensors},
+        period_s=period_s,
+    )
+    # Optional anomaly detection on every reading ([anomaly])
+    anomalies = AnomalyDetector.from_config(cfg, sources)
+
+    # Every sensor is read in its own worker at its own rate; the latest
+    # value of each one is published every period_s.
+    def on_sample(channel, value):
+        if filters is not None:
+            filters.add(channel, value)
+        if aggregator is not None:
+            aggregator.add(channel, value)
+        if adaptive is not None:
+            adaptive.add(channel, value)
+        if anomalies is not None:
+            anomalies.add(channel, value)
+
+    engine = SamplingEngine(
+        channels,
+        on_sample=on_sample if filters or aggregator or adaptive or anomalies else None,
+        on_read=probe.read,
+    )
+
+    def post(batch):
+        if post_every_n > 1 or len(batch) > 1 or batch_format == "msgpack":
+            # Batch mode or outbox replay: several samples in one request;
+            # msgpack samples always go to the batch endpoint
+            http.post_batch(
+                f"{post_url}/batch",
+                batch,
+                fmt=batch_format,
+                compress=compress,
+                extra_headers=ingest_headers,
+            )
+        else:
+            http.post_json(post_url, batch[0], extra_headers=ingest_headers)
+
+    def send(batch):
+        t0 = time.monotonic()
+        try:
+            post(batch)
+        except Exception:
+            probe.upload(len(batch), time.monotonic() - t0, False)
+            raise
+        probe.upload(len(batch), time.monotonic() - t0, True)
+        last_upload[0] = batch[-1]["timestamp"]
+        log.info(
+            f"Posted {len(batch)} sample(s) up to {batch[-1]['timestamp']} "
+            f"to server in {http.last_latency_s * 1000:.0f} ms."
+        )
+        startup.milestone("first sample uploaded")
+
+    last_upload = [None]
+
+    # Samples that cannot be uploaded are kept on disk and replayed later
+    outbox = Outbox.from_config(cfg)
+    uploader = Uploader.from_config(cfg, send, batch_size=post_every_n, outbox=outbox)
+    # Stopping the uploader also ends a request's retry backoff
+    http.stop_event = uploader.stop_event
+    uploader.start()
+
+    # Anomalies go out at once, on their own queue, instead of waiting for
+    # the next upload; the LCD shows them as well
+    events = None
+    status = None
+
+    def send_event(batch):
+        for event in batch:
+            http.post_json(events_url, event, extra_headers=ingest_headers)
+        log.info(f"Sent {len(batch)} anomaly event(s) to server.")
+
+    def on_anomaly(event):
+        event["device_id"] = device_id
+        event["class_pin"] = class_pin
+        if lcd:
+            lcd.highlight(lcd_fields[event["metric"]], anomalies.lcd_s)
+        if status is not None:
+            status.event(event)
+        if events is not None and not events.put(event):
+            log.warning("Event queue full, anomaly event dropped.")
+
+    if anomalies is not None:
+        lcd_fields = {key: field for drv in sensors for key, (field, _) in drv.metrics.items()}
+        anomalies.on_event = on_anomaly
+        if events_url:
+            events = Uploader(send_event, max_queue=20, drain_timeout_s=2.0)
+            events.start()
+
+    def collect():
+        # Read on every scrape, never on the hot path
+        yield ("info", "gauge", "Client version.",
+               {"app": app_name, "version": version, "device_id": device_id}, 1)
+        yield ("upload_queue_depth", "gauge", "Samples waiting for upload.", {}, uploader.depth())
+        yield ("upload_queue_capacity", "gauge", "Upload queue size.", {}, uploader.max_queue)
+        yield ("samples_sent_total", "counter", "Samples uploaded.", {}, uploader.sent)
+        yield ("samples_failed_total", "counter", "Samples that failed to upload.", {}, uploader.failed)
+        yield ("samples_dropped_total", "counter", "Samples dropped by a full upload queue.", {},
+               uploader.dropped)
+        yield ("samples_rejected_total", "counter", "Samples the server refused (4xx), dropped.", {},
+               uploader.rejected)
+        if anomalies is not None:
+            yield ("anomalies_total", "counter", "Anomalies detected.", {}, anomalies.fired)
+        if history is not None:
+            yield ("history_rows", "gauge", "Rows in the on-device history.", {}, len(history))
+        if outbox is not None:
+            yield ("outbox_backlog", "gauge", "Samples kept in the outbox.", {}, len(outbox))
+            yield ("outbox_disk_bytes", "gauge", "Outbox size on disk, as counted against the quota.", {},
+                   outbox.disk_bytes())
+        if deadband is not None:
+            yield ("samples_suppressed_total", "counter", "Samples within their deadband, not posted.",
+                   {}, deadband.suppressed_total)
+        yield ("http_circuit_open", "gauge", "1 while the circuit breaker holds requests back.", {},
+               http.breaker.state != "closed")
+        for name, h in engine.health().items():
+            labels = {"channel": name}
+            yield ("channel_reads_total", "counter", "Scheduled sensor reads.", labels, h["reads"])
+            yield ("channel_failures_total", "counter", "Sensor reads that failed.", labels, h["failures"])
+            yield ("channel_timeouts_total", "counter", "Sensor reads that missed their deadline.",
+                   labels, h["timeouts"])
+            yield ("channel_reinits_total", "counter", "Sensor driver reinitialisations.", labels,
+                   h["reinits"])
+            yield ("channel_stale", "gauge", "1 while a sensor's value is not reported.", labels,
+                   h["stale"])
+        if adaptive is not None:
+            yield ("publish_period_seconds", "gauge", "Current publish period.", {}, adaptive.period_s)
+            yield ("activity", "gauge", "1 while a metric's activity keeps the fast rates.", {},
+                   adaptive.active)
+        for ch in engine.channels:
+            yield ("channel_rate_hz", "gauge", "Current sensor read rate.", {"channel": ch.name}, ch.rate_hz)
+        for drv in sensors:
+            for name, value in drv.counters().items():
+                yield (f"{name}_total", "counter", name.replace("_", " ").capitalize() + ".",
+                       {"channel": drv.channel}, value)
+
+    metrics_server = None
+    if metrics is not None:
+        metrics.collector(collect)
+        metrics_server = MetricsServer.from_config(cfg, metrics)
+        try:
+            metrics_server.start()
+        except OSError as e:
+            log.error(f"Metrics endpoint not available: {e}")
+            metrics_server = None
+
+    def sensor_fields(values):
+        fields = {}
+        for drv in sensors:
+            value = values[drv.channel]
+            for key in drv.metrics:
+                fields[key] = _field(sources[key][1], value)
+            fields.update(drv.extra_fields(value))
+        return fields
+
+    def build_payload(snapshot, stats=None):
+        # Prepare JSON
+        payload = {
+            "device_id": device_id,
+            "timestamp": snapshot["timestamp"],
+            "class_pin": class_pin,
+            "sensors": sensor_fields(snapshot["values"]),
+            "meta": {
+                "app": app_name,
+                "version": version,
+            },
+        }
+
+        if stats is not None:
+            # Window means instead of the last readings, plus the summaries
+            for key, summary in stats["metrics"].items():
+                payload["sensors"][key] = summary["mean"] if summary else None
+            payload["stats"] = stats
+        return payload
+
+    def status_snapshot():
+        snapshot = engine.snapshot()
+        return {
+            "device_id": device_id,
+            "class_pin": class_pin,
+            "timestamp": snapshot["timestamp"],
+            "sensors": sensor_fields(snapshot["values"]),
+            "stale": sorted(name for name, h in engine.health().items() if h["stale"]),
+            "uplink": {
+                "online": bool(post_url) and http.breaker.state == "closed",
+                "backlog": uploader.depth() + (len(outbox) if outbox is not None else 0),
+                "last_upload": last_upload[0],
+            },
+        }
+
+    # Optional local endpoint for the kiosk ([status]): readings from
+    # memory, history and anomaly events pushed as server-sent events
+    status_server = None
+    if StatusServer.enabled(cfg):
+        status = StatusHub(
+            status_snapshot,
+            history=history,
+            max_events=cfg.getint("status", "events", fallback=20),
+        )
+        status_server = StatusServer.from_config(cfg, status)
+        try:
+            status_server.start()
+        except OSError as e:
+            log.error(f"Status endpoint not available: {e}")
+            status_server.close()
+            status_server = None
+            status = None
+
+    def queue(payload):
+        if deadband is not None:
+            if not deadband.check(payload["sensors"]):
+                return
+            # Lets the server tell a quiet room from an offline device
+            payload["meta"]["heartbeat_s"] = deadband.heartbeat_s
+        # Hand over to the uploader thread, never wait on the network here
+        if post_url:
+            if not uploader.put(payload):
+                log.warning("Upload queue full, sample dropped.")
+
+    def publish():
+        snapshot = engine.snapshot()
+
+        # LCD update (drawn on the LCD thread)
+        if lcd:
+            values = snapshot["values"]
+            lcd.update({
+                field: _field(sources[key][1], values[drv.channel])
+                for drv in sensors
+                for key, (field, _) in drv.metrics.items()
+            })
+
+        if aggregator is None:
+            queue(build_payload(snapshot))
+        last_publish[0] = time.monotonic()
+
+    def record_history():
+        values = engine.snapshot()["values"]
+        history.append({
+            key: _field(extract, values[channel])
+            for key, (channel, extract) in sources.items()
+        })
+
+    def publish_summary():
+        queue(build_payload(engine.snapshot(), aggregator.flush()))
+
+    # Fed only while publish() keeps running and some sensor still reads
+    last_publish = [time.monotonic()]
+    longest_period_s = adaptive.slow_period_s if adaptive else period_s
+
+    def alive():
+        limit_s = 3 * max([longest_period_s] + [ch.interval_s for ch in engine.channels]) + engine.max_deadline()
+        return (time.monotonic() - last_publish[0] < limit_s
+                and sensors_alive(engine.health(), limit_s))
+
+    watchdog = SystemdWatchdog(check=alive)
+
+    scheduler = Scheduler(shutdown_event, on_job=probe.job)
+    engine.schedule(scheduler)
+    watchdog.schedule(scheduler)
+    for drv in sensors:
+        drv.schedule(scheduler)
+    # Give the first reads time to complete before the first publish
+    scheduler.every(period_s, publish, name="publish", start_delay=engine.max_deadline())
+    if history is not None:
+        scheduler.every(1.0 / history.rate_hz, record_history, name="history",
+                        start_delay=engine.max_deadline())
+    if adaptive:
+        # Readings that cover the publish period follow it
+        def on_period(period_s):
+            for drv in sensors:
+                drv.set_period(period_s)
+
+        adaptive.schedule(scheduler, engine, on_period=on_period)
+    if status is not None:
+        scheduler.every(cfg.getfloat("status", "push_seconds", fallback=1.0), status.tick, name="status",
+                        start_delay=engine.max_deadline())
+    if aggregator:
+        scheduler.every(aggregator.window_s, publish_summary, name="summary",
+                        start_delay=aggregator.window_s)
+    startup.report()
+    watchdog.ready()
+    scheduler.run()
+
+    watchdog.stopping()
+    engine.close()
+    for drv in sensors:
+        try:
+            drv.close()
+        except Exception as e:
+            log.warning(f"{drv.label}: close failed: {e}")
+    if lcd:
+        lcd.close()
+    uploader.stop()
+    if events is not None:
+        events.stop()
+    if history is not None:
+        history.close()
+    if metrics_server is not None:
+        metrics_server.close()
+    if status_server is not None:
+        status_server.close()
+    http.close()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Report by exception.
+
+A sample is only posted when at least one metric moved past its deadband
+since the last *posted* sample (comparing with the last posted value, not
+the previous reading, so slow drifts are reported too), or when the
+heartbeat interval has passed. Between posts the server's `last_sensor`
+therefore never differs from the room by more than one deadband, and the
+heartbeat shows that the device is still alive.
+
+Each deadband is an absolute change, a relative change or both; the larger
+of the two applies, so the absolute band covers values near zero.
+"""
+
+import math
+import time
+import logging
+import threading
+
+log = logging.getLogger("ClassSense.deadband")
+
+
+def parse_band(text):
+    """ "25, 5%" -> (25.0, 0.05); either part may be omitted."""
+    absolute = 0.0
+    relative = 0.0
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if part.endswith("%"):
+            relative = float(part[:-1]) / 100.0
+        else:
+            absolute = float(part)
+    return absolute, relative
+
+
+def _missing(x):
+    return x is None or (isinstance(x, float) and math.isnan(x))
+
+
+class Deadband:
+    def __init__(self, bands, heartbeat_s=300.0):
+        """`bands` maps a sensors key to (absolute, relative)."""
+        self.bands = dict(bands)
+        self.heartbeat_s = heartbeat_s
+        self._sent = None
+        self._sent_at = None
+        self._lock = threading.Lock()
+        self.suppressed = 0
+        self.suppressed_total = 0
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Returns None when [deadband] heartbeat_seconds is 0 (disabled)."""
+        heartbeat_s = cfg.getfloat("deadband", "heartbeat_seconds", fallback=0)
+        if heartbeat_s <= 0:
+            return None
+        bands = {}
+        for key in cfg.options("deadband"):
+            if key == "heartbeat_seconds":
+                continue
+            bands[key] = parse_band(cfg.get("deadband", key, raw=True))
+        return cls(bands, heartbeat_s=heartbeat_s)
+
+    def _changed(self, key, value, ref):
+        if _missing(value) or _missing(ref):
+            return _missing(value) != _missing(ref)
+        absolute, relative = self.bands[key]
+        return abs(value - ref) > max(absolute, relative * abs(ref))
+
+    def check(self, sensors):
+        """
+        True if `sensors` ({key: value}) should be posted; it then becomes
+        the reference for the following samples.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._sent is None or now - self._sent_at >= self.heartbeat_s:
+                reason = "first" if self._sent is None else "heartbeat"
+            else:
+                reason = next(
+                    (k for k in self.bands
+                     if self._changed(k, sensors.get(k), self._sent.get(k))),
+                    None,
+                )
+            if reason is None:
+                self.suppressed += 1
+                self.suppressed_total += 1
+                return False
+            log.debug(f"Posting sample ({reason}), {self.suppressed} suppressed before.")
+            self._sent = {k: sensors.get(k) for k in self.bands}
+            self._sent_at = now
+            self.suppressed = 0
+            return True
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental renderer for the ST7735 LCD.
+
+- Static labels and units are drawn once into a cached framebuffer.
+- Every glyph is rendered with the TrueType font once and cached; value
+  strings are composed by pasting cached glyphs.
+- Only value fields whose text changed are redrawn, and only their
+  rectangles are sent over SPI.
+- Drawing runs on its own thread. `update()` only stores the newest values,
+  so frames that arrive while one is being drawn are coalesced.
+- With trend metrics, the screen rotates between the numeric view and a
+  sparkline view (see `trend.py`) every `rotate_s` seconds.
+- `highlight()` shows the numbers at once and draws a field's value in the
+  alert colour for a while (e.g. on an anomaly).
+"""
+
+import sys
+import math
+import time
+import logging
+import threading
+
+try:
+    from ST7735 import ST7735
+except Exception:
+    ST7735 = None
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except Exception:
+    Image = None
+    ImageDraw = None
+    ImageFont = None
+
+from classsense.trend import TrendView
+
+log = logging.getLogger("ClassSense.display")
+
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+TEXT_COLOR = (200, 200, 200)
+ALERT_COLOR = (255, 60, 60)
+BACKGROUND = (0, 0, 0)
+SPI_CHUNK = 4096
+
+
+class Field:
+    """
+    One line on the screen: `label value unit`.
+    `fmt` formats the value; None shows "n/a" and nan shows "nan".
+    """
+
+    def __init__(self, key, label, unit="", fmt="{:5.1f}", width=5):
+        self.key = key
+        self.label = label
+        self.unit = unit
+        self.fmt = fmt
+        self.width = width
+
+    def text(self, value):
+        if value is None:
+            return "n/a"
+        if isinstance(value, float) and math.isnan(value):
+            return "nan"
+        return self.fmt.format(value).strip()
+
+
+class LCD:
+    """
+    Dirty-region LCD that shows one `Field` per line.
+
+    `disp` replaces the Enviro+ ST7735 (e.g. a `SimulatedDisplay`).
+    """
+
+    def __init__(self, fields, font_size=18, line_gap=18, x=4, y=4,
+                 rotation=90, backlight=12, min_interval_s=0.1,
+                 trend_metrics=None, trend_minutes=30, period_s=10, rotate_s=10,
+                 disp=None):
+        if Image is None or (ST7735 is None and disp is None):
+            raise RuntimeError("LCD / PIL libraries not available")
+        self.disp = disp or ST7735(
+            port=0,
+            cs=1,
+            rst=27,
+            dc=9,
+            backlight=backlight,
+            rotation=rotation,
+            spi_speed_hz=4000000,
+        )
+        self.disp.begin()
+        self.WIDTH = self.disp.width
+        self.HEIGHT = self.disp.height
+        self.rotation = rotation
+        self.min_interval_s = min_interval_s
+        try:
+            self.font = ImageFont.truetype(FONT_PATH, font_size)
+        except Exception:
+            self.font = ImageFont.load_default()
+
+        self.fields = list(fields)
+        self._glyphs = {}
+        ascent, descent = self.font.getmetrics()
+        self._line_h = min(line_gap, ascent + descent)
+        self._to_data = self._image_to_data()
+        self._partial = self._to_data is not None and all(
+            hasattr(self.disp, name) for name in ("set_window", "data")
+        )
+        if self._partial:
+            log.info("LCD: sending only the changed fields.")
+        else:
+            log.info("LCD: driver cannot write a window, sending whole frames.")
+
+        # Static layout: labels and units are drawn once
+        self.frame = Image.new("RGB", (self.WIDTH, self.HEIGHT), BACKGROUND)
+        draw = ImageDraw.Draw(self.frame)
+        label_w = max(self._text_width(f.label + " ") for f in self.fields)
+        digit_w = self._text_width("0")
+        self._boxes = {}
+        for i, f in enumerate(self.fields):
+            top = y + i * line_gap
+            value_x = x + label_w
+            value_w = digit_w * f.width
+            draw.text((x, top), f.label, font=self.font, fill=TEXT_COLOR)
+            if f.unit:
+                draw.text((value_x + value_w + digit_w // 2, top), f.unit,
+                          font=self.font, fill=TEXT_COLOR)
+            box = (value_x, top, min(self.WIDTH, value_x + value_w), min(self.HEIGHT, top + self._line_h))
+            self._boxes[f.key] = box
+
+        self.trend = None
+        if trend_metrics and rotate_s > 0:
+            try:
+                small = ImageFont.truetype(FONT_PATH, max(8, self.HEIGHT // len(trend_metrics) - 6))
+            except Exception:
+                small = ImageFont.load_default()
+            try:
+                self.trend = TrendView(
+                    self.WIDTH, self.HEIGHT, trend_metrics, small,
+                    minutes=trend_minutes, period_s=period_s,
+                )
+            except Exception as e:
+                log.warning(f"Trend view disabled: {e}")
+        self.rotate_s = rotate_s
+        self._screen = "values"
+        self._next_switch = time.monotonic() + rotate_s
+        self._trend_lock = threading.Lock()
+
+        self._shown = {}
+        self._values = {}
+        self._pending = None
+        self._full_refresh = True
+        self._cond = threading.Condition()
+        self._stopping = False
+        # Called with the duration of every frame drawn (instrumentation)
+        self.on_draw = None
+        # field key -> monotonic time its highlight ends
+        self._alerts = {}
+        self._show_values = False
+        self._thread = threading.Thread(target=self._run, name="lcd", daemon=True)
+        self._thread.start()
+
+    def _image_to_data(self):
+        """
+        The driver's RGB565 packer: a method of the display, or a function
+        of the driver's module (as in the st7735 package); None if neither.
+        """
+        to_data = getattr(self.disp, "image_to_data", None)
+        if to_data is None:
+            module = sys.modules.get(type(self.disp).__module__)
+            to_data = getattr(module, "image_to_data", None)
+        return to_data
+
+    def _text_width(self, text):
+        if hasattr(self.font, "getlength"):
+            return int(math.ceil(self.font.getlength(text)))
+        return self.font.getsize(text)[0]
+
+    def _glyph(self, ch, color=TEXT_COLOR):
+        img = self._glyphs.get((ch, color))
+        if img is None:
+            w = max(1, self._text_width(ch))
+            img = Image.new("RGB", (w, self._line_h), BACKGROUND)
+            ImageDraw.Draw(img).text((0, 0), ch, font=self.font, fill=color)
+            self._glyphs[(ch, color)] = img
+        return img
+
+    def update(self, values):
+        """
+        Queue new values ({field key: value}) for display without blocking.
+        A frame not yet drawn is replaced by the newer one.
+        """
+        if self.trend is not None:
+            with self._trend_lock:
+                self.trend.append(values)
+        with self._cond:
+            self._pending = dict(values)
+            self._cond.notify()
+
+    def highlight(self, key, seconds):
+        """
+        Draw field `key` in the alert colour for `seconds` and switch to
+        the numbers right away.
+        """
+        with self._cond:
+            self._alerts[key] = time.monotonic() + seconds
+            if self._pending is None:
+                self._pending = dict(self._values)
+            self._show_values = True
+            self._cond.notify()
+
+    def follow_history(self, history, columns):
+        """Draw the trend screen from `history` (see `TrendView.follow`)."""
+        if self.trend is not None:
+            with self._trend_lock:
+                self.trend.follow(history, columns)
+
+    def close(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(1.0)
+
+    def _switch_in(self):
+        if self.trend is None:
+            return None
+        return max(0.0, self._next_switch - time.monotonic())
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._stopping and self._switch_in() != 0.0:
+                    self._cond.wait(self._switch_in())
+                if self._stopping:
+                    return
+                if self._pending is not None:
+                    self._values = self._pending
+                    self._pending = None
+                    changed = True
+                else:
+                    changed = False
+                show_values, self._show_values = self._show_values, False
+
+            if show_values:
+                if self._screen != "values":
+                    self._screen = "values"
+                    self._full_refresh = True
+                self._next_switch = time.monotonic() + self.rotate_s
+            elif self._switch_in() == 0.0:
+                self._screen = "trend" if self._screen == "values" else "values"
+                self._next_switch = time.monotonic() + self.rotate_s
+                self._full_refresh = True
+                changed = True
+
+            started = time.monotonic()
+            try:
+                if self._screen == "trend":
+                    self._render_trend()
+                elif changed:
+                    self._render(self._values)
+                else:
+                    started = None
+            except Exception as e:
+                log.debug(f"LCD draw failed: {e}")
+            if started is not None and self.on_draw is not None:
+                self.on_draw(time.monotonic() - started)
+            # Frames arriving meanwhile are coalesced into the next one
+            time.sleep(self.min_interval_s)
+
+    def _render_trend(self):
+        with self._trend_lock:
+            frame = self.trend.render()
+        # The sparklines scroll, so the whole frame is sent
+        self.disp.display(Image.fromarray(frame))
+
+    def _render(self, values):
+        dirty = []
+        now = time.monotonic()
+        with self._cond:
+            alerts = {key for key, until in self._alerts.items() if until > now}
+        for f in self.fields:
+            color = ALERT_COLOR if f.key in alerts else TEXT_COLOR
+            shown = (f.text(values.get(f.key)), color)
+            if not self._full_refresh and self._shown.get(f.key) == shown:
+                continue
+            self._shown[f.key] = shown
+            box = self._boxes[f.key]
+            self.frame.paste(self._render_value(shown[0], box, color), box[:2])
+            dirty.append(box)
+
+        if self._full_refresh or not self._partial:
+            self.disp.display(self.frame)
+            self._full_refresh = False
+            return
+        for box in dirty:
+            self._send_region(box)
+
+    def _render_value(self, text, box, color=TEXT_COLOR):
+        """Right-aligned value composed from cached glyphs."""
+        w, h = box[2] - box[0], box[3] - box[1]
+        img = Image.new("RGB", (w, h), BACKGROUND)
+        glyphs = [self._glyph(ch, color) for ch in text]
+        cursor = w - sum(g.width for g in glyphs)
+        for g in glyphs:
+            if cursor >= 0:
+                img.paste(g, (cursor, 0))
+            cursor += g.width
+        return img
+
+    def _native_rect(self, box):
+        """Map a rectangle in screen coordinates to panel coordinates."""
+        x0, y0, x1, y1 = box[0], box[1], box[2] - 1, box[3] - 1
+        W, H = self.WIDTH, self.HEIGHT
+        k = (self.rotation // 90) % 4
+
+        def native(x, y):
+            if k == 1:
+                return y, W - 1 - x
+            if k == 2:
+                return W - 1 - x, H - 1 - y
+            if k == 3:
+                return H - 1 - y, x
+            return x, y
+
+        xs, ys = zip(native(x0, y0), native(x1, y1))
+        return min(xs), min(ys), max(xs), max(ys)
+
+    def _send_region(self, box):
+        region = self.frame.crop(box)
+        pixelbytes = list(self._to_data(region, self.rotation))
+        self.disp.set_window(*self._native_rect(box))
+        for i in range(0, len(pixelbytes), SPI_CHUNK):
+            self.disp.data(pixelbytes[i:i + SPI_CHUNK])
@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+"""
+Sensor driver registry.
+
+Each sensor the clients can read is a `Driver` subclass registered under a
+short name (`ltr559`, `bme280`, `sgp30`, `noise`, `noise_fft`,
+`noise_enviroplus`). A driver opens its device, reads it, and declares
+how it behaves, which the client uses instead of per-sensor code:
+
+    init_cost_s     typical time of `open()`, library imports included;
+                    slow drivers are started first
+    read_latency_s  typical duration of `read()`; the read deadline is
+                    derived from it
+    native_rate_hz  rate at which the device produces new values; reads
+                    are never scheduled faster than that
+    rate_hz         default read rate, `[sampling] rate_<channel>_hz`
+
+and which payload fields its readings produce (`metrics` and
+`extra_fields()`). Adding a sensor means adding a driver here and its name
+to `[sampling] drivers`, not changing the clients. Every driver also has
+a simulated `sim_<name>` twin for running without the hardware.
+"""
+
+import math
+import logging
+import importlib
+
+from classsense import filters
+from classsense.sampling import SensorChannel
+
+log = logging.getLogger("ClassSense.drivers")
+
+# Reads get at least this long before they count as missed
+MIN_DEADLINE_S = 0.5
+
+_registry = {}
+
+
+def register(cls):
+    """Class decorator: make a driver available under `cls.name`."""
+    _registry[cls.name] = cls
+    return cls
+
+
+def names():
+    return sorted(_registry)
+
+
+def registered():
+    return list(_registry.values())
+
+
+def create(name, cfg, **options):
+    if name.startswith("sim_") and name not in _registry:
+        # Registers the sim_<name> twins
+        importlib.import_module("classsense.simulated")
+    try:
+        cls = _registry[name]
+    except KeyError:
+        raise ValueError(f"Unknown sensor driver {name!r} (known: {', '.join(names())})") from None
+    return cls(cfg, **options)
+
+
+def _level(levels, key):
+    return None if levels is None else levels.get(key)
+
+
+class Driver:
+    """
+    Base class. `read()` returns the channel value and raises when the
+    device cannot be read; `open()` may raise too, the channel then fails
+    until a reinit succeeds.
+    """
+
+    name = None
+    channel = None
+    label = None
+    init_cost_s = 0.1
+    read_latency_s = 0.01
+    native_rate_hz = 1.0
+    rate_hz = 1.0
+    default = float("nan")
+    # payload key -> (LCD field key, value -> number or None for the value)
+    metrics = {}
+    # [filters] keys the driver reads itself
+    filter_keys = ()
+
+    def __init__(self, cfg, **options):
+        """
+        `options` are the client's defaults for this driver; all drivers
+        also get `window_s`, the time one reading should cover (the publish
+        period), or None when every reading is used (aggregation).
+        """
+        self.cfg = cfg
+
+    def open(self):
+        raise NotImplementedError
+
+    def read(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def reinit(self):
+        self.close()
+        self.open()
+
+    def schedule(self, scheduler):
+        """Register periodic housekeeping jobs, if any."""
+
+    def set_period(self, period_s):
+        """The publish period changed (adaptive rate); `window_s` follows it."""
+
+    def extra_fields(self, value):
+        """Payload fields besides `metrics` (not aggregated or displayed)."""
+        return {}
+
+    def counters(self):
+        """Driver-specific running totals for the metrics endpoint ({name: value})."""
+        return {}
+
+    @property
+    def deadline_s(self):
+        return max(MIN_DEADLINE_S, 2.0 * self.read_latency_s)
+
+    def read_rate_hz(self):
+        rate = self.cfg.getfloat("sampling", f"rate_{self.channel}_hz", fallback=self.rate_hz)
+        if rate > self.native_rate_hz:
+            log.info(f"{self.label}: produces new values at {self.native_rate_hz:g} Hz,"
+                     f" reading at that rate instead of {rate:g} Hz.")
+            rate = self.native_rate_hz
+        return rate
+
+    def sensor_channel(self, **recovery):
+        """The SamplingEngine channel for this driver."""
+        return SensorChannel(
+            self.channel,
+            self.read,
+            deadline_s=self.deadline_s,
+            default=self.default,
+            rate_hz=self.read_rate_hz(),
+            reinit=self.reinit,
+            **recovery,
+        )
+
+
+@register
+class LTR559Driver(Driver):
+    name = "ltr559"
+    channel = "lux"
+    label = "LTR559"
+    init_cost_s = 0.2
+    # One ALS integration (100 ms default) plus the I2C transfer
+    read_latency_s = 0.11
+    native_rate_hz = 2.0
+    rate_hz = 0.2
+    metrics = {"brightness_lux": ("lux", None)}
+
+    def __init__(self, cfg, **options):
+        super().__init__(cfg)
+        self.device = None
+
+    def open(self):
+        from ltr559 import LTR559
+        self.device = LTR559()
+
+    def read(self):
+        if self.device is None:
+            raise RuntimeError("LTR559 not available")
+        return float(self.device.get_lux())
+
+
+def get_cpu_temperature():
+    """
+    Read the CPU temperature in degrees Celsius for compensation.
+    """
+    with open("/sys/class/thermal/thermal_zone0/temp", "r") as f:
+        temp = f.read()
+        temp = int(temp) / 1000.0
+    return temp
+
+
+@register
+class BME280Driver(Driver):
+    """
+    BME280 temperature, compensated for the heat of the CPU below it.
+
+    `cpu_factor` is the tuning factor for compensation: decrease it to
+    adjust the temperature down, increase it to adjust up. Hotter CPUs
+    (Pi 4 / Pi 5) need a higher value than a Pi Zero. `[sampling]
+    temp_cpu_factor` overrides it. The CPU temperature is smoothed by
+    `[filters] cpu_temperature` (classsense/filters.py, default "mean 5").
+    """
+
+    name = "bme280"
+    channel = "temperature"
+    label = "BME280"
+    init_cost_s = 0.2
+    read_latency_s = 0.02
+    native_rate_hz = 1.0
+    rate_hz = 0.2
+    metrics = {"temperature_c": ("temp", None)}
+    filter_keys = ("cpu_temperature",)
+
+    def __init__(self, cfg, cpu_factor=1.2, **options):
+        super().__init__(cfg)
+        self.cpu_factor = cfg.getfloat("sampling", "temp_cpu_factor", fallback=cpu_factor)
+        self.cpu_filter = cfg.get("filters", "cpu_temperature", fallback="mean 5", raw=True)
+        # Fails early on a bad spec
+        self._cpu_temps = filters.parse(self.cpu_filter)
+        self.device = None
+
+    def open(self):
+        from bme280 import BME280
+
+        self._cpu_temps = filters.parse(self.cpu_filter)
+        self.device = BME280()
+
+    def read(self):
+        if self.device is None:
+            raise RuntimeError("BME280 not available")
+
+        avg_cpu_temp = self._cpu_temps.update(get_cpu_temperature())
+
+        raw_temp = self.device.get_temperature()
+        comp_temp = raw_temp - ((avg_cpu_temp - raw_temp) / self.cpu_factor)
+        return float(comp_temp)
+
+
+@register
+class SGP30Driver(Driver):
+    """
+    Pimoroni SGP30: (eCO2 ppm, VOC ppb). The baseline is persisted and the
+    warm-up runs in the background (see classsense/airquality.py); with
+    `voc=False` only eCO2 goes into the payload.
+    """
+
+    name = "sgp30"
+    channel = "sgp30"
+    label = "SGP30"
+    init_cost_s = 0.3
+    read_latency_s = 0.02
+    # Its on-chip baseline algorithm expects exactly one read per second
+    native_rate_hz = 1.0
+    rate_hz = 1.0
+    default = (float("nan"), float("nan"))
+
+    def __init__(self, cfg, voc=True, **options):
+        super().__init__(cfg)
+        self.sensor = None
+        self.metrics = {"eco2_ppm": ("eco2", lambda v: v[0])}
+        if voc:
+            self.metrics["voc_ppb"] = ("voc", lambda v: v[1])
+
+    def open(self):
+        from sgp30 import SGP30
+        from classsense.airquality import AirQualitySensor
+
+        self.sensor = AirQualitySensor.from_config(self.cfg, SGP30)
+        log.info("SGP30: sensor warming up in the background...")
+        self.sensor.start()
+
+    def read(self):
+        """
+        get_air_quality() returns an object with .equivalent_co2 and
+        .total_voc (older drivers: .CO2eq or a tuple).
+        """
+        eco2 = float("nan")
+        voc = float("nan")
+        if self.sensor is None:
+            raise RuntimeError("SGP30 not available")
+        if self.sensor.warming_up:
+            # Not a failure, the driver is starting
+            return eco2, voc
+
+        result = self.sensor.get_air_quality()
+
+        # eCO2
+        if hasattr(result, "equivalent_co2"):
+            eco2 = float(result.equivalent_co2)
+        elif hasattr(result, "CO2eq"):
+            eco2 = float(result.CO2eq)
+        elif isinstance(result, (tuple, list)) and len(result) >= 1:
+            eco2 = float(result[0])
+
+        # VOC (ppb)
+        if hasattr(result, "total_voc"):
+            voc = float(result.total_voc)
+        elif isinstance(result, (tuple, list)) and len(result) >= 2:
+            voc = float(result[1])
+
+        return eco2, voc
+
+    def reinit(self):
+        if self.sensor is None:
+            self.open()
+        else:
+            self.sensor.restart()
+
+    def schedule(self, scheduler):
+        if self.sensor is not None:
+            self.sensor.schedule(scheduler)
+
+    def close(self):
+        if self.sensor is not None:
+            self.sensor.close()
+
+
+class _NoiseDriver(Driver):
+    channel = "noise"
+    default = None
+
+    def __init__(self, cfg, window_s=None, **options):
+        """Levels cover `window_s` seconds, or the read interval if None."""
+        super().__init__(cfg)
+        # Only a window sized from the publish period follows its changes
+        self._follows_period = window_s is not None and not cfg.has_option("noise", "window_seconds")
+        self.window_s = cfg.getfloat(
+            "noise", "window_seconds",
+            fallback=window_s if window_s is not None else 1.0 / self.read_rate_hz(),
+        )
+
+
+@register
+class StreamNoiseDriver(_NoiseDriver):
+    """Rolling levels from the continuous sounddevice stream (classsense/noise.py)."""
+
+    name = "noise"
+    label = "Noise meter"
+    init_cost_s = 1.0
+    read_latency_s = 0.01
+    # One new level per 125 ms block
+    native_rate_hz = 8.0
+    rate_hz = 2.0
+    metrics = {"noise_db": ("noise", lambda levels: levels["leq"])}
+
+    def __init__(self, cfg, db_offset=90.0, **options):
+        super().__init__(cfg, **options)
+        self.db_offset = db_offset
+        self.meter = None
+        # Overflows of meters closed by a reinit
+        self._overflows = 0
+
+    def open(self):
+        from classsense.noise import NoiseMeter
+
+        meter = NoiseMeter.from_config(self.cfg, db_offset=self.db_offset)
+        meter.start()
+        self.meter = meter
+
+    def read(self):
+        """
+        Rolling noise levels (pseudo dB) over the last `window_s` seconds.
+        Not calibrated.
+        """
+        if self.meter is None:
+            raise RuntimeError("noise meter not available")
+        return self.meter.levels(self.window_s)
+
+    def set_period(self, period_s):
+        if not self._follows_period or period_s == self.window_s:
+            return
+        history_s = self.cfg.getfloat("noise", "history_seconds", fallback=60)
+        if period_s > history_s:
+            log.info(f"{self.label}: levels cover the last {history_s:g} s of the {period_s:g} s"
+                     f" period ([noise] history_seconds).")
+        self.window_s = period_s
+
+    def extra_fields(self, levels):
+        return {
+            "noise_lmax_db": _level(levels, "lmax"),
+            "noise_lmin_db": _level(levels, "lmin"),
+            "noise_l10_db": _level(levels, "l10"),
+            "noise_l90_db": _level(levels, "l90"),
+        }
+
+    def counters(self):
+        meter = self.meter
+        return {"audio_overflows": self._overflows + (meter.overflows if meter is not None else 0)}
+
+    def close(self):
+        if self.meter is not None:
+            self.meter.stop()
+            self._overflows += self.meter.overflows
+            self.meter = None
+
+
+@register
+class SpectrumNoiseDriver(StreamNoiseDriver):
+    """
+    A-weighted level and octave band levels from the same stream
+    (classsense/spectrum.py). The offset is `[sampling] mic_db_offset`.
+    """
+
+    name = "noise_fft"
+    label = "Noise"
+    init_cost_s = 1.2
+    # FFT of the audio captured since the previous read
+    read_latency_s = 0.05
+    native_rate_hz = 8.0
+    metrics = {"noise_db": ("noise", lambda levels: levels["laeq"])}
+
+    def __init__(self, cfg, db_offset=94.0, **options):
+        super().__init__(cfg, **options)
+        self.db_offset = cfg.getfloat("sampling", "mic_db_offset", fallback=db_offset)
+        self.analyzer = None
+
+    def open(self):
+        from classsense.spectrum import SpectralAnalyzer
+
+        self.analyzer = SpectralAnalyzer.from_config(self.cfg, db_offset=self.db_offset)
+        super().open()
+
+    def read(self):
+        """
+        A-weighted sound level and octave band levels (pseudo dB) over the
+        last `window_s` seconds. Not calibrated.
+
+        Only audio captured since the previous call is transformed; the
+        levels are means over the per-frame results kept by the analyzer.
+        """
+        if self.meter is None:
+            raise RuntimeError("noise meter not available")
+        self.analyzer.update(self.meter)
+        return self.analyzer.levels(self.window_s)
+
+    def extra_fields(self, levels):
+        return {"noise_bands_db": _level(levels, "bands")}
+
+
+@register
+class EnviroplusNoiseDriver(_NoiseDriver):
+    """
+    The enviroplus library's noise helper: each read records a short clip
+    and returns its overall amplitude in pseudo dB. It cannot share the
+    microphone with the other noise drivers.
+    """
+
+    name = "noise_enviroplus"
+    label = "Noise"
+    init_cost_s = 1.0
+    # get_noise_profile() records for `duration` seconds
+    read_latency_s = 0.5
+    native_rate_hz = 2.0
+    rate_hz = 0.5
+    metrics = {"noise_db": ("noise", None)}
+
+    def __init__(self, cfg, db_offset=94.0, **options):
+        super().__init__(cfg, **options)
+        self.db_offset = cfg.getfloat("sampling", "mic_db_offset", fallback=db_offset)
+        self.noise = None
+
+    def open(self):
+        from enviroplus.noise import Noise
+
+        self.noise = Noise(duration=self.read_latency_s)
+
+    def read(self):
+        if self.noise is None:
+            raise RuntimeError("enviroplus noise not available")
+        # (low, mid, high, total) band amplitudes
+        amp_total = self.noise.get_noise_profile()[3]
+        return 20.0 * math.log10(max(amp_total, 1e-12)) + self.db_offset
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming filters for sensor readings.
+
+A filter takes one number per reading and returns the filtered number.
+Filters are chained into pipelines, configured per payload key in
+`[filters]` as a `|`-separated list:
+
+    ema <alpha>           exponential moving average, 0 < alpha <= 1
+    mean <n>              moving average of the last n readings
+    median <n>            median of the last n readings
+    hampel <n> [<k>]      replaces a reading more than k (default 3) scaled
+                          median absolute deviations from the median of the
+                          last n readings with that median
+    kalman <q> <r>        1-D Kalman filter for a slowly drifting level:
+                          process noise q, measurement noise r (variances)
+
+e.g. `eco2_ppm = hampel 7 | ema 0.3`. `ema` and `kalman` cost O(1) per
+reading. Windowed filters keep their last n readings in a preallocated
+ring and a sorted list for the order statistics: a reading costs a binary
+search plus an O(n) list insert and delete (a memmove of at most n
+pointers), and the median and MAD are read off the sorted list in O(1) and
+O(n). The cost never grows with how long the client has been running, and
+n is capped at MAX_WINDOW (a larger n is clamped, with a warning). None and nan readings pass through and leave
+the filter state alone.
+
+`FilterBank` applies the pipelines to every channel reading, at the full
+read rate, before the readings are aggregated, shown or posted.
+"""
+
+import math
+import heapq
+import bisect
+import logging
+import threading
+from itertools import islice
+
+log = logging.getLogger("ClassSense.filters")
+
+# Scales the MAD to the standard deviation of normally distributed data
+MAD_SCALE = 1.4826
+
+# Largest window of the windowed filters (readings); keeps their O(n) small
+MAX_WINDOW = 64
+
+
+def _missing(x):
+    return x is None or (isinstance(x, float) and math.isnan(x))
+
+
+class _Window:
+    """The last `n` readings in a ring, plus the same readings sorted."""
+
+    def __init__(self, n):
+        if n < 1:
+            raise ValueError(f"window must hold at least 1 reading, got {n}")
+        if n > MAX_WINDOW:
+            log.warning(f"Filter window of {n} readings clamped to {MAX_WINDOW}.")
+            n = MAX_WINDOW
+        self.n = n
+        self.ring = [0.0] * n
+        self.sorted = []
+        self.pos = 0
+        self.sum = 0.0
+
+    def push(self, x):
+        if len(self.sorted) == self.n:
+            old = self.ring[self.pos]
+            del self.sorted[bisect.bisect_left(self.sorted, old)]
+            self.sum -= old
+        self.ring[self.pos] = x
+        self.pos = (self.pos + 1) % self.n
+        bisect.insort(self.sorted, x)
+        self.sum += x
+
+    def median(self):
+        s = self.sorted
+        m = len(s) // 2
+        return s[m] if len(s) % 2 else (s[m - 1] + s[m]) / 2.0
+
+    def mad(self, med):
+        """
+        Median absolute deviation from `med`. The deviations below and
+        above `med` are each already sorted, so they are merged, not sorted.
+        """
+        s = self.sorted
+        split = bisect.bisect_left(s, med)
+        below = (med - s[i] for i in range(split - 1, -1, -1))
+        above = (s[i] - med for i in range(split, len(s)))
+        m = len(s) // 2
+        deviations = list(islice(heapq.merge(below, above), m + 1))
+        return deviations[m] if len(s) % 2 else (deviations[m - 1] + deviations[m]) / 2.0
+
+
+class EMA:
+    def __init__(self, alpha):
+        if not 0.0 < alpha <= 1.0:
+            raise ValueError(f"ema alpha must be in (0, 1], got {alpha}")
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, x):
+        if self.value is None:
+            self.value = x
+        else:
+            self.value += self.alpha * (x - self.value)
+        return self.value
+
+
+class MovingMean:
+    def __init__(self, n):
+        self.window = _Window(int(n))
+
+    def update(self, x):
+        self.window.push(x)
+        return self.window.sum / len(self.window.sorted)
+
+
+class MovingMedian:
+    def __init__(self, n):
+        self.window = _Window(int(n))
+
+    def update(self, x):
+        self.window.push(x)
+        return self.window.median()
+
+
+class Hampel:
+    """Outlier rejection against the previous `n` readings."""
+
+    def __init__(self, n, k=3.0):
+        self.window = _Window(int(n))
+        self.k = k
+
+    def update(self, x):
+        w = self.window
+        result = x
+        if len(w.sorted) >= 3:
+            med = w.median()
+            mad = w.mad(med)
+            if abs(x - med) > self.k * MAD_SCALE * mad and mad > 0:
+                result = med
+        # The window keeps the raw readings, so a real step is accepted
+        # once it makes up half of the window
+        w.push(x)
+        return result
+
+
+class Kalman:
+    """Random-walk level: x_k = x_k-1 + w (var q), z_k = x_k + v (var r)."""
+
+    def __init__(self, q, r):
+        if q < 0 or r <= 0:
+            raise ValueError(f"kalman needs q >= 0 and r > 0, got {q}, {r}")
+        self.q = q
+        self.r = r
+        self.x = None
+        self.p = None
+
+    def update(self, z):
+        if self.x is None:
+            self.x, self.p = z, self.r
+            return self.x
+        p = self.p + self.q
+        gain = p / (p + self.r)
+        self.x += gain * (z - self.x)
+        self.p = (1.0 - gain) * p
+        return self.x
+
+
+FILTERS = {
+    "ema": (EMA, 1, 1),
+    "mean": (MovingMean, 1, 1),
+    "median": (MovingMedian, 1, 1),
+    "hampel": (Hampel, 1, 2),
+    "kalman": (Kalman, 2, 2),
+}
+
+
+class Pipeline:
+    """Filters applied in order."""
+
+    def __init__(self, filters, spec=""):
+        self.filters = list(filters)
+        self.spec = spec
+
+    def update(self, x):
+        if _missing(x):
+            return x
+        x = float(x)
+        for f in self.filters:
+            x = f.update(x)
+        return x
+
+
+def parse(spec):
+    """A `Pipeline` from "name args | name args ..."; ValueError if invalid."""
+    filters = []
+    for stage in spec.split("|"):
+        parts = stage.split()
+        if not parts:
+            continue
+        name, args = parts[0].lower(), parts[1:]
+        if name not in FILTERS:
+            raise ValueError(f"Unknown filter {name!r} (known: {', '.join(sorted(FILTERS))})")
+        cls, min_args, max_args = FILTERS[name]
+        if not min_args <= len(args) <= max_args:
+            raise ValueError(f"Filter {name!r} takes {min_args} to {max_args} arguments: {stage.strip()!r}")
+        filters.append(cls(*(float(a) for a in args)))
+    return Pipeline(filters, spec.strip())
+
+
+class FilterBank:
+    """
+    Filters channel readings per metric.
+
+    `metrics` maps a metric name to (channel name, extract), like
+    `WindowAggregator`; `pipelines` maps metric names to a `Pipeline`.
+    `add()` runs the pipelines on a reading, and the functions from
+    `extract()` return the filtered number instead of the raw one.
+    """
+
+    def __init__(self, metrics, pipelines):
+        self.pipelines = dict(pipelines)
+        self._by_channel = {}
+        for metric, (channel, extract) in metrics.items():
+            if metric in self.pipelines:
+                self._by_channel.setdefault(channel, []).append((metric, extract))
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg, metrics, ignore=()):
+        """
+        Pipelines for the metrics listed in [filters]; None without any.
+        Keys in `ignore` are used elsewhere (e.g. by a driver).
+        """
+        if not cfg.has_section("filters"):
+            return None
+        pipelines = {}
+        for key in cfg.options("filters"):
+            spec = cfg.get("filters", key, raw=True).strip()
+            if key in ignore or not spec:
+                continue
+            if key not in metrics:
+                log.warning(f"[filters] {key}: no such metric, ignored.")
+                continue
+            pipelines[key] = parse(spec)
+            log.info(f"Filtering {key}: {pipelines[key].spec}")
+        if not pipelines:
+            return None
+        return cls(metrics, pipelines)
+
+    def add(self, channel, value):
+        """Feed one channel reading (call before anything reads `extract()`)."""
+        targets = self._by_channel.get(channel)
+        if not targets:
+            return
+        with self._lock:
+            for metric, extract in targets:
+                try:
+                    x = value if extract is None else extract(value)
+                except Exception:
+                    # No reading (e.g. the default None)
+                    continue
+                self._latest[metric] = self.pipelines[metric].update(x)
+
+    def extract(self, metric, extract):
+        """
+        An extract function for `metric` that returns the filtered value
+        of the latest reading; missing readings stay missing.
+        """
+        if metric not in self.pipelines:
+            return extract
+
+        def filtered(value):
+            x = value if extract is None else extract(value)
+            if _missing(x):
+                return x
+            with self._lock:
+                return self._latest.get(metric, x)
+
+        return filtered
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+On-device time-series history.
+
+`HistoryStore` keeps a fixed number of rows in preallocated NumPy columns:
+one float64 column of Unix timestamps and one float32 column per metric
+(missing values are nan). The columns form a ring, so `append()` is O(1)
+and the footprint never grows.
+
+With a `path`, the columns live in a memory-mapped file:
+
+    0     magic "CSHIST1\\0", next row (int64), row count (int64)
+    64    JSON {"capacity": ..., "columns": [...]} padded to 4096 bytes
+    4096  timestamps, float64 x capacity
+          one float32 x capacity block per column, in `columns` order
+
+so a restart maps the same file again and the history is back without
+parsing anything. The kernel writes dirty pages back on its own schedule;
+a crash of the process loses nothing, only a power cut can lose the last
+seconds. A file made for other columns or another capacity is moved aside
+to `<path>.old` and a new one is started.
+
+Readers get views into the ring, never copies:
+
+    query(start, end)     [(timestamps, {column: values}), ...], one or
+                          two segments (two when the range wraps)
+    column(name)          all stored values in storage order, for
+                          order-independent statistics
+    sample(name, since, n) n evenly spaced values since `since`, oldest
+                          first (one gather of n elements)
+    sample_rows(since, n) the same for the timestamps and every column
+
+Views (query, column) alias the ring: they are overwritten once `capacity` more rows were
+appended, so copy what has to outlive that.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+log = logging.getLogger("ClassSense.history")
+
+MAGIC = b"CSHIST1\0"
+HEADER_SIZE = 4096
+META_OFFSET = 64
+
+
+class HistoryStore:
+    def __init__(self, columns, capacity=86400, path=None, rate_hz=1.0):
+        """`rate_hz` is the rate rows are meant to be appended at."""
+        if np is None:
+            raise RuntimeError("numpy not available")
+        self.columns = list(columns)
+        self.capacity = max(1, int(capacity))
+        self.path = path
+        self.rate_hz = rate_hz
+        self._lock = threading.Lock()
+        if path:
+            self._map(path)
+        else:
+            self._mm = None
+            self._state = np.zeros(2, dtype=np.int64)
+            self.times = np.full(self.capacity, np.nan, dtype=np.float64)
+            self._values = {c: np.full(self.capacity, np.nan, dtype=np.float32) for c in self.columns}
+
+    @classmethod
+    def from_config(cls, cfg, columns):
+        """Returns None when [history] path is empty (disabled)."""
+        path = cfg.get("history", "path", fallback="").strip()
+        if not path:
+            return None
+        hours = cfg.getfloat("history", "hours", fallback=24)
+        rate_hz = cfg.getfloat("history", "rate_hz", fallback=1.0)
+        return cls(columns, capacity=int(hours * 3600 * rate_hz), path=path, rate_hz=rate_hz)
+
+    # File layout
+
+    def _size(self):
+        return HEADER_SIZE + self.capacity * (8 + 4 * len(self.columns))
+
+    def _meta(self):
+        return {"capacity": self.capacity, "columns": self.columns}
+
+    def _matches(self, path):
+        try:
+            with open(path, "rb") as f:
+                header = f.read(HEADER_SIZE)
+            if header[:len(MAGIC)] != MAGIC or os.path.getsize(path) != self._size():
+                return False
+            meta = json.loads(header[META_OFFSET:].rstrip(b"\0").decode("utf-8"))
+            return meta == self._meta()
+        except (OSError, ValueError):
+            return False
+
+    def _create(self, path):
+        meta = json.dumps(self._meta()).encode("utf-8")
+        if META_OFFSET + len(meta) > HEADER_SIZE:
+            raise ValueError("History columns do not fit the header")
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            f.write(np.zeros(2, dtype=np.int64).tobytes())
+            f.seek(META_OFFSET)
+            f.write(meta)
+            # Sparse until written
+            f.truncate(self._size())
+
+    def _map(self, path):
+        if os.path.exists(path) and not self._matches(path):
+            log.warning(f"History file {path} has another layout, moved to {path}.old")
+            os.replace(path, path + ".old")
+        if not os.path.exists(path):
+            self._create(path)
+            fresh = True
+        else:
+            fresh = False
+
+        self._mm = np.memmap(path, dtype=np.uint8, mode="r+")
+        self._state = self._mm[len(MAGIC):len(MAGIC) + 16].view(np.int64)
+        offset = HEADER_SIZE
+        self.times = self._mm[offset:offset + 8 * self.capacity].view(np.float64)
+        offset += 8 * self.capacity
+        self._values = {}
+        for c in self.columns:
+            self._values[c] = self._mm[offset:offset + 4 * self.capacity].view(np.float32)
+            offset += 4 * self.capacity
+        if fresh:
+            self.times[:] = np.nan
+            for values in self._values.values():
+                values[:] = np.nan
+        else:
+            log.info(f"History: {len(self)} rows restored from {path}")
+
+    # Writing
+
+    def append(self, values, t=None):
+        """
+        Add one row: `values` maps column names to numbers (None or a
+        missing key is nan, unknown keys are ignored). `t` (Unix time,
+        default now) is clamped to the previous row's, so rows stay sorted
+        when the clock steps back.
+        """
+        if t is None:
+            t = time.time()
+        with self._lock:
+            pos, count = int(self._state[0]), int(self._state[1])
+            if count:
+                t = max(t, float(self.times[(pos - 1) % self.capacity]))
+            for c, column in self._values.items():
+                v = values.get(c)
+                column[pos] = np.nan if v is None else v
+            self.times[pos] = t
+            # Publish the row only once it is complete
+            self._state[1] = min(self.capacity, count + 1)
+            self._state[0] = (pos + 1) % self.capacity
+
+    def flush(self):
+        if self._mm is not None:
+            self._mm.flush()
+
+    def close(self):
+        self.flush()
+
+    # Reading
+
+    def __len__(self):
+        return int(self._state[1])
+
+    def _bounds(self):
+        """(index of the oldest row, row count)"""
+        with self._lock:
+            pos, count = int(self._state[0]), int(self._state[1])
+        return (pos - count) % self.capacity, count
+
+    def _segments(self):
+        oldest, count = self._bounds()
+        end = oldest + count
+        if end <= self.capacity:
+            return [(oldest, end)]
+        return [(oldest, self.capacity), (0, end - self.capacity)]
+
+    def query(self, start=None, end=None, columns=None):
+        """
+        Rows with `start <= t < end` (Unix times, None = unbounded) as a
+        list of (timestamps, {column: values}) view segments, oldest first.
+        """
+        names = self.columns if columns is None else columns
+        result = []
+        for lo, hi in self._segments():
+            t = self.times[lo:hi]
+            a = 0 if start is None else int(np.searchsorted(t, start, side="left"))
+            b = t.shape[0] if end is None else int(np.searchsorted(t, end, side="left"))
+            if a < b:
+                result.append((t[a:b], {c: self._values[c][lo + a:lo + b] for c in names}))
+        return result
+
+    def column(self, name):
+        """Every stored value of `name`, in storage (not time) order."""
+        _, count = self._bounds()
+        return self._values[name][:count]
+
+    def latest(self):
+        """(t, {column: value}) of the newest row, or None."""
+        oldest, count = self._bounds()
+        if not count:
+            return None
+        i = (oldest + count - 1) % self.capacity
+        return float(self.times[i]), {c: float(v[i]) for c, v in self._values.items()}
+
+    def _sample_index(self, since, n):
+        """Storage indices of `n` rows evenly spaced since `since`, or None."""
+        oldest, count = self._bounds()
+        if not count or n <= 0:
+            return None
+        # First row at or after `since`, in logical (oldest first) order
+        first = 0
+        for lo, hi in self._segments():
+            t = self.times[lo:hi]
+            k = int(np.searchsorted(t, since, side="left"))
+            if k < t.shape[0]:
+                first += k
+                break
+            first += t.shape[0]
+        rows = count - first
+        if rows <= 0:
+            return None
+        n = min(n, rows)
+        logical = first + (np.arange(n) * rows) // n
+        return (oldest + logical) % self.capacity
+
+    def sample(self, name, since, n):
+        """
+        `n` values of `name` evenly spaced over the rows since `since`
+        (fewer if there are fewer rows), oldest first.
+        """
+        index = self._sample_index(since, n)
+        if index is None:
+            return np.empty(0, dtype=np.float32)
+        return self._values[name][index]
+
+    def sample_rows(self, since, n, columns=None):
+        """Like `sample()`, for several columns: (timestamps, {column: values})."""
+        names = self.columns if columns is None else columns
+        index = self._sample_index(since, n)
+        if index is None:
+            index = np.empty(0, dtype=np.int64)
+        return self.times[index], {c: self._values[c][index] for c in names}
@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+"""
+Long-lived HTTP session for talking to the ClassSense server.
+
+- One `requests.Session` with a keep-alive connection pool, so samples reuse
+  an open TCP/TLS connection instead of connecting and handshaking each time.
+- One SSL context shared by all connections, so the CA bundle is parsed once
+  and not for every new connection.
+- A small DNS cache with a TTL, used by this session's connections only; a
+  stale entry is used if the resolver fails.
+- Per-request latency is logged and kept as running statistics.
+- Batches of samples go out in one request as a JSON array or NDJSON,
+  optionally gzip-compressed. Missing readings (nan, inf) are sent as
+  null, since JSON has no such numbers.
+- Failed requests are retried with exponential backoff and full jitter,
+  honouring `Retry-After` on 429/503. A circuit breaker stops requests
+  while the server is known to be down and lets one probe through once
+  its (jittered) open time is over, so a school full of devices does not
+  reconnect at the same moment. Backoff waits on `stop_event`, so setting
+  it (the uploader does on shutdown) ends the retries at once.
+"""
+
+import gzip
+import json
+import math
+import time
+import random
+import socket
+import logging
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter, DEFAULT_CA_BUNDLE_PATH
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+
+try:
+    from urllib3.util.ssl_ import create_urllib3_context
+except Exception:
+    create_urllib3_context = None
+
+from classsense import wire
+
+log = logging.getLogger("ClassSense.http")
+
+
+def _finite(value):
+    """Copy of `value` with nan and inf floats replaced by None."""
+    kind = type(value)
+    if kind is float:
+        return value if math.isfinite(value) else None
+    if kind is dict:
+        return {k: _finite(v) for k, v in value.items()}
+    if kind is list or kind is tuple:
+        return [_finite(v) for v in value]
+    return value
+
+
+def to_json(payload):
+    """JSON text of `payload`; raises ValueError rather than write bare NaN."""
+    return json.dumps(_finite(payload), allow_nan=False)
+
+
+class DnsCache:
+    """
+    TTL cache in front of `socket.getaddrinfo`, used only by the
+    connections of the session it is mounted on.
+    """
+
+    def __init__(self, ttl_s=300):
+        self.ttl_s = ttl_s
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._resolve = socket.getaddrinfo
+
+    def getaddrinfo(self, host, port, *args, **kwargs):
+        key = (host, port, args, tuple(sorted(kwargs.items())))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and now - entry[1] < self.ttl_s:
+            return entry[0]
+
+        try:
+            result = self._resolve(host, port, *args, **kwargs)
+        except socket.gaierror as e:
+            if entry is not None:
+                log.debug(f"DNS lookup for {host} failed ({e}), using cached address")
+                return entry[0]
+            raise
+
+        with self._lock:
+            self._entries[key] = (result, now)
+        return result
+
+
+class _CachedDnsConnection:
+    """
+    Connection mixin that connects to the addresses in `dns_cache` in turn
+    instead of resolving the host name on every new connection.
+    """
+
+    dns_cache = None
+
+    def _new_conn(self):
+        host = self._dns_host
+        try:
+            infos = self.dns_cache.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM)
+        except OSError:
+            # Let urllib3 resolve and report the failure itself
+            return super()._new_conn()
+        addresses = list(dict.fromkeys(info[4][0] for info in infos)) or [host]
+        try:
+            for i, address in enumerate(addresses):
+                # Only the socket connect uses the address; TLS still checks
+                # the certificate against the host name, restored below
+                self._dns_host = address
+                try:
+                    return super()._new_conn()
+                except NewConnectionError:
+                    if i + 1 == len(addresses):
+                        raise
+        finally:
+            self._dns_host = host
+
+
+def _cached_dns_pools(dns_cache):
+    """Connection pool classes by scheme whose connections use `dns_cache`."""
+    pools = {}
+    for scheme, pool, conn in (("http", HTTPConnectionPool, HTTPConnection),
+                               ("https", HTTPSConnectionPool, HTTPSConnection)):
+        conn_cls = type(f"CachedDns{conn.__name__}", (_CachedDnsConnection, conn), {"dns_cache": dns_cache})
+        pools[scheme] = type(f"CachedDns{pool.__name__}", (pool,), {"ConnectionCls": conn_cls})
+    return pools
+
+
+class _PooledAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose connections share one preloaded SSL context and,
+    if given, resolve host names through `dns_cache`.
+    """
+
+    def __init__(self, ssl_context=None, dns_cache=None, **kwargs):
+        self._ssl_context = ssl_context
+        self._dns_cache = dns_cache
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self._ssl_context is not None:
+            kwargs["ssl_context"] = self._ssl_context
+        super().init_poolmanager(*args, **kwargs)
+        if self._dns_cache is not None:
+            self.poolmanager.pool_classes_by_scheme = _cached_dns_pools(self._dns_cache)
+
+    def cert_verify(self, conn, url, verify, cert):
+        super().cert_verify(conn, url, verify, cert)
+        if self._ssl_context is not None and verify is True:
+            # The CA bundle is already loaded into the shared context
+            conn.ca_certs = None
+            conn.ca_cert_dir = None
+
+
+def _shared_ssl_context():
+    if create_urllib3_context is None:
+        return None
+    try:
+        ctx = create_urllib3_context()
+        ctx.load_verify_locations(DEFAULT_CA_BUNDLE_PATH)
+        return ctx
+    except Exception as e:
+        log.debug(f"Shared SSL context unavailable, using per-connection contexts: {e}")
+        return None
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of sending while the circuit breaker is open."""
+
+    def __init__(self, retry_in_s):
+        super().__init__(f"server marked down, next attempt in {retry_in_s:.0f}s")
+        self.retry_in_s = retry_in_s
+
+
+def parse_retry_after(value):
+    """`Retry-After` header (seconds or HTTP date) -> seconds, or None."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter: the n-th retry waits a random
+    time between 0 and min(max_s, base_s * 2**n).
+    """
+
+    def __init__(self, attempts=3, base_s=1.0, max_s=60.0):
+        self.attempts = max(1, attempts)
+        self.base_s = base_s
+        self.max_s = max_s
+
+    def delay(self, retry):
+        return random.uniform(0.0, min(self.max_s, self.base_s * (2 ** retry)))
+
+
+class CircuitBreaker:
+    """
+    closed    -> requests go through; `failure_threshold` failed requests
+                 in a row open the circuit.
+    open      -> requests fail fast until the open time is over. The open
+                 time doubles with every consecutive trip (jittered, capped
+                 at `max_reset_s`), or follows the server's Retry-After.
+    half-open -> one probe request is let through; success closes the
+                 circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=3, reset_s=30.0, max_reset_s=600.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_s = reset_s
+        self.max_reset_s = max_reset_s
+        self.state = "closed"
+        self._failures = 0
+        self._trips = 0
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """Raise CircuitOpenError unless a request may be sent now."""
+        with self._lock:
+            if self.state == "closed":
+                return
+            now = time.monotonic()
+            if self.state == "open" and now >= self._open_until:
+                self.state = "half-open"
+                log.info("Circuit half-open, probing server.")
+                return
+            raise CircuitOpenError(max(0.0, self._open_until - now))
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                log.info("Server reachable again, circuit closed.")
+            self.state = "closed"
+            self._failures = 0
+            self._trips = 0
+
+    def record_failure(self, retry_after=None):
+        with self._lock:
+            self._failures += 1
+            if self.state != "half-open" and self._failures < self.failure_threshold:
+                return
+            open_s = min(self.max_reset_s, self.reset_s * (2 ** self._trips))
+            open_s = random.uniform(open_s / 2.0, open_s)
+            if retry_after is not None:
+                open_s = max(open_s, retry_after)
+            self._trips += 1
+            self.state = "open"
+            self._open_until = time.monotonic() + open_s
+            log.warning(f"Server unreachable, circuit open for {open_s:.0f}s.")
+
+
+class HttpClient:
+    """
+    Keep-alive HTTP client used for every request to the server.
+    """
+
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+
+    def __init__(self, api_key="", timeout=5, pool_size=2, dns_ttl_s=300,
+                 retry=None, breaker=None, stop_event=None):
+        self.timeout = timeout
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        # Set to give up retrying, e.g. the uploader's stop_event
+        self.stop_event = stop_event or threading.Event()
+        self.dns_cache = DnsCache(dns_ttl_s) if dns_ttl_s > 0 else None
+
+        adapter = _PooledAdapter(
+            ssl_context=_shared_ssl_context(),
+            dns_cache=self.dns_cache,
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=0,
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Connection"] = "keep-alive"
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+        self._lock = threading.Lock()
+        self._count = 0
+        self._total_s = 0.0
+        self._max_s = 0.0
+        self.last_latency_s = None
+        self._msgpack_ok = True
+        # Instrumentation hooks: on_serialize(samples, size, seconds) after a
+        # body was encoded, on_request(seconds, status) after every attempt
+        # (status None when no response arrived)
+        self.on_serialize = None
+        self.on_request = None
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(
+            api_key=cfg.get("server", "api_key", fallback=""),
+            timeout=cfg.getfloat("http", "timeout_seconds", fallback=5),
+            pool_size=cfg.getint("http", "pool_size", fallback=2),
+            dns_ttl_s=cfg.getfloat("http", "dns_ttl_seconds", fallback=300),
+            retry=RetryPolicy(
+                attempts=cfg.getint("http", "retry_attempts", fallback=3),
+                base_s=cfg.getfloat("http", "backoff_base_seconds", fallback=1),
+                max_s=cfg.getfloat("http", "backoff_max_seconds", fallback=60),
+            ),
+            breaker=CircuitBreaker(
+                failure_threshold=cfg.getint("http", "breaker_failures", fallback=3),
+                reset_s=cfg.getfloat("http", "breaker_reset_seconds", fallback=30),
+                max_reset_s=cfg.getfloat("http", "breaker_max_reset_seconds", fallback=600),
+            ),
+        )
+
+    def request(self, method, url, timeout=None, **kwargs):
+        """
+        Send a request, retrying connection errors, timeouts and
+        429/5xx responses. Other 4xx responses are raised right away and
+        do not count against the server.
+        """
+        self.breaker.before_request()
+        # Every exit records an outcome, or a half-open breaker would
+        # never let another request through
+        recorded = False
+        try:
+            for attempt in range(self.retry.attempts):
+                retry_after = None
+                started = time.monotonic()
+                try:
+                    r = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+                except requests.RequestException as e:
+                    self._record(time.monotonic() - started, None)
+                    error = e
+                else:
+                    self._record(time.monotonic() - started, r.status_code)
+                    log.debug(f"{method} {url} -> {r.status_code} in {self.last_latency_s * 1000:.0f} ms")
+                    if r.status_code not in self.RETRY_STATUS:
+                        self.breaker.record_success()
+                        recorded = True
+                        r.raise_for_status()
+                        return r
+                    retry_after = parse_retry_after(r.headers.get("Retry-After"))
+                    error = requests.HTTPError(f"{r.status_code} from {url}", response=r)
+
+                if attempt + 1 >= self.retry.attempts:
+                    break
+                delay = self.retry.delay(attempt)
+                if retry_after is not None:
+                    if retry_after > self.retry.max_s:
+                        break
+                    delay = max(delay, retry_after)
+                log.debug(f"{method} {url} failed ({error}), retrying in {delay:.1f}s")
+                if self.stop_event.wait(delay):
+                    log.debug(f"{method} {url}: stopping, not retrying")
+                    break
+
+            self.breaker.record_failure(retry_after)
+            recorded = True
+            raise error
+        finally:
+            if not recorded:
+                self.breaker.record_failure()
+
+    def post_json(self, url, payload, timeout=None, extra_headers=None):
+        started = time.monotonic()
+        headers = {"Content-Type": "application/json"}
+        if extra_headers:
+            headers.update(extra_headers)
+        body = to_json(payload)
+        self._serialized(1, len(body), started)
+        return self.request("POST", url, timeout=timeout, data=body, headers=headers)
+
+    def post_batch(self, url, payloads, fmt="json", compress=True, timeout=None, extra_headers=None):
+        """
+        POST several samples in one request, oldest first.
+        `fmt` is "json" (one array), "ndjson" (one document per line) or
+        "msgpack" (see `wire.py`). If the server answers a msgpack body with
+        415, this and all later batches are sent as JSON.
+        """
+        if fmt == "msgpack":
+            if self._msgpack_ok and wire.available():
+                started = time.monotonic()
+                headers = {"Content-Type": wire.CONTENT_TYPE}
+                try:
+                    return self._post_body(url, wire.encode_batch(payloads), headers,
+                                           compress, timeout, extra_headers, len(payloads), started)
+                except requests.HTTPError as e:
+                    if e.response is None or e.response.status_code != 415:
+                        raise
+                    log.warning("Server does not accept msgpack samples, using JSON.")
+                    self._msgpack_ok = False
+            fmt = "json"
+
+        started = time.monotonic()
+        if fmt == "ndjson":
+            body = "\n".join(to_json(p) for p in payloads) + "\n"
+            headers = {"Content-Type": "application/x-ndjson"}
+        else:
+            body = to_json(payloads)
+            headers = {"Content-Type": "application/json"}
+        return self._post_body(url, body.encode("utf-8"), headers, compress, timeout, extra_headers,
+                               len(payloads), started)
+
+    def _post_body(self, url, body, headers, compress, timeout, extra_headers, samples, started):
+        if compress:
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+        self._serialized(samples, len(body), started)
+        if extra_headers:
+            headers.update(extra_headers)
+        return self.request("POST", url, timeout=timeout, data=body, headers=headers)
+
+    def _serialized(self, samples, size, started):
+        if self.on_serialize is not None:
+            self.on_serialize(samples, size, time.monotonic() - started)
+
+    def _record(self, elapsed_s, status):
+        with self._lock:
+            self._count += 1
+            self._total_s += elapsed_s
+            self._max_s = max(self._max_s, elapsed_s)
+            self.last_latency_s = elapsed_s
+        if self.on_request is not None:
+            self.on_request(elapsed_s, status)
+
+    def latency_stats(self):
+        """Request latency summary in milliseconds."""
+        with self._lock:
+            if not self._count:
+                return {"count": 0, "last_ms": None, "mean_ms": None, "max_ms": None}
+            return {
+                "count": self._count,
+                "last_ms": self.last_latency_s * 1000.0,
+                "mean_ms": self._total_s / self._count * 1000.0,
+                "max_ms": self._max_s * 1000.0,
+            }
+
+    def close(self):
+        self.session.close()
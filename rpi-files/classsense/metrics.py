@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+Hot-path metrics in the Prometheus text format.
+
+`Metrics` receives the loop's timings (it has the `client.Probe` methods)
+and keeps one histogram per stage and label set:
+
+    classsense_read_seconds{channel}        sensor reads (noise: capture analysis)
+    classsense_job_lateness_seconds{job}    scheduler jitter
+    classsense_job_seconds{job}             scheduled jobs (publish, summary, ...)
+    classsense_lcd_draw_seconds             LCD frame render + SPI transfer
+    classsense_serialize_seconds            payload encoding + compression
+    classsense_http_request_seconds{code}   one HTTP attempt
+    classsense_upload_seconds{result}       one upload, retries included
+
+plus counters. Gauges and counters owned by other objects (queue depth,
+outbox backlog, channel health, ...) come from collectors, which are
+called on every scrape instead of being updated on the hot path.
+
+`MetricsServer` serves `render()` at `GET /metrics` on its own thread.
+Observing costs one lock and a bisect over the bucket bounds.
+"""
+
+import time
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger("ClassSense.metrics")
+
+PREFIX = "classsense"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from a 1 ms sensor read to a 10 s upload with retries
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "read_seconds": ("histogram", "Sensor read duration."),
+    "read_failures_total": ("counter", "Sensor reads that raised."),
+    "job_lateness_seconds": ("histogram", "Delay between a job's deadline and its start."),
+    "job_seconds": ("histogram", "Scheduled job duration."),
+    "lcd_draw_seconds": ("histogram", "LCD frame render and transfer duration."),
+    "serialize_seconds": ("histogram", "Request body encoding and compression duration."),
+    "serialized_bytes_total": ("counter", "Request body bytes after compression."),
+    "http_request_seconds": ("histogram", "HTTP request duration per attempt, by status code."),
+    "upload_seconds": ("histogram", "Upload duration including retries."),
+    "uploads_total": ("counter", "Uploads by result."),
+}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels, extra=None):
+    items = list(labels)
+    if extra is not None:
+        items.append(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def _number(value):
+    if value is None:
+        return "NaN"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram; not locked, `Metrics` holds the lock."""
+
+    def __init__(self, buckets):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, n in zip(self.bounds + (float("inf"),), self.counts):
+            cumulative += n
+            yield f"{name}_bucket{_labels(labels, ('le', _number(float(bound))))} {cumulative}"
+        yield f"{name}_sum{_labels(labels)} {_number(self.sum)}"
+        yield f"{name}_count{_labels(labels)} {self.count}"
+
+
+class Metrics:
+    """
+    Histograms and counters of the loop, rendered with the collectors'
+    values. `forward` (another probe) gets every timing as well.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, forward=None):
+        self.buckets = tuple(sorted(buckets))
+        self.forward = forward
+        self._histograms = {}
+        self._counters = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+
+    @classmethod
+    def from_config(cls, cfg, forward=None):
+        """Returns None when [metrics] port is 0 (disabled)."""
+        if cfg.getint("metrics", "port", fallback=0) <= 0:
+            return None
+        buckets = cfg.get("metrics", "buckets", fallback="").strip()
+        if buckets:
+            return cls(buckets=[float(b) for b in buckets.split(",") if b.strip()], forward=forward)
+        return cls(forward=forward)
+
+    # Hot path
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram(self.buckets)
+            hist.observe(seconds)
+
+    def inc(self, name, n=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    # Probe methods
+
+    def job(self, name, late_s, seconds):
+        self.observe("job_lateness_seconds", max(0.0, late_s), job=name)
+        self.observe("job_seconds", seconds, job=name)
+        if self.forward is not None:
+            self.forward.job(name, late_s, seconds)
+
+    def read(self, channel, seconds, ok):
+        self.observe("read_seconds", seconds, channel=channel)
+        if not ok:
+            self.inc("read_failures_total", channel=channel)
+        if self.forward is not None:
+            self.forward.read(channel, seconds, ok)
+
+    def upload(self, samples, seconds, ok):
+        self.observe("upload_seconds", seconds, result="ok" if ok else "error")
+        self.inc("uploads_total", result="ok" if ok else "error")
+        if self.forward is not None:
+            self.forward.upload(samples, seconds, ok)
+
+    def draw(self, seconds):
+        self.observe("lcd_draw_seconds", seconds)
+        if self.forward is not None:
+            self.forward.draw(seconds)
+
+    def serialize(self, samples, size, seconds):
+        self.observe("serialize_seconds", seconds)
+        self.inc("serialized_bytes_total", size)
+        if self.forward is not None:
+            self.forward.serialize(samples, size, seconds)
+
+    def request(self, seconds, status):
+        # Label values are strings, so they sort together
+        self.observe("http_request_seconds", seconds, code=str(status) if status else "error")
+        if self.forward is not None:
+            self.forward.request(seconds, status)
+
+    # Scrape
+
+    def collector(self, collect):
+        """
+        Add a callable returning [(name, type, help, labels dict, value)],
+        called on every scrape. Errors are logged and the rest is rendered.
+        """
+        self._collectors.append(collect)
+
+    def render(self):
+        families = {}
+
+        def family(name, kind, text):
+            return families.setdefault(f"{PREFIX}_{name}", (kind, text, []))[2]
+
+        with self._lock:
+            for (name, labels), hist in sorted(self._histograms.items()):
+                kind, text = HELP.get(name, ("histogram", name))
+                family(name, kind, text).extend(hist.lines(f"{PREFIX}_{name}", labels))
+            for (name, labels), value in sorted(self._counters.items()):
+                kind, text = HELP.get(name, ("counter", name))
+                family(name, kind, text).append(f"{PREFIX}_{name}{_labels(labels)} {_number(value)}")
+
+        family("uptime_seconds", "gauge", "Seconds since the client started.").append(
+            f"{PREFIX}_uptime_seconds {_number(round(time.monotonic() - self.started, 3))}"
+        )
+        for collect in self._collectors:
+            try:
+                rows = list(collect())
+            except Exception as e:
+                log.warning(f"Metrics collector failed: {e}")
+                continue
+            for name, kind, text, labels, value in rows:
+                labels = tuple(sorted(labels.items()))
+                family(name, kind, text).append(f"{PREFIX}_{name}{_labels(labels)} {_number(value)}")
+
+        out = []
+        for name, (kind, text, lines) in families.items():
+            out.append(f"# HELP {name} {text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(lines)
+        return "\n".join(out) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, fmt, *args):
+        log.debug(fmt % args)
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsServer:
+    """Serves `metrics.render()` at http://<bind>:<port>/metrics."""
+
+    def __init__(self, metrics, port, bind="127.0.0.1"):
+        self.metrics = metrics
+        self.port = port
+        self.bind = bind
+        self._httpd = None
+
+    @classmethod
+    def from_config(cls, cfg, metrics):
+        return cls(
+            metrics,
+            port=cfg.getint("metrics", "port", fallback=0),
+            bind=cfg.get("metrics", "bind", fallback="127.0.0.1").strip(),
+        )
+
+    def start(self):
+        httpd = ThreadingHTTPServer((self.bind, self.port), _Handler)
+        httpd.daemon_threads = True
+        httpd.metrics = self.metrics
+        self._httpd = httpd
+        threading.Thread(target=httpd.serve_forever, name="metrics", daemon=True).start()
+        log.info(f"Metrics on http://{self.bind}:{httpd.server_address[1]}/metrics")
+
+    def close(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
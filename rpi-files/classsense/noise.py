@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming noise meter.
+
+A continuous `sounddevice` input stream writes every audio block into a
+preallocated NumPy ring buffer, so no audio is missed between samples and
+the sampling loop never waits for a recording. Levels are computed on
+demand, vectorized over the whole window:
+
+    leq  equivalent continuous level (energy mean)
+    lmax / lmin  loudest / quietest block
+    l10 / l90    level exceeded 10 % / 90 % of the time
+
+Values are pseudo dB (dBFS + `db_offset`), not calibrated.
+
+`read_new()` hands out the audio captured since the previous call as
+fixed-size frames, for incremental consumers such as the spectral analyzer.
+"""
+
+import math
+import logging
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+try:
+    import sounddevice as sd
+except Exception:
+    sd = None
+
+log = logging.getLogger("ClassSense.noise")
+
+
+class NoiseMeter:
+    def __init__(self, samplerate=16000, block_ms=125, history_s=60, db_offset=90.0):
+        if np is None:
+            raise RuntimeError("numpy not available")
+        self.samplerate = samplerate
+        self.block_len = max(1, int(samplerate * block_ms / 1000.0))
+        self.db_offset = db_offset
+
+        size = int(history_s * samplerate) // self.block_len * self.block_len
+        self._ring = np.zeros(size, dtype=np.float32)
+        self._pos = 0
+        self._filled = 0
+        self._written = 0
+        self._read_total = 0
+        self.overflows = 0
+        self._stream = None
+
+    @classmethod
+    def from_config(cls, cfg, db_offset=90.0):
+        return cls(
+            samplerate=cfg.getint("noise", "samplerate", fallback=16000),
+            block_ms=cfg.getfloat("noise", "block_ms", fallback=125),
+            history_s=cfg.getfloat("noise", "history_seconds", fallback=60),
+            db_offset=cfg.getfloat("noise", "db_offset", fallback=db_offset),
+        )
+
+    def start(self):
+        if sd is None:
+            raise RuntimeError("sounddevice not available")
+        self._stream = sd.InputStream(
+            samplerate=self.samplerate,
+            channels=1,
+            dtype="float32",
+            blocksize=self.block_len,
+            callback=self._callback,
+        )
+        self._stream.start()
+
+    def stop(self):
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+    def _callback(self, indata, frames, time_info, status):
+        # Runs on the audio thread: copy into the ring and nothing else
+        if status:
+            self.overflows += 1
+        size = self._ring.shape[0]
+        pos = self._pos
+        end = pos + frames
+        if end <= size:
+            self._ring[pos:end] = indata[:, 0]
+        else:
+            first = size - pos
+            self._ring[pos:] = indata[:first, 0]
+            self._ring[:frames - first] = indata[first:, 0]
+        self._pos = end % size
+        self._filled = min(size, self._filled + frames)
+        self._written += frames
+
+    def read_new(self, frame_len):
+        """
+        Audio captured since the last call as a (k, frame_len) array of
+        whole frames, oldest first. Audio that was already overwritten in
+        the ring is skipped.
+        """
+        size = self._ring.shape[0]
+        written = self._written
+        start_total = max(self._read_total, written - size)
+        k = (written - start_total) // frame_len
+        if k == 0:
+            return np.empty((0, frame_len), dtype=np.float32)
+        n = k * frame_len
+        start = start_total % size
+        if start + n <= size:
+            x = self._ring[start:start + n]
+        else:
+            x = np.concatenate((self._ring[start:], self._ring[:start + n - size]))
+        self._read_total = start_total + n
+        return x.reshape(k, frame_len)
+
+    def _window(self, window_s):
+        """Most recent whole blocks covering `window_s` (a view when possible)."""
+        size = self._ring.shape[0]
+        pos = self._pos
+        want = int(window_s * self.samplerate) // self.block_len * self.block_len
+        n = min(want, self._filled // self.block_len * self.block_len, size)
+        if n == 0:
+            return None
+        start = (pos - n) % size
+        if start < pos:
+            return self._ring[start:pos]
+        return np.concatenate((self._ring[start:], self._ring[:pos]))
+
+    def block_levels(self, window_s):
+        """Per-block mean square (DC removed) over the window, or None."""
+        x = self._window(window_s)
+        if x is None:
+            return None
+        blocks = x.reshape(-1, self.block_len)
+        centered = blocks - blocks.mean(axis=1, keepdims=True)
+        ms = np.einsum("ij,ij->i", centered, centered) / self.block_len
+        return np.maximum(ms, 1e-12)
+
+    def levels(self, window_s):
+        """
+        Rolling levels over the last `window_s` seconds as a dict with
+        leq, lmax, lmin, l10 and l90, or None before any audio arrived.
+        """
+        ms = self.block_levels(window_s)
+        if ms is None:
+            return None
+        db = 10.0 * np.log10(ms) + self.db_offset
+        l90, l10 = np.percentile(db, (10, 90))
+        return {
+            "leq": max(0.0, 10.0 * math.log10(float(ms.mean())) + self.db_offset),
+            "lmax": max(0.0, float(db.max())),
+            "lmin": max(0.0, float(db.min())),
+            "l10": max(0.0, float(l10)),
+            "l90": max(0.0, float(l90)),
+        }
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Durable store-and-forward outbox.
+
+Samples that could not be uploaded are kept in a small SQLite database
+(WAL mode) so they survive network outages and service restarts, and are
+replayed in order once the server is reachable again.
+
+Written with SD-card wear in mind:
+  * rows are buffered in memory and written in one transaction per
+    `flush_rows` rows or `flush_interval_s` seconds,
+  * `synchronous=NORMAL` in WAL mode only fsyncs on checkpoints, not on
+    every commit; the database stays consistent after a crash or power cut,
+  * nothing is written while the server is reachable.
+The outbox is bounded by `max_bytes`, measured on disk: the database
+pages in use (rows, index and page overhead) plus the WAL file. Over it,
+the WAL is checkpointed and the oldest samples are dropped until a tenth
+of the quota is free again. Freed pages are reused, so the file keeps its
+largest size but does not grow past the quota plus one flush.
+"""
+
+import os
+import json
+import math
+import time
+import sqlite3
+import logging
+import threading
+
+log = logging.getLogger("ClassSense.outbox")
+
+# Share of the quota freed when it is hit, so the next flushes fit without
+# another checkpoint
+QUOTA_HEADROOM = 0.1
+
+
+class Outbox:
+    def __init__(self, path, max_bytes=50 * 1024 * 1024, flush_rows=30, flush_interval_s=60.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval_s = flush_interval_s
+
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._buffer_since = None
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        # Fewer, larger checkpoints (in pages)
+        self._db.execute("PRAGMA wal_autocheckpoint=1000")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " body TEXT NOT NULL)"
+        )
+        count, = self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()
+        self._count = count
+        if count:
+            log.info(f"Outbox: {count} sample(s) waiting from a previous run.")
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Returns None when [outbox] path is empty."""
+        path = cfg.get("outbox", "path", fallback="").strip()
+        if not path:
+            return None
+        return cls(
+            path,
+            max_bytes=int(cfg.getfloat("outbox", "max_megabytes", fallback=50) * 1024 * 1024),
+            flush_rows=cfg.getint("outbox", "flush_rows", fallback=30),
+            flush_interval_s=cfg.getfloat("outbox", "flush_seconds", fallback=60),
+        )
+
+    def __len__(self):
+        with self._lock:
+            return self._count + len(self._buffer)
+
+    def extend(self, payloads):
+        """Queue payloads for writing; they hit the disk on the next flush."""
+        if not payloads:
+            return
+        with self._lock:
+            if not self._buffer:
+                self._buffer_since = time.monotonic()
+            self._buffer.extend(json.dumps(p) for p in payloads)
+            due = len(self._buffer) >= self.flush_rows
+        if due:
+            self.flush()
+
+    def flush_due_in(self):
+        """Seconds until the buffered rows must be written, None if nothing is buffered."""
+        with self._lock:
+            if not self._buffer:
+                return None
+            return max(0.0, self._buffer_since + self.flush_interval_s - time.monotonic())
+
+    def flush(self):
+        with self._lock:
+            if not self._buffer:
+                return
+            rows = self._buffer
+            self._buffer = []
+            self._buffer_since = None
+            self._db.execute("BEGIN")
+            self._db.executemany("INSERT INTO outbox (body) VALUES (?)", ((b,) for b in rows))
+            self._db.execute("COMMIT")
+            self._count += len(rows)
+            self._enforce_quota()
+
+    def _used_bytes(self):
+        """Size of the database pages in use; free pages are not counted."""
+        page_size, = self._db.execute("PRAGMA page_size").fetchone()
+        pages, = self._db.execute("PRAGMA page_count").fetchone()
+        free, = self._db.execute("PRAGMA freelist_count").fetchone()
+        return (pages - free) * page_size
+
+    def disk_bytes(self):
+        """On-disk size the quota applies to: pages in use plus the WAL file."""
+        with self._lock:
+            return self._disk_bytes()
+
+    def _disk_bytes(self):
+        try:
+            wal = os.path.getsize(self.path + "-wal")
+        except OSError:
+            wal = 0
+        return self._used_bytes() + wal
+
+    def _enforce_quota(self):
+        if self._disk_bytes() <= self.max_bytes:
+            return
+        # The WAL only shrinks at a checkpoint; fold it into the database
+        # first, it may be all that is over the quota
+        self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        target = self.max_bytes * (1.0 - QUOTA_HEADROOM)
+        dropped = 0
+        used = self._used_bytes()
+        while used > target and self._count:
+            # Rows to drop, from the average on-disk size of a row
+            n = max(1, math.ceil((used - target) * self._count / used))
+            deleted = self._db.execute(
+                "DELETE FROM outbox WHERE id IN (SELECT id FROM outbox ORDER BY id LIMIT ?)", (n,)
+            ).rowcount
+            self._count -= deleted
+            dropped += deleted
+            used = self._used_bytes()
+        if dropped:
+            self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            log.warning(f"Outbox over quota, dropped {dropped} oldest sample(s).")
+
+    def peek(self, limit):
+        """
+        Oldest `limit` samples as a list of (id, payload). Rows not written
+        yet follow the stored ones with id None; they are read from the
+        buffer, so a replay does not force a write.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, body FROM outbox ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+            rows += [(None, body) for body in self._buffer[:max(0, limit - len(rows))]]
+        return [(row_id, json.loads(body)) for row_id, body in rows]
+
+    def ack(self, rows):
+        """Remove the samples `peek()` returned as `rows`."""
+        ids = [row_id for row_id, _ in rows if row_id is not None]
+        buffered = len(rows) - len(ids)
+        with self._lock:
+            if ids:
+                deleted = self._db.execute("DELETE FROM outbox WHERE id <= ?", (max(ids),)).rowcount
+                self._count -= deleted
+            if buffered:
+                del self._buffer[:buffered]
+                if not self._buffer:
+                    self._buffer_since = None
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent sensor sampling.
+
+Every sensor read runs in its own worker thread with a per-read deadline.
+`snapshot()` assembles the latest value of every sensor into one
+timestamped snapshot without waiting for any read, so a slow sensor never
+delays the others.
+
+`Scheduler` drives the reads on the monotonic clock, each sensor at its own
+rate, without accumulating drift from slow reads or uploads.
+"""
+
+import time
+import heapq
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+log = logging.getLogger("ClassSense.sampling")
+
+
+class SensorChannel:
+    """
+    One sensor read.
+
+    `read` is a callable without arguments that returns the value; it
+    raises when the sensor cannot be read.
+    `default` is used when the read fails or misses its deadline.
+    `rate_hz` is how often the channel is read when driven by a `Scheduler`.
+    `reinit` (optional) rebuilds the driver. It runs on its own thread after
+    `max_failures` failed or late reads in a row, then again after
+    `backoff_s`, doubling up to `max_backoff_s`, until a read succeeds.
+    """
+
+    def __init__(self, name, read, deadline_s=1.0, default=float("nan"), rate_hz=1.0,
+                 reinit=None, max_failures=3, backoff_s=5.0, max_backoff_s=300.0):
+        self.name = name
+        self.read = read
+        self.deadline_s = deadline_s
+        self.default = default
+        self.rate_hz = rate_hz
+        self.reinit = reinit
+        self.max_failures = max_failures
+        self.backoff_s = backoff_s
+        self.max_backoff_s = max_backoff_s
+
+    @property
+    def interval_s(self):
+        return 1.0 / self.rate_hz
+
+    @property
+    def max_age_s(self):
+        # A value is still current until two read intervals have passed
+        return 2.0 * self.interval_s + self.deadline_s
+
+
+class ChannelHealth:
+    """Per-channel read statistics."""
+
+    def __init__(self, backoff_s):
+        self.reads = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.consecutive = 0
+        self.reinits = 0
+        self.stale = False
+        self.reiniting = False
+        self.backoff_s = backoff_s
+        self.next_reinit = 0.0
+        # Monotonic time of the last good read (start-up until there is one)
+        self.last_read = time.monotonic()
+
+    def as_dict(self):
+        return {
+            "reads": self.reads,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "reinits": self.reinits,
+            "stale": self.stale,
+            "since_read_s": round(time.monotonic() - self.last_read, 3),
+        }
+
+
+class SamplingEngine:
+    """
+    Runs all channel reads concurrently and assembles one snapshot.
+
+    Reads run under a hard deadline: a read that misses it is abandoned
+    (Python cannot kill the thread, so it keeps its worker until the driver
+    call returns, and the channel is skipped meanwhile, also across reinits,
+    so a channel never holds more than one worker). After `max_failures` failed or late reads in a row a channel
+    is marked stale, which drops its value from snapshots, and reinitialised
+    with backoff if it has a `reinit`. `health()` reports the counters.
+
+    `on_sample(name, value)` is called with every scheduled read that
+    completes within its deadline, e.g. to aggregate all readings.
+    `on_read(name, seconds, ok)` is called with the duration of every
+    scheduled read that returned.
+    """
+
+    def __init__(self, channels, on_sample=None, on_read=None):
+        self.channels = list(channels)
+        self.on_sample = on_sample
+        self.on_read = on_read
+        # One worker per channel: a hung driver only ever blocks its own
+        self._pool = ThreadPoolExecutor(
+            max_workers=max(1, len(self.channels)),
+            thread_name_prefix="sensor",
+        )
+        self._pending = {}
+        self._latest = {}
+        self._health = {ch.name: ChannelHealth(ch.backoff_s) for ch in self.channels}
+        self._lock = threading.Lock()
+
+    def submit(self, name):
+        """
+        Start a read of one channel without waiting for it. The result is
+        kept as the channel's latest value if it arrives within the deadline.
+        """
+        ch = self.channel(name)
+        health = self._health[name]
+        now = time.monotonic()
+        pending = self._pending.get(name)
+        if pending is not None and not pending[0].done():
+            fut, started = pending
+            if now - started > ch.deadline_s:
+                # Every read slot missed while a read hangs counts as a timeout
+                if not getattr(fut, "counted", False):
+                    fut.counted = True
+                    log.warning(f"{name}: read hung for more than {ch.deadline_s:.1f}s")
+                self._failed(ch, timeout=True)
+            else:
+                log.debug(f"{name}: previous read still running, skipping")
+            return
+        if health.reiniting:
+            return
+        fut = self._pool.submit(ch.read)
+        fut.reinits = health.reinits
+        self._pending[name] = (fut, now)
+        fut.add_done_callback(lambda f: self._store(ch, now, f))
+
+    def _store(self, ch, started, fut):
+        finished = time.monotonic()
+        pending = self._pending.get(ch.name)
+        if pending is None or pending[0] is not fut:
+            return
+        if getattr(fut, "counted", False) or fut.reinits != self._health[ch.name].reinits:
+            # Abandoned read, or one of the driver before a reinit
+            return
+        try:
+            value = fut.result()
+        except Exception as e:
+            log.debug(f"{ch.name} read failed: {e}")
+            if self.on_read is not None:
+                self.on_read(ch.name, finished - started, False)
+            self._failed(ch)
+            return
+        if self.on_read is not None:
+            self.on_read(ch.name, finished - started, True)
+        if finished - started > ch.deadline_s:
+            log.debug(f"{ch.name}: read missed its {ch.deadline_s:.1f}s deadline")
+            self._failed(ch, timeout=True)
+            return
+        with self._lock:
+            self._latest[ch.name] = (value, finished)
+            health = self._health[ch.name]
+            health.reads += 1
+            health.last_read = finished
+            if health.stale:
+                log.info(f"{ch.name}: readings are back.")
+            health.consecutive = 0
+            health.stale = False
+            health.backoff_s = ch.backoff_s
+        if self.on_sample is not None:
+            self.on_sample(ch.name, value)
+
+    def _failed(self, ch, timeout=False):
+        with self._lock:
+            health = self._health[ch.name]
+            health.failures += 1
+            if timeout:
+                health.timeouts += 1
+            health.consecutive += 1
+            if health.consecutive < ch.max_failures:
+                return
+            if not health.stale:
+                log.warning(f"{ch.name}: {health.consecutive} failed reads in a row, marked stale.")
+            health.stale = True
+            if ch.reinit is None or health.reiniting or time.monotonic() < health.next_reinit:
+                return
+            health.reiniting = True
+        threading.Thread(target=self._reinit, args=(ch,), name=f"reinit-{ch.name}", daemon=True).start()
+
+    def _reinit(self, ch):
+        health = self._health[ch.name]
+        try:
+            ch.reinit()
+            log.info(f"{ch.name}: driver reinitialised.")
+        except Exception as e:
+            log.warning(f"{ch.name}: reinit failed: {e}")
+        with self._lock:
+            health.reinits += 1
+            health.reiniting = False
+            health.next_reinit = time.monotonic() + health.backoff_s
+            health.backoff_s = min(ch.max_backoff_s, health.backoff_s * 2.0)
+
+    def channel(self, name):
+        """The channel called `name`; KeyError if there is none."""
+        for ch in self.channels:
+            if ch.name == name:
+                return ch
+        raise KeyError(name)
+
+    def health(self):
+        """{channel name: counters, stale flag and seconds since the last good read}"""
+        with self._lock:
+            return {name: h.as_dict() for name, h in self._health.items()}
+
+    def schedule(self, scheduler):
+        """Register every channel with `scheduler` at its own rate."""
+        for ch in self.channels:
+            scheduler.every(ch.interval_s, lambda name=ch.name: self.submit(name), name=ch.name)
+
+    def snapshot(self):
+        """
+        Assemble the latest value of every channel into a snapshot dict:
+            {"timestamp": <ISO UTC>, "monotonic": <float>, "values": {name: value}}
+        Values older than the channel's `max_age_s` are replaced by its
+        default.
+        """
+        now = time.monotonic()
+        timestamp = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            latest = dict(self._latest)
+            stale = {name for name, h in self._health.items() if h.stale}
+        values = {}
+        for ch in self.channels:
+            entry = latest.get(ch.name)
+            if entry is None or ch.name in stale or now - entry[1] > ch.max_age_s:
+                values[ch.name] = ch.default
+            else:
+                values[ch.name] = entry[0]
+        return {
+            "timestamp": timestamp,
+            "monotonic": now,
+            "values": values,
+        }
+
+    def max_deadline(self):
+        return max((ch.deadline_s for ch in self.channels), default=0.0)
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+
+
+class Scheduler:
+    """
+    Deadline-based scheduler on the monotonic clock.
+
+    Each job's next deadline is its previous deadline plus its interval, so
+    slow jobs do not shift the cadence. Deadlines that were missed entirely
+    are skipped instead of being run back to back. Waiting happens on
+    `stop_event`, so setting it (e.g. from a signal handler) stops `run()`
+    immediately.
+
+    `on_job(name, late_s, seconds)` is called after every job with how late
+    it started and how long it ran. `set_interval()` changes a job's
+    interval while running (call it from a job, `run()` is not locked).
+    """
+
+    def __init__(self, stop_event, on_job=None):
+        self.stop_event = stop_event
+        self.on_job = on_job
+        self._jobs = []
+        self._seq = 0
+
+    def every(self, interval_s, fn, name=None, start_delay=0.0):
+        if interval_s <= 0:
+            raise ValueError(f"interval must be positive, got {interval_s}")
+        due = time.monotonic() + start_delay
+        self._seq += 1
+        heapq.heappush(self._jobs, (due, self._seq, interval_s, fn, name or repr(fn)))
+
+    def run(self):
+        while self._jobs and not self.stop_event.is_set():
+            due, seq, interval_s, fn, name = self._jobs[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                if self.stop_event.wait(delay):
+                    break
+                continue
+
+            heapq.heappop(self._jobs)
+            started = time.monotonic()
+            try:
+                fn()
+            except Exception as e:
+                log.warning(f"Scheduled job {name} failed: {e}")
+            if self.on_job is not None:
+                self.on_job(name, started - due, time.monotonic() - started)
+
+            next_due = due + interval_s
+            now = time.monotonic()
+            if next_due <= now:
+                missed = int((now - next_due) // interval_s) + 1
+                log.debug(f"{name}: skipped {missed} missed deadline(s)")
+                next_due += missed * interval_s
+            heapq.heappush(self._jobs, (next_due, seq, interval_s, fn, name))
+
+    def set_interval(self, name, interval_s):
+        """
+        Run job `name` every `interval_s` from now on. The next deadline
+        moves as if the job had always had the new interval, but never into
+        the past, so speeding up takes effect at once.
+        """
+        if interval_s <= 0:
+            raise ValueError(f"interval must be positive, got {interval_s}")
+        now = time.monotonic()
+        for i, (due, seq, old_s, fn, job_name) in enumerate(self._jobs):
+            if job_name == name and old_s != interval_s:
+                self._jobs[i] = (max(now, due - old_s + interval_s), seq, interval_s, fn, job_name)
+                heapq.heapify(self._jobs)
+                return
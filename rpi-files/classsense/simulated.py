@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Simulated sensors and display, so the client runs on any Linux box.
+
+Every registered driver gets a `sim_<name>` twin (`sim_ltr559`,
+`sim_sgp30`, `sim_noise_fft`, ...) with the same channel, declarations and
+payload fields. Instead of a device it reads from a trace shared by all
+simulated drivers:
+
+- a recording: `[simulate] trace` is a JSON Lines file with one payload
+  (or just its `sensors` dict) per line, e.g. exported from the outbox or
+  the server, replayed at its recorded pace (`speed` times faster) and
+  looped;
+- otherwise synthetic lesson-like data: daylight, CO2 building up during
+  a lesson and aired out in the break, slow temperature drift and noisy
+  speech levels.
+
+Reads take the real driver's declared `read_latency_s` (times
+`latency_scale`, with `latency_jitter`), and faults can be injected: a
+read fails with probability `fail_rate` or hangs for `hang_seconds` with
+probability `hang_rate` (per channel: `fail_rate_<channel>`,
+`hang_rate_<channel>`).
+
+`SimulatedDisplay` stands in for the ST7735 and takes as long as the SPI
+transfers would.
+"""
+
+import json
+import math
+import time
+import bisect
+import random
+import logging
+import threading
+from datetime import datetime
+
+from classsense import drivers
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+try:
+    from PIL import Image
+except Exception:
+    Image = None
+
+log = logging.getLogger("ClassSense.simulated")
+
+OCTAVE_LABELS = ["63", "125", "250", "500", "1000", "2000", "4000", "8000"]
+
+# Sensors fields -> channel value, per real driver
+_VALUES = {
+    "ltr559": lambda f: f["brightness_lux"],
+    "bme280": lambda f: f["temperature_c"],
+    "sgp30": lambda f: (f["eco2_ppm"], f.get("voc_ppb", float("nan"))),
+    "noise": lambda f: {
+        "leq": f["noise_db"],
+        "lmax": f.get("noise_lmax_db", f["noise_db"]),
+        "lmin": f.get("noise_lmin_db", f["noise_db"]),
+        "l10": f.get("noise_l10_db", f["noise_db"]),
+        "l90": f.get("noise_l90_db", f["noise_db"]),
+    },
+    "noise_fft": lambda f: {"laeq": f["noise_db"], "bands": f.get("noise_bands_db") or {}},
+    "noise_enviroplus": lambda f: f["noise_db"],
+}
+
+
+class SyntheticTrace:
+    """Lesson-like readings as a function of the time since start."""
+
+    LESSON_S = 45 * 60
+    BREAK_S = 15 * 60
+
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def fields(self, t):
+        with self._lock:
+            g = self.rng.gauss
+            cycle = t % (self.LESSON_S + self.BREAK_S)
+            if cycle < self.LESSON_S:
+                eco2 = 450.0 + 900.0 * cycle / self.LESSON_S
+                speech = 58.0
+            else:
+                # Windows open: back to outdoor levels within minutes
+                peak = 1350.0
+                eco2 = 450.0 + (peak - 450.0) * math.exp(-(cycle - self.LESSON_S) / 180.0)
+                speech = 42.0
+            leq = speech + g(0, 3)
+            return {
+                "brightness_lux": max(0.0, 350.0 + 150.0 * math.sin(2 * math.pi * t / 86400.0) + g(0, 5)),
+                "eco2_ppm": round(eco2 + g(0, 10)),
+                "voc_ppb": round(max(0.0, 0.3 * (eco2 - 400.0) + g(0, 5))),
+                "temperature_c": 21.0 + 1.5 * math.sin(2 * math.pi * t / 7200.0) + g(0, 0.05),
+                "noise_db": leq,
+                "noise_lmax_db": leq + 12.0 + abs(g(0, 3)),
+                "noise_lmin_db": leq - 10.0 - abs(g(0, 2)),
+                "noise_l10_db": leq + 4.0,
+                "noise_l90_db": leq - 6.0,
+                "noise_bands_db": {
+                    label: round(leq - 3.0 * abs(i - 3) + g(0, 1), 1)
+                    for i, label in enumerate(OCTAVE_LABELS)
+                },
+            }
+
+
+class RecordedTrace:
+    """Replays recorded `sensors` dicts at their recorded pace, looped."""
+
+    def __init__(self, path, speed=1.0):
+        self.rows = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                row = json.loads(line)
+                self.rows.append((row.get("timestamp"), row.get("sensors", row)))
+        if not self.rows:
+            raise ValueError(f"Trace {path} is empty")
+        self.offsets = self._offsets()
+        self.span_s = self.offsets[-1] + (self.offsets[1] if len(self.offsets) > 1 else 1.0)
+        self.speed = speed
+
+    def _offsets(self):
+        try:
+            times = [datetime.fromisoformat(ts).timestamp() for ts, _ in self.rows]
+        except (TypeError, ValueError):
+            # No usable timestamps: one row per second
+            return [float(i) for i in range(len(self.rows))]
+        return [t - times[0] for t in times]
+
+    def fields(self, t):
+        t = (t * self.speed) % self.span_s
+        i = max(0, bisect.bisect_right(self.offsets, t) - 1)
+        return self.rows[i][1]
+
+
+_traces = {}
+_traces_lock = threading.Lock()
+
+
+def shared_trace(cfg):
+    """The trace all simulated drivers read, created on first use."""
+    path = cfg.get("simulate", "trace", fallback="").strip()
+    with _traces_lock:
+        entry = _traces.get(path)
+        if entry is None:
+            if path:
+                trace = RecordedTrace(path, speed=cfg.getfloat("simulate", "speed", fallback=1.0))
+            else:
+                seed = cfg.get("simulate", "seed", fallback="").strip()
+                trace = SyntheticTrace(seed=int(seed) if seed else None)
+            entry = _traces[path] = (trace, time.monotonic())
+        return entry
+
+
+class SimulatedDriver(drivers.Driver):
+    """Base of the generated `sim_<name>` drivers; `real_cls` is the twin."""
+
+    real_cls = None
+
+    def __init__(self, cfg, **options):
+        super().__init__(cfg)
+        # The real driver only provides declarations and payload fields
+        self.real = self.real_cls(cfg, **options)
+        self.metrics = self.real.metrics
+        self.to_value = _VALUES[self.real_cls.name]
+        self.rng = random.Random()
+        channel = self.channel
+        self.latency_scale = cfg.getfloat("simulate", "latency_scale", fallback=1.0)
+        self.latency_jitter = cfg.getfloat("simulate", "latency_jitter", fallback=0.2)
+        self.fail_rate = cfg.getfloat(
+            "simulate", f"fail_rate_{channel}",
+            fallback=cfg.getfloat("simulate", "fail_rate", fallback=0.0),
+        )
+        self.hang_rate = cfg.getfloat(
+            "simulate", f"hang_rate_{channel}",
+            fallback=cfg.getfloat("simulate", "hang_rate", fallback=0.0),
+        )
+        self.hang_s = cfg.getfloat("simulate", "hang_seconds", fallback=5.0)
+        self.trace = None
+
+    def _sleep(self, seconds):
+        jitter = 1.0 + self.rng.uniform(-self.latency_jitter, self.latency_jitter)
+        time.sleep(max(0.0, seconds * self.latency_scale * jitter))
+
+    def open(self):
+        self._sleep(self.init_cost_s)
+        self.trace, self.started = shared_trace(self.cfg)
+
+    def read(self):
+        if self.trace is None:
+            raise RuntimeError(f"{self.label} not available")
+        roll = self.rng.random()
+        if roll < self.hang_rate:
+            time.sleep(self.hang_s)
+        elif roll < self.hang_rate + self.fail_rate:
+            self._sleep(self.read_latency_s)
+            raise IOError(f"{self.label}: injected read failure")
+        self._sleep(self.read_latency_s)
+        return self.to_value(self.trace.fields(time.monotonic() - self.started))
+
+    def extra_fields(self, value):
+        return self.real.extra_fields(value)
+
+
+def _simulate(real_cls):
+    attrs = {
+        "name": "sim_" + real_cls.name,
+        "real_cls": real_cls,
+        "label": f"{real_cls.label} (simulated)",
+    }
+    for key in ("channel", "init_cost_s", "read_latency_s", "native_rate_hz", "rate_hz", "default"):
+        attrs[key] = getattr(real_cls, key)
+    return drivers.register(type("Simulated" + real_cls.__name__, (SimulatedDriver,), attrs))
+
+
+for _cls in drivers.registered():
+    if _cls.name in _VALUES:
+        _simulate(_cls)
+
+
+class SimulatedDisplay:
+    """
+    ST7735 stand-in (160x80 in landscape) that keeps no pixels but spends
+    the time the SPI transfers take at `spi_speed_hz`.
+    """
+
+    def __init__(self, rotation=90, spi_speed_hz=4000000):
+        if np is None:
+            raise RuntimeError("numpy not available")
+        self.rotation = rotation
+        self.spi_speed_hz = spi_speed_hz
+        self.bytes_sent = 0
+
+    @property
+    def width(self):
+        return 80 if self.rotation in (0, 180) else 160
+
+    @property
+    def height(self):
+        return 160 if self.rotation in (0, 180) else 80
+
+    def begin(self):
+        pass
+
+    def set_window(self, x0=0, y0=0, x1=None, y1=None):
+        pass
+
+    def data(self, data):
+        self.bytes_sent += len(data)
+        time.sleep(len(data) * 8.0 / self.spi_speed_hz)
+
+    def image_to_data(self, image, rotation=0):
+        # The real driver calls image.convert(), so only PIL images work there
+        if Image is None or not isinstance(image, Image.Image):
+            raise TypeError(f"display needs a PIL image, got {type(image).__name__}")
+        # RGB565, as the real driver packs it
+        pixels = np.rot90(np.asarray(image)[..., :3], rotation // 90).astype(np.uint16)
+        rgb565 = ((pixels[..., 0] & 0xF8) << 8) | ((pixels[..., 1] & 0xFC) << 3) | (pixels[..., 2] >> 3)
+        return rgb565.astype(">u2").tobytes()
+
+    def display(self, image):
+        self.data(self.image_to_data(image, self.rotation))
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Spectral noise analysis: A-weighted level and octave / third-octave bands.
+
+Everything that does not depend on the audio is computed once in the
+constructor and reused for every frame: the Hann window, the power
+normalisation, the A-weighting curve and the band mask matrix. Each audio
+frame is transformed exactly once (frames are processed in batches with a
+single vectorized `rfft`), and its A-weighted power and band powers are
+kept in a small ring, so levels over a window are just means over that
+ring. That keeps it well within real time on a Pi Zero.
+"""
+
+import math
+import logging
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+log = logging.getLogger("ClassSense.spectrum")
+
+# Nominal centre frequencies (IEC 61260) used as band labels
+OCTAVE_NOMINAL = [31.5, 63, 125, 250, 500, 1000, 2000, 4000, 8000]
+THIRD_OCTAVE_NOMINAL = [
+    25, 31.5, 40, 50, 63, 80, 100, 125, 160, 200, 250, 315, 400, 500, 630, 800,
+    1000, 1250, 1600, 2000, 2500, 3150, 4000, 5000, 6300, 8000,
+]
+
+
+def a_weighting_db(freqs):
+    """IEC 61672 A-weighting in dB for an array of frequencies in Hz."""
+    f2 = np.square(np.asarray(freqs, dtype=np.float64))
+    ra = (12194.0 ** 2 * f2 * f2) / (
+        (f2 + 20.6 ** 2)
+        * np.sqrt((f2 + 107.7 ** 2) * (f2 + 737.9 ** 2))
+        * (f2 + 12194.0 ** 2)
+    )
+    with np.errstate(divide="ignore"):
+        return 20.0 * np.log10(ra) + 2.0
+
+
+class SpectralAnalyzer:
+    def __init__(self, samplerate=16000, fft_size=2048, bands="octave",
+                 history_s=60, db_offset=94.0):
+        if np is None:
+            raise RuntimeError("numpy not available")
+        if bands not in ("octave", "third-octave"):
+            raise ValueError(f"Unknown band set: {bands}")
+        self.samplerate = samplerate
+        self.fft_size = fft_size
+        self.db_offset = db_offset
+
+        freqs = np.fft.rfftfreq(fft_size, d=1.0 / samplerate)
+        self._window = np.hanning(fft_size).astype(np.float32)
+
+        # |X_k|^2 -> mean-square contribution of bin k (one-sided, Hann
+        # corrected); DC is dropped so a microphone offset does not count.
+        scale = np.full(freqs.shape, 2.0 / (fft_size * float(np.sum(np.square(self._window)))))
+        scale[0] = 0.0
+        if fft_size % 2 == 0:
+            scale[-1] /= 2.0
+        self._scale = scale
+        self._a_weights = scale * np.power(10.0, a_weighting_db(freqs) / 10.0)
+
+        nominal = OCTAVE_NOMINAL if bands == "octave" else THIRD_OCTAVE_NOMINAL
+        fraction = 1 if bands == "octave" else 3
+        labels, masks = [], []
+        for label in nominal:
+            k = round(fraction * math.log2(label / 1000.0))
+            centre = 1000.0 * 2.0 ** (k / fraction)
+            lo = centre * 2.0 ** (-0.5 / fraction)
+            hi = centre * 2.0 ** (0.5 / fraction)
+            if hi > samplerate / 2.0:
+                break
+            mask = (freqs >= lo) & (freqs < hi)
+            if not mask.any():
+                continue
+            labels.append(f"{label:g}")
+            masks.append(mask * scale)
+        self.band_labels = labels
+        self._band_matrix = np.array(masks).T  # bins x bands
+
+        frames = max(1, int(history_s * samplerate / fft_size))
+        self._a_ring = np.zeros(frames)
+        self._band_ring = np.zeros((frames, len(labels)))
+        self._pos = 0
+        self._filled = 0
+
+    @classmethod
+    def from_config(cls, cfg, db_offset=94.0):
+        return cls(
+            samplerate=cfg.getint("noise", "samplerate", fallback=16000),
+            fft_size=cfg.getint("noise", "fft_size", fallback=2048),
+            bands=cfg.get("noise", "bands", fallback="octave").strip(),
+            history_s=cfg.getfloat("noise", "history_seconds", fallback=60),
+            db_offset=db_offset,
+        )
+
+    def process(self, frames):
+        """Analyse a (k, fft_size) batch of audio frames, oldest first."""
+        k = frames.shape[0]
+        if k == 0:
+            return
+        spectrum = np.fft.rfft(frames * self._window, axis=1)
+        power = np.square(spectrum.real) + np.square(spectrum.imag)
+        a_power = power @ self._a_weights
+        band_power = power @ self._band_matrix
+
+        size = self._a_ring.shape[0]
+        if k >= size:
+            a_power, band_power, k = a_power[-size:], band_power[-size:], size
+        idx = (self._pos + np.arange(k)) % size
+        self._a_ring[idx] = a_power
+        self._band_ring[idx] = band_power
+        self._pos = (self._pos + k) % size
+        self._filled = min(size, self._filled + k)
+
+    def update(self, meter):
+        """Analyse all audio the meter captured since the last call."""
+        self.process(meter.read_new(self.fft_size))
+
+    def _db(self, power):
+        return max(0.0, 10.0 * math.log10(max(float(power), 1e-12)) + self.db_offset)
+
+    def levels(self, window_s):
+        """
+        A-weighted equivalent level and band levels over the last
+        `window_s` seconds:
+            {"laeq": dB(A), "bands": {"63": dB, "125": dB, ...}}
+        or None before the first frame.
+        """
+        size = self._a_ring.shape[0]
+        n = min(self._filled, max(1, int(window_s * self.samplerate / self.fft_size)))
+        if n == 0:
+            return None
+        idx = (self._pos - 1 - np.arange(n)) % size
+        band_power = self._band_ring[idx].mean(axis=0)
+        return {
+            "laeq": self._db(self._a_ring[idx].mean()),
+            "bands": {
+                label: round(self._db(p), 1)
+                for label, p in zip(self.band_labels, band_power)
+            },
+        }
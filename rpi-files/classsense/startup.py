@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Fast startup: independent init steps run concurrently, and every phase is
+timed.
+
+The sensors sit on different buses (I2C, SPI, audio) or at different I2C
+addresses and the network does not depend on any of them, so their init
+steps (including the imports of the libraries they need, which dominate on
+a Pi Zero) run in parallel threads. The total startup time is then that of
+the slowest step, not the sum of all of them.
+
+`report()` logs how long each phase took, `milestone()` logs the time from
+process start to events such as the first uploaded sample.
+"""
+
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger("ClassSense.startup")
+
+
+class Startup:
+    def __init__(self, started=None):
+        """`started` is the time.monotonic() at process start."""
+        self.started = time.monotonic() if started is None else started
+        self.phases = []
+        self._milestones = set()
+        self._lock = threading.Lock()
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def _add(self, name, seconds):
+        with self._lock:
+            self.phases.append((name, seconds))
+
+    def phase(self, name, fn):
+        """Run one step in the calling thread and time it."""
+        t0 = time.monotonic()
+        try:
+            return fn()
+        finally:
+            self._add(name, time.monotonic() - t0)
+
+    def run_parallel(self, steps):
+        """
+        Run {name: fn} concurrently and return {name: result}. A step that
+        raises is logged and its result is None.
+        """
+        results = {}
+        if not steps:
+            return results
+        with ThreadPoolExecutor(max_workers=len(steps), thread_name_prefix="init") as pool:
+            futures = {name: pool.submit(self.phase, name, fn) for name, fn in steps.items()}
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                    log.info(f"{name} ready.")
+                except Exception as e:
+                    log.error(f"{name} init failed: {e}")
+                    results[name] = None
+        return results
+
+    def report(self):
+        with self._lock:
+            phases = ", ".join(f"{name} {seconds:.2f} s" for name, seconds in self.phases)
+        log.info(f"Startup: {phases}; ready after {self.elapsed():.2f} s.")
+
+    def milestone(self, name):
+        """Log the time since process start the first time `name` happens."""
+        with self._lock:
+            if name in self._milestones:
+                return
+            self._milestones.add(name)
+        log.info(f"Startup: {name} after {self.elapsed():.2f} s.")
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+Local status endpoint for the kiosk browser and tools on the Pi.
+
+The readings the kiosk shows were taken on this Pi moments ago, so they
+are served from memory instead of taking a round trip through the web
+server (and they keep coming while the uplink is down):
+
+    GET /           a small live page (status.html) for the kiosk
+    GET /status     latest readings, channel health, uplink state and
+                    recent anomaly events, as JSON
+    GET /history    ?minutes=30&points=240&metrics=noise_db,eco2_ppm
+                    evenly spaced rows from the on-device history
+    GET /events     server-sent events: `sample` (the /status body) every
+                    push_seconds, `anomaly` as soon as one is detected
+
+on TCP (`[status] port`, localhost by default) and/or a Unix socket
+(`[status] socket`, e.g. `curl --unix-socket status.sock localhost/status`).
+
+Snapshots are only assembled when a client asks for one or an event
+stream is open; every stream has a small queue of its own and is dropped
+when it stops reading, so a stuck browser never holds up the loop.
+"""
+
+import os
+import json
+import math
+import time
+import queue
+import logging
+import threading
+import socketserver
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+log = logging.getLogger("ClassSense.status")
+
+PAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "status.html")
+
+# Comment line that keeps idle event streams (and proxies) open
+KEEPALIVE_S = 15.0
+
+
+def _clean(value):
+    """JSON-safe copy: nan and inf become null."""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {k: _clean(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_clean(v) for v in value]
+    return value
+
+
+def _dumps(value):
+    return json.dumps(_clean(value), separators=(",", ":"))
+
+
+class _Stream:
+    def __init__(self, size):
+        self.queue = queue.Queue(maxsize=size)
+        self.closed = False
+
+
+class StatusHub:
+    """
+    What the endpoint serves. `snapshot()` returns the current /status
+    body (without the events); `history` is an optional `HistoryStore`.
+    """
+
+    def __init__(self, snapshot, history=None, max_events=20, max_streams=8, stream_queue=32):
+        self.snapshot = snapshot
+        self.history = history
+        self.max_streams = max_streams
+        self.stream_queue = stream_queue
+        self._events = deque(maxlen=max_events)
+        self._streams = set()
+        self._lock = threading.Lock()
+
+    @property
+    def streams(self):
+        return len(self._streams)
+
+    def status(self):
+        body = self.snapshot()
+        with self._lock:
+            body["events"] = list(self._events)
+        return body
+
+    def history_rows(self, minutes=30.0, points=240, metrics=None):
+        if self.history is None:
+            return None
+        names = [m for m in (metrics or self.history.columns) if m in self.history.columns]
+        times, values = self.history.sample_rows(time.time() - minutes * 60.0, points, names)
+        return {
+            "t": [round(float(t), 3) for t in times],
+            "metrics": {name: [round(float(v), 2) for v in column] for name, column in values.items()},
+        }
+
+    # Event streams
+
+    def subscribe(self):
+        """A new stream, or None when `max_streams` are already open."""
+        with self._lock:
+            if len(self._streams) >= self.max_streams:
+                return None
+            stream = _Stream(self.stream_queue)
+            self._streams.add(stream)
+            return stream
+
+    def unsubscribe(self, stream):
+        with self._lock:
+            self._streams.discard(stream)
+
+    def _push(self, kind, data):
+        with self._lock:
+            streams = list(self._streams)
+        if not streams:
+            return
+        message = f"event: {kind}\ndata: {_dumps(data)}\n\n".encode("utf-8")
+        for stream in streams:
+            try:
+                stream.queue.put_nowait(message)
+            except queue.Full:
+                log.warning("Status stream not reading, closed.")
+                stream.closed = True
+                self.unsubscribe(stream)
+
+    def tick(self):
+        """Push the current snapshot to the open streams (scheduled job)."""
+        if self._streams:
+            self._push("sample", self.status())
+
+    def event(self, event):
+        """Keep an anomaly event and push it at once."""
+        with self._lock:
+            self._events.append(event)
+        self._push("anomaly", event)
+
+    def close(self):
+        with self._lock:
+            streams = list(self._streams)
+            self._streams.clear()
+        for stream in streams:
+            stream.closed = True
+            try:
+                stream.queue.put_nowait(None)
+            except queue.Full:
+                pass
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, fmt, *args):
+        log.debug(fmt % args)
+
+    def _send(self, code, body, content_type="application/json"):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        if self.server.allow_origin:
+            self.send_header("Access-Control-Allow-Origin", self.server.allow_origin)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        hub = self.server.hub
+        try:
+            if url.path == "/":
+                with open(PAGE, "rb") as f:
+                    self._send(200, f.read(), "text/html; charset=utf-8")
+            elif url.path == "/status":
+                self._send(200, _dumps(hub.status()))
+            elif url.path == "/history":
+                query = parse_qs(url.query)
+                metrics = query.get("metrics", [""])[0]
+                rows = hub.history_rows(
+                    minutes=float(query.get("minutes", ["30"])[0]),
+                    points=min(int(query.get("points", ["240"])[0]), 5000),
+                    metrics=[m for m in metrics.split(",") if m] or None,
+                )
+                if rows is None:
+                    self._send(404, _dumps({"error": "history disabled"}))
+                else:
+                    self._send(200, _dumps(rows))
+            elif url.path == "/events":
+                self._stream(hub)
+            else:
+                self._send(404, _dumps({"error": "not found"}))
+        except ValueError as e:
+            self._send(400, _dumps({"error": str(e)}))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _stream(self, hub):
+        stream = hub.subscribe()
+        if stream is None:
+            self._send(503, _dumps({"error": "too many event streams"}))
+            return
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-store")
+            if self.server.allow_origin:
+                self.send_header("Access-Control-Allow-Origin", self.server.allow_origin)
+            self.end_headers()
+            # The current state right away, then updates as they come
+            self.wfile.write(f"retry: 3000\nevent: sample\ndata: {_dumps(hub.status())}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            while not stream.closed:
+                try:
+                    message = stream.queue.get(timeout=KEEPALIVE_S)
+                except queue.Empty:
+                    message = b": keepalive\n\n"
+                if message is None:
+                    break
+                self.wfile.write(message)
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            pass
+        finally:
+            hub.unsubscribe(stream)
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class StatusServer:
+    """Serves a `StatusHub` on http://<bind>:<port>/ and/or a Unix socket."""
+
+    def __init__(self, hub, port=0, bind="127.0.0.1", socket_path="", allow_origin=""):
+        self.hub = hub
+        self.port = port
+        self.bind = bind
+        self.socket_path = socket_path
+        self.allow_origin = allow_origin
+        self._servers = []
+
+    @classmethod
+    def from_config(cls, cfg, hub):
+        return cls(
+            hub,
+            port=cfg.getint("status", "port", fallback=0),
+            bind=cfg.get("status", "bind", fallback="127.0.0.1").strip(),
+            socket_path=cfg.get("status", "socket", fallback="").strip(),
+            allow_origin=cfg.get("status", "allow_origin", fallback="").strip(),
+        )
+
+    @staticmethod
+    def enabled(cfg):
+        return (cfg.getint("status", "port", fallback=0) > 0
+                or bool(cfg.get("status", "socket", fallback="").strip()))
+
+    def _serve(self, httpd, name):
+        httpd.hub = self.hub
+        httpd.allow_origin = self.allow_origin
+        self._servers.append(httpd)
+        threading.Thread(target=httpd.serve_forever, name=name, daemon=True).start()
+
+    def start(self):
+        if self.port > 0:
+            httpd = ThreadingHTTPServer((self.bind, self.port), _Handler)
+            httpd.daemon_threads = True
+            self._serve(httpd, "status")
+            log.info(f"Status on http://{self.bind}:{httpd.server_address[1]}/")
+        if self.socket_path:
+            # A socket left behind by a previous run
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            self._serve(_UnixHTTPServer(self.socket_path, _Handler), "status-unix")
+            log.info(f"Status on unix:{self.socket_path}")
+
+    def close(self):
+        self.hub.close()
+        for httpd in self._servers:
+            httpd.shutdown()
+            httpd.server_close()
+        self._servers = []
+        if self.socket_path and os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Trend screen for the LCD: one sparkline per metric over the last minutes.
+
+Each metric keeps its history in a fixed-size float32 ring. The screen is
+rasterized with NumPy straight into one framebuffer array that is reused
+for every frame: the labels are drawn once, and each sparkline is a single
+broadcast comparison that fills the vertical span between neighbouring
+points of every column, so there are no per-pixel PIL calls.
+"""
+
+import time
+import logging
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+try:
+    from PIL import Image, ImageDraw
+except Exception:
+    Image = None
+    ImageDraw = None
+
+log = logging.getLogger("ClassSense.trend")
+
+LINE_COLOR = (80, 200, 255)
+RISING_COLOR = (255, 160, 40)
+LABEL_COLOR = (200, 200, 200)
+
+
+class MetricRing:
+    """Fixed-capacity ring of float32 samples; missing values are nan."""
+
+    def __init__(self, capacity):
+        self._data = np.full(capacity, np.nan, dtype=np.float32)
+        self._pos = 0
+        self._count = 0
+
+    def append(self, value):
+        self._data[self._pos] = np.nan if value is None else value
+        self._pos = (self._pos + 1) % self._data.shape[0]
+        self._count = min(self._data.shape[0], self._count + 1)
+
+    def values(self):
+        """Samples oldest first (a view unless the ring has wrapped)."""
+        if self._count < self._data.shape[0]:
+            return self._data[:self._count]
+        return np.concatenate((self._data[self._pos:], self._data[:self._pos]))
+
+
+class TrendMetric:
+    """
+    `min_span` is the smallest y range shown, so sensor noise on a flat
+    signal does not fill the whole plot.
+    """
+
+    def __init__(self, key, label, min_span=1.0):
+        self.key = key
+        self.label = label
+        self.min_span = min_span
+
+
+class TrendView:
+    def __init__(self, width, height, metrics, font, minutes=30, period_s=10, label_w=40):
+        if np is None or Image is None:
+            raise RuntimeError("numpy / PIL not available")
+        self.width = width
+        self.height = height
+        self.metrics = list(metrics)
+        self.minutes = minutes
+        capacity = max(2, int(minutes * 60 / period_s))
+        self._rings = {m.key: MetricRing(capacity) for m in self.metrics}
+        self._history = None
+        self._columns = {}
+
+        self.frame = np.zeros((height, width, 3), dtype=np.uint8)
+        self._row_h = height // len(self.metrics)
+        self._plot_x = label_w
+        self._plot_w = width - label_w - 1
+
+        # Labels are static: draw them once
+        labels = Image.new("RGB", (label_w, height), (0, 0, 0))
+        draw = ImageDraw.Draw(labels)
+        for i, m in enumerate(self.metrics):
+            draw.text((2, i * self._row_h + 1), m.label, font=font, fill=LABEL_COLOR)
+        self.frame[:, :label_w] = np.asarray(labels)
+
+    def follow(self, history, columns):
+        """
+        Draw metrics from a `HistoryStore` instead of the rings; `columns`
+        maps metric keys to history columns. The trend then has the
+        history's resolution and survives restarts.
+        """
+        self._history = history
+        self._columns = {m.key: columns[m.key] for m in self.metrics if m.key in columns}
+
+    def append(self, values):
+        for m in self.metrics:
+            if m.key not in self._columns:
+                self._rings[m.key].append(values.get(m.key))
+
+    def _series(self, metric):
+        column = self._columns.get(metric.key)
+        if column is None:
+            return self._rings[metric.key].values()
+        return self._history.sample(column, time.time() - self.minutes * 60, self._plot_w)
+
+    def render(self):
+        """Redraw all sparklines into `frame` and return it."""
+        plot = self.frame[:, self._plot_x:self._plot_x + self._plot_w]
+        plot[:] = 0
+        for i, m in enumerate(self.metrics):
+            top = i * self._row_h + 1
+            self._sparkline(plot[top:top + self._row_h - 2], self._series(m), m)
+        return self.frame
+
+    def _sparkline(self, area, series, metric):
+        h, w = area.shape[0], area.shape[1]
+        n = series.shape[0]
+        if n == 0 or h < 2:
+            return
+        # One sample per column, newest at the right edge
+        if n > w:
+            series = series[(np.arange(w) * n) // w]
+            n = w
+        valid = ~np.isnan(series)
+        if not valid.any():
+            return
+
+        lo = float(np.nanmin(series))
+        hi = float(np.nanmax(series))
+        span = max(hi - lo, metric.min_span)
+        mid = (hi + lo) / 2.0
+        y = (h - 1) - np.round((series - (mid - span / 2.0)) / span * (h - 1))
+        y = np.clip(np.nan_to_num(y, nan=0.0), 0, h - 1).astype(np.int16)
+
+        # Connect each point to its left neighbour with a vertical span
+        prev = np.concatenate((y[:1], y[:-1]))
+        prev_valid = np.concatenate((valid[:1], valid[:-1]))
+        prev = np.where(prev_valid, prev, y)
+        top = np.minimum(y, prev)
+        bottom = np.maximum(y, prev)
+
+        rows = np.arange(h, dtype=np.int16)[:, None]
+        mask = (rows >= top[None, :]) & (rows <= bottom[None, :]) & valid[None, :]
+
+        first = series[valid][0]
+        last = series[valid][-1]
+        color = RISING_COLOR if last - first > metric.min_span / 2.0 else LINE_COLOR
+        area[:, w - n:][mask] = color
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+Background uploader.
+
+The sampling loop only puts payloads into a bounded in-memory queue; a
+dedicated thread drains it and does the HTTP requests, so a slow or
+unreachable server never stalls sampling or the LCD.
+
+With `batch_size > 1` the thread waits for that many payloads and hands
+them to `send` together, so they can go out in one request.
+
+With an `Outbox`, payloads that fail to upload are written to disk instead
+of being dropped. While the outbox holds a backlog, new payloads are
+appended behind it and everything is replayed in order, `replay_batch`
+payloads per request and at most one request per `replay_interval_s`.
+Only failures that may pass (no connection, timeouts, 408, 429 and 5xx)
+are kept. A sample the server refuses with another 4xx would be refused
+again, so it is dropped and counted instead of blocking the backlog; a
+refused batch is sent again one sample at a time to find it.
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+
+log = logging.getLogger("ClassSense.uploader")
+
+OVERFLOW_POLICIES = ("drop-oldest", "coalesce")
+
+
+def _rejected(error):
+    """True if the server refused the samples themselves (4xx but 408 / 429)."""
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status is not None and 400 <= status < 500 and status not in (408, 429)
+
+
+class Uploader:
+    """
+    Bounded queue + worker thread around a `send(payloads)` callable,
+    which receives a list of at most `batch_size` payloads, oldest first.
+
+    Overflow policies when the queue is full:
+      * drop-oldest: discard the oldest queued payload.
+      * coalesce:    replace the newest queued payload with the incoming one,
+                     so the backlog is kept and the freshest reading still
+                     goes out.
+    """
+
+    def __init__(self, send, max_queue=100, overflow="drop-oldest", drain_timeout_s=10.0,
+                 batch_size=1, outbox=None, replay_batch=50, replay_interval_s=2.0,
+                 retry_interval_s=30.0):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.send = send
+        self.batch_size = max(1, batch_size)
+        self.max_queue = max(self.batch_size, max_queue)
+        self.overflow = overflow
+        self.drain_timeout_s = drain_timeout_s
+        self.outbox = outbox
+        self.replay_batch = max(1, replay_batch)
+        self.replay_interval_s = replay_interval_s
+        self.retry_interval_s = retry_interval_s
+        self._next_replay_at = 0.0
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+        # Set by stop(); an HttpClient waiting on it stops retrying
+        self.stop_event = threading.Event()
+
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_config(cls, cfg, send, batch_size=1, outbox=None):
+        return cls(
+            send,
+            batch_size=batch_size,
+            max_queue=cfg.getint("upload", "queue_size", fallback=100),
+            overflow=cfg.get("upload", "overflow", fallback="drop-oldest").strip(),
+            drain_timeout_s=cfg.getfloat("upload", "drain_seconds", fallback=10.0),
+            outbox=outbox,
+            replay_batch=cfg.getint("outbox", "replay_batch", fallback=50),
+            replay_interval_s=cfg.getfloat("outbox", "replay_interval_seconds", fallback=2.0),
+            retry_interval_s=cfg.getfloat("outbox", "retry_seconds", fallback=30.0),
+        )
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="uploader", daemon=True)
+        self._thread.start()
+
+    def put(self, payload):
+        """Queue a payload without blocking. Returns False if one was dropped."""
+        with self._cond:
+            accepted = True
+            if len(self._queue) >= self.max_queue:
+                self.dropped += 1
+                accepted = False
+                if self.overflow == "coalesce":
+                    self._queue[-1] = payload
+                    log.debug("Upload queue full, coalesced into newest entry")
+                    return accepted
+                self._queue.popleft()
+                log.debug("Upload queue full, dropped oldest entry")
+            self._queue.append(payload)
+            self._cond.notify()
+            return accepted
+
+    def depth(self):
+        with self._cond:
+            return len(self._queue)
+
+    def stop(self):
+        """
+        Stop accepting work and drain what is queued, for at most
+        `drain_timeout_s` seconds. With an outbox the queue is written to
+        disk instead, to be sent after the restart.
+        """
+        with self._cond:
+            self._stopping = True
+            self.stop_event.set()
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(self.drain_timeout_s)
+            if self._thread.is_alive():
+                log.warning(f"Uploader did not drain in time, {self.depth()} sample(s) left")
+
+    def _backlog(self):
+        return self.outbox is not None and len(self.outbox) > 0
+
+    def _has_work(self):
+        if len(self._queue) >= self.batch_size:
+            return True
+        if self._backlog():
+            if time.monotonic() >= self._next_replay_at:
+                return True
+            return self.outbox.flush_due_in() == 0.0
+        return False
+
+    def _wait_timeout(self):
+        timeouts = []
+        if self._backlog():
+            timeouts.append(max(0.0, self._next_replay_at - time.monotonic()))
+        if self.outbox is not None:
+            flush_in = self.outbox.flush_due_in()
+            if flush_in is not None:
+                timeouts.append(flush_in)
+        return min(timeouts) if timeouts else None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping and not self._has_work():
+                    self._cond.wait(self._wait_timeout())
+                if self._stopping:
+                    break
+                if self._backlog():
+                    # Keep order: new payloads go behind the backlog
+                    batch = list(self._queue)
+                    self._queue.clear()
+                elif len(self._queue) >= self.batch_size:
+                    batch = [self._queue.popleft() for _ in range(self.batch_size)]
+                else:
+                    batch = []
+
+            if self._backlog():
+                self.outbox.extend(batch)
+                self._replay()
+                if self.outbox.flush_due_in() == 0.0:
+                    self.outbox.flush()
+            elif batch:
+                self._deliver(batch)
+
+        self._drain()
+
+    def _retry_in(self, error):
+        # Follow the circuit breaker's open time when it has one
+        retry_in_s = getattr(error, "retry_in_s", None)
+        return self.retry_interval_s if retry_in_s is None else retry_in_s
+
+    def _reject(self, batch, error):
+        self.rejected += len(batch)
+        log.error(f"Server rejected {len(batch)} sample(s), dropped: {error}")
+
+    def _send(self, payloads):
+        """
+        Send `payloads`. When the server refuses the batch they are sent one
+        by one, so only the refused samples are dropped. Returns how many
+        were sent or dropped, and the error that stopped the rest (or None).
+        """
+        try:
+            self.send(payloads)
+        except Exception as e:
+            if not _rejected(e):
+                return 0, e
+            if len(payloads) == 1:
+                self._reject(payloads, e)
+                return 1, None
+            for i, payload in enumerate(payloads):
+                _, error = self._send([payload])
+                if error is not None:
+                    return i, error
+            return len(payloads), None
+        self.sent += len(payloads)
+        return len(payloads), None
+
+    def _deliver(self, batch):
+        done, error = self._send(batch)
+        if error is None:
+            return
+        rest = batch[done:]
+        log.warning(f"POST failed: {error}")
+        if self.outbox is not None:
+            self.outbox.extend(rest)
+            self._next_replay_at = time.monotonic() + self._retry_in(error)
+            log.info(f"Server unreachable, {len(self.outbox)} sample(s) kept in outbox.")
+        else:
+            self.failed += len(rest)
+
+    def _replay(self):
+        if time.monotonic() < self._next_replay_at:
+            return
+        rows = self.outbox.peek(self.replay_batch)
+        if not rows:
+            return
+        done, error = self._send([payload for _, payload in rows])
+        if done:
+            self.outbox.ack(rows[:done])
+        if error is not None:
+            log.warning(f"Outbox replay failed: {error}")
+            self._next_replay_at = time.monotonic() + self._retry_in(error)
+            return
+        self._next_replay_at = time.monotonic() + self.replay_interval_s
+        if not len(self.outbox):
+            log.info("Outbox replay complete.")
+
+    def _drain(self):
+        with self._cond:
+            leftovers = list(self._queue)
+            self._queue.clear()
+
+        if self.outbox is not None:
+            self.outbox.extend(leftovers)
+            self.outbox.close()
+            return
+
+        for i in range(0, len(leftovers), self.batch_size):
+            self._deliver(leftovers[i:i + self.batch_size])
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+systemd integration: readiness and the service watchdog.
+
+With `Type=notify` and `WatchdogSec=` in the unit, systemd expects
+`READY=1` once the client is up and `WATCHDOG=1` at least every
+`WatchdogSec`, and restarts the service otherwise. The pings are sent from
+the scheduler thread and only while `check()` confirms that samples are
+still being published and `sensors_alive()` that not every sensor has
+gone silent, so a client whose loop is stuck, or that only publishes
+missing values, gets restarted (a single hung sensor is left to its
+reinits).
+
+`sd_notify` speaks the notify protocol directly over the datagram socket
+in $NOTIFY_SOCKET; outside systemd it does nothing.
+"""
+
+import os
+import socket
+import logging
+
+log = logging.getLogger("ClassSense.watchdog")
+
+
+def sd_notify(state):
+    """Send `state` (e.g. "READY=1") to systemd; False when not under systemd."""
+    addr = os.environ.get("NOTIFY_SOCKET")
+    if not addr:
+        return False
+    if addr.startswith("@"):
+        addr = "\0" + addr[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            # Never block the scheduler on a busy socket
+            sock.setblocking(False)
+            sock.connect(addr)
+            sock.sendall(state.encode("utf-8"))
+        return True
+    except OSError as e:
+        log.debug(f"sd_notify failed: {e}")
+        return False
+
+
+def sensors_alive(health, max_silence_s):
+    """
+    False when every channel in `health` (`SamplingEngine.health()`) is
+    stale and has had no good read for more than `max_silence_s`.
+    """
+    return not health or any(
+        not h["stale"] or h["since_read_s"] <= max_silence_s for h in health.values()
+    )
+
+
+class SystemdWatchdog:
+    def __init__(self, check=None):
+        """`check()` returns False when the client should be considered stuck."""
+        self.check = check
+        self.interval_s = None
+        usec = os.environ.get("WATCHDOG_USEC")
+        pid = os.environ.get("WATCHDOG_PID")
+        if usec and (not pid or int(pid) == os.getpid()):
+            self.interval_s = int(usec) / 1e6
+
+    def ready(self):
+        sd_notify("READY=1")
+
+    def ping(self):
+        if self.check is not None and not self.check():
+            log.warning("No samples published or no sensor read lately, not feeding the systemd watchdog.")
+            return
+        sd_notify("WATCHDOG=1")
+
+    def schedule(self, scheduler):
+        if self.interval_s:
+            # Ping at half the timeout, as sd_watchdog_enabled(3) advises
+            scheduler.every(self.interval_s / 2.0, self.ping, name="watchdog")
+
+    def stopping(self):
+        sd_notify("STOPPING=1")
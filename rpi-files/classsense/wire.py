@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Compact binary wire format for samples (MessagePack, schema v1).
+
+A batch is encoded as one MessagePack array
+
+    [schema_version, shared, samples]
+
+- Map keys that appear in the schema's key table (the fields of
+  `data_schema.json` and the later payload fields) are sent as small
+  integers at any depth; other keys stay strings.
+- Top-level fields with the same value in every sample of the batch
+  (`device_id`, `class_pin`, the `meta` block, ...) are sent once in
+  `shared` instead of once per sample.
+
+The content type carries the schema version, so the server can refuse a
+version it does not know with 415 and the client falls back to JSON. The
+key table of a version never changes; new keys need a new version (keep
+`webserver/server.js` in sync).
+"""
+
+import logging
+
+try:
+    import msgpack
+except Exception:
+    msgpack = None
+
+log = logging.getLogger("ClassSense.wire")
+
+SCHEMA_VERSION = 1
+CONTENT_TYPE = f"application/vnd.classsense+msgpack; v={SCHEMA_VERSION}"
+
+KEYS_V1 = [
+    # data_schema.json
+    "device_id", "timestamp", "class_pin", "sensors", "meta", "app", "version",
+    "brightness_lux", "eco2_ppm", "voc_ppb", "temperature_c", "noise_db",
+    # noise levels and bands
+    "noise_lmax_db", "noise_lmin_db", "noise_l10_db", "noise_l90_db", "noise_bands_db",
+    # [aggregate] summaries
+    "stats", "start", "end", "metrics", "n", "min", "max", "mean", "std", "p95",
+    # [deadband]
+    "heartbeat_s",
+]
+KEY_IDS = {key: i for i, key in enumerate(KEYS_V1)}
+
+
+def available():
+    return msgpack is not None
+
+
+def _compact(obj):
+    """Replace known map keys by their ids, at any depth."""
+    out = {}
+    for key, value in obj.items():
+        kind = type(value)
+        if kind is dict:
+            value = _compact(value)
+        elif kind is list or kind is tuple:
+            value = [_compact(v) if type(v) is dict else v for v in value]
+        out[KEY_IDS.get(key, key)] = value
+    return out
+
+
+def encode_batch(payloads):
+    """Encode samples (oldest first) as one schema v1 MessagePack document."""
+    if msgpack is None:
+        raise RuntimeError("msgpack not available")
+    shared = {}
+    if len(payloads) > 1:
+        first = payloads[0]
+        for key, value in first.items():
+            if all(key in p and p[key] == value for p in payloads[1:]):
+                shared[key] = value
+    samples = [{k: v for k, v in p.items() if k not in shared} for p in payloads]
+    return msgpack.packb(
+        [SCHEMA_VERSION, _compact(shared), [_compact(p) for p in samples]],
+        use_bin_type=True,
+    )
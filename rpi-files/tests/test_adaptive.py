@@ -0,0 +1,76 @@
+import pytest
+
+from classsense.adaptive import Activity, AdaptiveRate, parse_rule
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.jobs = {}
+        self.intervals = {}
+
+    def every(self, interval_s, fn, name=None, **kwargs):
+        self.jobs[name] = fn
+
+    def set_interval(self, name, interval_s):
+        self.intervals[name] = interval_s
+
+
+class FakeChannel:
+    def __init__(self, rate_hz):
+        self.rate_hz = rate_hz
+
+    @property
+    def interval_s(self):
+        return 1.0 / self.rate_hz
+
+
+class FakeEngine:
+    def __init__(self, rates):
+        self.channels = {name: FakeChannel(rate) for name, rate in rates.items()}
+
+    def channel(self, name):
+        return self.channels[name]
+
+
+def test_activity_std_and_slope():
+    activity = Activity(window_s=10)
+    for t in range(10):
+        activity.add(100.0 + t, 2.0 * t)
+    assert activity.slope() == pytest.approx(2.0)
+    assert activity.std() > 0
+    activity.expire(125.0)
+    assert activity.n == 0
+
+
+def test_parse_rule():
+    rule = parse_rule("noise_db", "noise", None, "std 4, slope 30, hz 0.5-2")
+    assert (rule.std, rule.slope_per_min, rule.floor_hz, rule.ceiling_hz) == (4.0, 30.0, 0.5, 2.0)
+    with pytest.raises(ValueError):
+        parse_rule("noise_db", "noise", None, "hz 2-1")
+    with pytest.raises(ValueError):
+        parse_rule("noise_db", "noise", None, "jitter 3")
+
+
+def test_stable_room_slows_publishing_and_resizes_windows():
+    rule = parse_rule("noise_db", "noise", None, "std 4, hz 0.5-2")
+    adaptive = AdaptiveRate([rule], {"noise": 2.0}, fast_period_s=10, slow_period_s=60, hold_s=30)
+    # Skip the initial hold
+    adaptive._active_until["noise_db"] = 0.0
+    scheduler = FakeScheduler()
+    periods = []
+    engine = FakeEngine({"noise": 2.0})
+    adaptive.schedule(scheduler, engine, on_period=periods.append)
+    for _ in range(5):
+        adaptive.add("noise", 50.0)
+    scheduler.jobs["adaptive"]()
+    scheduler.jobs["adaptive"]()
+    assert scheduler.intervals["publish"] == 60
+    assert engine.channel("noise").rate_hz == 0.5
+    assert scheduler.intervals["noise"] == 2.0
+    assert periods == [60]
+    for x in (40.0, 60.0, 40.0, 60.0):
+        adaptive.add("noise", x)
+    scheduler.jobs["adaptive"]()
+    assert scheduler.intervals["publish"] == 10
+    assert engine.channel("noise").rate_hz == 2.0
+    assert periods == [60, 10]
@@ -0,0 +1,74 @@
+import math
+import random
+import statistics
+
+from classsense.aggregate import P2Quantile, RunningStats, WindowAggregator
+
+
+def exact_quantile(values, p):
+    s = sorted(values)
+    pos = p * (len(s) - 1)
+    lo = int(pos)
+    hi = min(lo + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (pos - lo)
+
+
+def test_p2_close_to_exact_quantile():
+    rng = random.Random(7)
+    values = [rng.gauss(45.0, 8.0) for _ in range(5000)]
+    estimate = P2Quantile(0.95)
+    for x in values:
+        estimate.add(x)
+    assert abs(estimate.value() - exact_quantile(values, 0.95)) < 0.5
+
+
+def test_p2_exact_with_few_samples():
+    estimate = P2Quantile(0.5)
+    assert estimate.value() is None
+    for x in (3.0, 1.0, 2.0):
+        estimate.add(x)
+    assert estimate.value() == 2.0
+
+
+def test_running_stats_match_batch_statistics():
+    rng = random.Random(3)
+    values = [1e6 + rng.uniform(-1.0, 1.0) for _ in range(1000)]
+    stats = RunningStats()
+    for x in values:
+        stats.add(x)
+    summary = stats.summary(digits=6)
+    assert summary["n"] == 1000
+    assert summary["min"] == round(min(values), 6)
+    assert summary["max"] == round(max(values), 6)
+    assert math.isclose(summary["mean"], statistics.fmean(values), abs_tol=1e-6)
+    assert math.isclose(summary["std"], statistics.stdev(values), rel_tol=1e-4)
+
+
+def test_running_stats_ignore_missing_readings():
+    stats = RunningStats()
+    assert stats.summary() is None
+    for x in (None, math.nan, 4.0):
+        stats.add(x)
+    assert stats.summary() == {"n": 1, "min": 4.0, "max": 4.0, "mean": 4.0, "std": 0.0, "p95": 4.0}
+
+
+def test_window_flush_summarises_and_resets():
+    aggregator = WindowAggregator({
+        "noise_db": ("noise", None),
+        "eco2_ppm": ("voc", lambda v: v["eco2"]),
+    })
+    for x in (40.0, 50.0, 60.0):
+        aggregator.add("noise", x)
+    aggregator.add("voc", {"eco2": 420})
+    aggregator.add("voc", {"tvoc": 3})
+    aggregator.add("unknown", 1.0)
+
+    window = aggregator.flush()
+    assert window["start"] <= window["end"]
+    assert window["metrics"]["noise_db"]["n"] == 3
+    assert window["metrics"]["noise_db"]["mean"] == 50.0
+    assert window["metrics"]["eco2_ppm"]["n"] == 1
+
+    following = aggregator.flush()
+    assert following["start"] == window["end"]
+    assert following["metrics"] == {"noise_db": None, "eco2_ppm": None}
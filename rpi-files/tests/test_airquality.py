@@ -0,0 +1,87 @@
+import json
+import time
+import types
+
+import pytest
+
+from classsense.airquality import AirQualitySensor
+
+
+class FakeSGP30:
+    def __init__(self, fail=False):
+        if fail:
+            raise OSError("no device at 0x58")
+        self.baseline = None
+        self.started = False
+
+    def start_measurement(self):
+        self.started = True
+
+    def set_baseline(self, eco2, tvoc):
+        self.baseline = (eco2, tvoc)
+
+    def get_baseline(self):
+        return types.SimpleNamespace(equivalent_co2=0x8A3E, total_voc=0x8C12)
+
+    def get_air_quality(self):
+        return types.SimpleNamespace(equivalent_co2=450, total_voc=12)
+
+
+def warmed_up(sensor):
+    sensor.start()
+    sensor._thread.join(2.0)
+    return sensor
+
+
+def write_baseline(path, age_s):
+    path.write_text(json.dumps({"eco2": 0x8A00, "tvoc": 0x8C00, "saved_at": time.time() - age_s}))
+
+
+def test_reads_fail_while_warming_up():
+    sensor = AirQualitySensor(FakeSGP30)
+    assert sensor.warming_up
+    with pytest.raises(RuntimeError):
+        sensor.get_air_quality()
+    warmed_up(sensor)
+    assert sensor.ready and not sensor.warming_up
+    assert sensor.get_air_quality().equivalent_co2 == 450
+
+
+def test_failed_warm_up():
+    sensor = warmed_up(AirQualitySensor(lambda: FakeSGP30(fail=True)))
+    assert not sensor.ready and not sensor.warming_up
+    with pytest.raises(RuntimeError, match="not available"):
+        sensor.get_air_quality()
+
+
+def test_restores_a_recent_baseline(tmp_path):
+    path = tmp_path / "baseline.json"
+    write_baseline(path, age_s=3600)
+    sensor = warmed_up(AirQualitySensor(FakeSGP30, baseline_path=str(path)))
+    assert sensor.sensor.baseline == (0x8A00, 0x8C00)
+
+
+def test_ignores_an_old_baseline(tmp_path):
+    path = tmp_path / "baseline.json"
+    write_baseline(path, age_s=8 * 86400)
+    sensor = warmed_up(AirQualitySensor(FakeSGP30, baseline_path=str(path)))
+    assert sensor.sensor.baseline is None
+
+
+def test_first_save_waits_for_a_learned_baseline(tmp_path):
+    path = tmp_path / "baseline.json"
+    sensor = warmed_up(AirQualitySensor(FakeSGP30, baseline_path=str(path), first_save_after_s=3600))
+    sensor.save_baseline()
+    assert not path.exists()
+    sensor.first_save_after_s = 0
+    sensor.save_baseline()
+    saved = json.loads(path.read_text())
+    assert (saved["eco2"], saved["tvoc"]) == (0x8A3E, 0x8C12)
+
+
+def test_saves_at_once_after_a_restore(tmp_path):
+    path = tmp_path / "baseline.json"
+    write_baseline(path, age_s=60)
+    sensor = warmed_up(AirQualitySensor(FakeSGP30, baseline_path=str(path)))
+    sensor.close()
+    assert json.loads(path.read_text())["eco2"] == 0x8A3E
@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from classsense.anomaly import AnomalyDetector, Detector, parse_detector
+
+
+def feed(detector, values, start=0.0):
+    hits = []
+    for i, x in enumerate(values):
+        hit = detector.update(x, start + i)
+        if hit is not None:
+            hits.append((i, hit))
+    return hits
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_no_false_alarm_after_warmup(seed):
+    rng = random.Random(seed)
+    detector = Detector("eco2_ppm", direction="both", cooldown_s=0)
+    hits = feed(detector, [rng.gauss(600, 10) for _ in range(300)])
+    # Stationary noise: at most a rare z-score just above the threshold,
+    # never a CUSUM built from a zero warm-up variance
+    assert all(kind == "zscore" and abs(score) < 6 for _, (kind, score, _) in hits)
+    assert all(i > 60 for i, _ in hits)
+
+
+def test_warmup_seeds_mean_and_variance():
+    detector = Detector("eco2_ppm", warmup=4)
+    feed(detector, [600.0, 610.0, 590.0, 600.0])
+    assert detector.mean == pytest.approx(600.0)
+    assert detector.var == pytest.approx(200.0 / 3)
+    assert detector.cusum_up == 0.0 and detector.cusum_down == 0.0
+
+
+def test_spike_fires_zscore():
+    rng = random.Random(1)
+    detector = Detector("noise_db", z=4, cooldown_s=0)
+    hits = feed(detector, [rng.gauss(50, 1) for _ in range(100)] + [70.0])
+    assert [(i, hit[0]) for i, hit in hits] == [(100, "zscore")]
+    assert hits[0][1][1] > 4
+
+
+def test_drift_fires_cusum():
+    rng = random.Random(2)
+    base = [rng.gauss(600, 10) for _ in range(100)]
+    drift = [600 + 3 * i + rng.gauss(0, 10) for i in range(100)]
+    hits = feed(Detector("eco2_ppm", z=10, cooldown_s=1000), base + drift)
+    assert len(hits) == 1
+    i, (kind, score, baseline) = hits[0]
+    assert kind == "cusum" and i >= 100 and score > 8
+
+
+def test_direction_and_cooldown():
+    detector = Detector("noise_db", direction="up", warmup=5, cooldown_s=10)
+    feed(detector, [50.0, 51.0, 49.0, 50.0, 50.0])
+    assert detector.update(30.0, 5) is None
+    assert detector.update(80.0, 6)[0] == "zscore"
+    assert detector.update(90.0, 7) is None
+
+
+def test_parse_detector():
+    detector = parse_detector("eco2_ppm", "z 3, min_std 20, dir both", warmup=10)
+    assert (detector.z, detector.min_std, detector.direction, detector.warmup) == (3.0, 20.0, "both", 10)
+    with pytest.raises(ValueError):
+        parse_detector("eco2_ppm", "zz 3")
+    with pytest.raises(ValueError):
+        parse_detector("eco2_ppm", "dir sideways")
+
+
+def test_events_per_channel():
+    events = []
+    anomalies = AnomalyDetector(
+        {"noise_db": ("noise", lambda v: v[0])},
+        [Detector("noise_db", warmup=5, cooldown_s=0)],
+        on_event=events.append,
+    )
+    for x in (50.0, 51.0, 49.0, 50.0, 50.5, 80.0):
+        anomalies.add("noise", (x,))
+    anomalies.add("light", (1000.0,))
+    assert [(e["metric"], e["value"], e["detector"]) for e in events] == [("noise_db", 80.0, "zscore")]
+    assert anomalies.fired == 1
@@ -0,0 +1,95 @@
+import configparser
+import math
+
+import pytest
+
+from classsense import deadband
+from classsense.deadband import Deadband, parse_band
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(deadband.time, "monotonic", clock)
+    return clock
+
+
+@pytest.mark.parametrize("text, band", [
+    ("25, 5%", (25.0, 0.05)),
+    ("10%", (0.0, 0.1)),
+    (" 0.5 ", (0.5, 0.0)),
+    ("", (0.0, 0.0)),
+])
+def test_parse_band(text, band):
+    assert parse_band(text) == band
+
+
+def test_larger_band_applies(clock):
+    band = Deadband({"eco2_ppm": (25.0, 0.05)})
+    assert band.check({"eco2_ppm": 400.0})
+    assert not band.check({"eco2_ppm": 425.0})
+    assert band.check({"eco2_ppm": 426.0})
+    # 5% of 2000 is wider than 25
+    assert band.check({"eco2_ppm": 2000.0})
+    assert not band.check({"eco2_ppm": 2090.0})
+    assert band.check({"eco2_ppm": 2101.0})
+
+
+def test_slow_drift_is_reported(clock):
+    band = Deadband({"noise_db": (1.0, 0.0)})
+    assert band.check({"noise_db": 40.0})
+    assert not band.check({"noise_db": 40.6})
+    assert band.check({"noise_db": 41.2})
+
+
+def test_heartbeat(clock):
+    band = Deadband({"noise_db": (1.0, 0.0)}, heartbeat_s=60)
+    assert band.check({"noise_db": 40.0})
+    clock.now += 59
+    assert not band.check({"noise_db": 40.0})
+    clock.now += 1
+    assert band.check({"noise_db": 40.0})
+
+
+def test_missing_reading_is_a_change(clock):
+    band = Deadband({"voc_ppb": (10.0, 0.0)})
+    assert band.check({"voc_ppb": 100.0})
+    assert band.check({"voc_ppb": math.nan})
+    assert not band.check({})
+    assert band.check({"voc_ppb": 100.0})
+
+
+def test_other_keys_are_not_compared(clock):
+    band = Deadband({"noise_db": (1.0, 0.0)})
+    assert band.check({"noise_db": 40.0, "temperature_c": 20.0})
+    assert not band.check({"noise_db": 40.0, "temperature_c": 30.0})
+
+
+def test_suppressed_counts(clock):
+    band = Deadband({"noise_db": (1.0, 0.0)})
+    band.check({"noise_db": 40.0})
+    for _ in range(3):
+        band.check({"noise_db": 40.0})
+    assert band.suppressed == 3
+    band.check({"noise_db": 45.0})
+    band.check({"noise_db": 45.0})
+    assert band.suppressed == 1
+    assert band.suppressed_total == 4
+
+
+def test_from_config():
+    cfg = configparser.ConfigParser()
+    cfg.read_string("[deadband]\nheartbeat_seconds = 0\neco2_ppm = 25, 5%\n")
+    assert Deadband.from_config(cfg) is None
+    cfg.set("deadband", "heartbeat_seconds", "300")
+    band = Deadband.from_config(cfg)
+    assert band.heartbeat_s == 300.0
+    assert band.bands == {"eco2_ppm": (25.0, 0.05)}
@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+from classsense.display import LCD, Field
+from classsense.simulated import SimulatedDisplay
+from classsense.trend import TrendMetric
+
+
+@pytest.fixture
+def lcd():
+    screen = LCD(
+        [Field("eco2", "CO2", "ppm", fmt="{:5.0f}"), Field("noise", "no", "db")],
+        trend_metrics=[TrendMetric("eco2", "CO2", min_span=50), TrendMetric("noise", "no", min_span=5)],
+        rotate_s=3600,
+        disp=SimulatedDisplay(spi_speed_hz=1e12),
+    )
+    yield screen
+    screen.close()
+
+
+def test_simulated_display_takes_only_pil_images():
+    disp = SimulatedDisplay(spi_speed_hz=1e12)
+    with pytest.raises(TypeError):
+        disp.display(np.zeros((80, 160, 3), dtype=np.uint8))
+
+
+def test_trend_frame_is_sent_as_image(lcd):
+    for i in range(10):
+        lcd.trend.append({"eco2": 600 + i, "noise": 50.0})
+    before = lcd.disp.bytes_sent
+    lcd._render_trend()
+    assert lcd.disp.bytes_sent - before == lcd.WIDTH * lcd.HEIGHT * 2
+
+
+def image_to_data(image, rotation=0):
+    # Module-level packer, like the st7735 driver's
+    return SimulatedDisplay().image_to_data(image, rotation)
+
+
+class ModuleFunctionDisplay:
+    width, height = 160, 80
+
+    def __init__(self):
+        self.windows = []
+        self.frames = 0
+
+    def begin(self):
+        pass
+
+    def set_window(self, x0=0, y0=0, x1=None, y1=None):
+        self.windows.append((x0, y0, x1, y1))
+
+    def data(self, data):
+        pass
+
+    def display(self, image):
+        self.frames += 1
+
+
+def test_partial_updates_with_module_image_to_data():
+    disp = ModuleFunctionDisplay()
+    screen = LCD([Field("eco2", "CO2", "ppm", fmt="{:5.0f}"), Field("noise", "no", "db")], disp=disp)
+    try:
+        assert screen._partial
+        screen._render({"eco2": 600, "noise": 50.0})
+        assert disp.frames == 1
+        screen._render({"eco2": 610, "noise": 50.0})
+        assert disp.frames == 1
+        assert len(disp.windows) == 1
+    finally:
+        screen.close()
+
+
+class Panel(SimulatedDisplay):
+    """Keeps the pixels in panel (native, 80x160) order, as the ST7735 does."""
+
+    def __init__(self, rotation):
+        super().__init__(rotation=rotation, spi_speed_hz=1e12)
+        self.pixels = np.zeros((160, 80), dtype=">u2")
+        self.window = (0, 0, 79, 159)
+        self.written = 0
+        self.windows = []
+
+    def set_window(self, x0=0, y0=0, x1=None, y1=None):
+        self.window = (x0, y0, x1, y1)
+        self.windows.append(self.window)
+        self.written = 0
+
+    def data(self, data):
+        super().data(data)
+        x0, y0, x1, y1 = self.window
+        w = x1 - x0 + 1
+        for i, value in enumerate(np.frombuffer(bytes(data), dtype=">u2")):
+            y, x = divmod(self.written + i, w)
+            self.pixels[y0 + y, x0 + x] = value
+        self.written += len(data) // 2
+
+    def display(self, image):
+        self.set_window(0, 0, 79, 159)
+        self.data(self.image_to_data(image, self.rotation))
+
+
+@pytest.mark.parametrize("rotation", [0, 90, 180, 270])
+def test_changed_fields_land_where_a_full_frame_would(rotation):
+    panel = Panel(rotation)
+    screen = LCD([Field("eco2", "CO2", "ppm", fmt="{:5.0f}"), Field("noise", "no", "db")],
+                 rotation=rotation, disp=panel)
+    try:
+        screen._render({"eco2": 600, "noise": 50.0})
+        panel.windows.clear()
+        screen._render({"eco2": 1234, "noise": 50.0})
+        # Only the eCO2 value went out, through its own window
+        assert len(panel.windows) == 1
+        expected = np.frombuffer(panel.image_to_data(screen.frame, rotation), dtype=">u2").reshape(160, 80)
+        assert np.array_equal(panel.pixels, expected)
+    finally:
+        screen.close()
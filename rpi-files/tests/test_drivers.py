@@ -0,0 +1,69 @@
+import configparser
+
+import pytest
+
+from classsense import drivers
+from classsense.client import create_drivers
+
+
+def config(text=""):
+    cfg = configparser.ConfigParser()
+    cfg.read_string("[sampling]\n" + text)
+    return cfg
+
+
+def test_registry_names():
+    assert {"ltr559", "bme280", "sgp30", "noise", "noise_fft", "noise_enviroplus"} <= set(drivers.names())
+
+
+def test_unknown_driver():
+    with pytest.raises(ValueError, match="known: .*ltr559"):
+        drivers.create("tsl2591", config())
+
+
+def test_register_new_driver():
+    @drivers.register
+    class Counter(drivers.Driver):
+        name = "test_counter"
+        channel = "count"
+
+        def open(self):
+            self.n = 0
+
+        def read(self):
+            self.n += 1
+            return self.n
+
+    try:
+        drv = drivers.create("test_counter", config())
+        drv.open()
+        assert isinstance(drv, Counter)
+        assert drv.sensor_channel().read() == 1
+    finally:
+        del drivers._registry["test_counter"]
+
+
+def test_create_drivers_default_and_selected():
+    names = ["ltr559", "bme280", "sgp30", "noise_fft"]
+    options = {"bme280": {"cpu_factor": 1.25}}
+    assert [d.name for d in create_drivers(config(), names, options)] == names
+    selected = create_drivers(config("drivers = sim_ltr559, sim_bme280"), names, options)
+    assert [d.name for d in selected] == ["sim_ltr559", "sim_bme280"]
+    # Simulated drivers take their real twin's options
+    assert selected[1].real.cpu_factor == 1.25
+
+
+def test_two_drivers_for_one_channel():
+    with pytest.raises(ValueError, match="both provide"):
+        create_drivers(config("drivers = noise, noise_fft"), [], {})
+
+
+def test_channel_follows_driver_declarations():
+    drv = drivers.create("ltr559", config(f"rate_lux_hz = {drivers.LTR559Driver.native_rate_hz * 10}"))
+    channel = drv.sensor_channel(max_failures=5)
+    assert channel.name == "lux"
+    # Never read faster than the sensor produces values
+    assert channel.rate_hz == drivers.LTR559Driver.native_rate_hz
+    assert channel.deadline_s >= drivers.MIN_DEADLINE_S
+    assert channel.max_failures == 5
+    assert channel.reinit == drv.reinit
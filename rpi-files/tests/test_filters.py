@@ -0,0 +1,75 @@
+import math
+import random
+import statistics
+
+import pytest
+
+from classsense import filters
+from classsense.filters import FilterBank, _Window, parse
+
+
+def run(spec, values):
+    pipeline = parse(spec)
+    return [pipeline.update(x) for x in values]
+
+
+def test_ema():
+    assert run("ema 0.5", [0.0, 2.0, 4.0]) == [0.0, 1.0, 2.5]
+
+
+def test_moving_mean_and_median():
+    assert run("mean 3", [1.0, 2.0, 3.0, 10.0]) == [1.0, 1.5, 2.0, 5.0]
+    assert run("median 3", [1.0, 9.0, 2.0, 3.0]) == [1.0, 5.0, 2.0, 3.0]
+
+
+def test_hampel_replaces_spike_but_follows_step():
+    out = run("hampel 5", [10.0, 10.5, 9.5, 10.0, 100.0, 10.2])
+    assert out[4] == 10.0
+    out = run("hampel 5", [10.0, 10.5, 9.5, 10.0] + [50.0] * 5)
+    assert out[-1] == 50.0
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_mad_matches_brute_force(seed):
+    rng = random.Random(seed)
+    window = _Window(rng.randint(1, 30))
+    for _ in range(100):
+        window.push(round(rng.gauss(0, 5), 1))
+        med = window.median()
+        expected = statistics.median(abs(v - med) for v in window.sorted)
+        assert window.mad(med) == pytest.approx(expected)
+
+
+def test_kalman_converges():
+    rng = random.Random(3)
+    out = run("kalman 0.0001 1", [20 + rng.gauss(0, 1) for _ in range(500)])
+    assert abs(out[-1] - 20) < 0.3
+
+
+def test_missing_readings_pass_through():
+    pipeline = parse("mean 2")
+    assert pipeline.update(None) is None
+    assert math.isnan(pipeline.update(float("nan")))
+    assert pipeline.update(4.0) == 4.0
+
+
+def test_invalid_specs():
+    for spec in ("wobble 3", "mean", "ema 0", "kalman 1 0", "median 0"):
+        with pytest.raises(ValueError):
+            parse(spec)
+
+
+def test_large_window_is_clamped():
+    pipeline = parse(f"median {filters.MAX_WINDOW + 100}")
+    for x in range(filters.MAX_WINDOW + 10):
+        out = pipeline.update(float(x))
+    # The median of the last MAX_WINDOW readings only
+    assert out == 10 + (filters.MAX_WINDOW - 1) / 2.0
+
+
+def test_filter_bank_extract():
+    bank = FilterBank({"eco2_ppm": ("sgp30", lambda v: v[0])}, {"eco2_ppm": parse("mean 2")})
+    extract = bank.extract("eco2_ppm", lambda v: v[0])
+    for value in ((400.0, 0.0), (600.0, 0.0)):
+        bank.add("sgp30", value)
+    assert extract((600.0, 0.0)) == 500.0
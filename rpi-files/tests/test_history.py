@@ -0,0 +1,79 @@
+import math
+
+import pytest
+
+from classsense.history import HistoryStore
+
+pytest.importorskip("numpy")
+
+COLUMNS = ["noise_db", "eco2_ppm"]
+
+
+def filled(store, rows, t0=1000.0):
+    for i in range(rows):
+        store.append({"noise_db": float(i), "eco2_ppm": 400.0 + i}, t=t0 + i)
+    return store
+
+
+def flatten(segments, name):
+    return [float(v) for _, values in segments for v in values[name]]
+
+
+def test_ring_keeps_newest_rows():
+    store = filled(HistoryStore(COLUMNS, capacity=5), 8)
+    assert len(store) == 5
+    segments = store.query()
+    assert len(segments) == 2
+    assert flatten(segments, "noise_db") == [3.0, 4.0, 5.0, 6.0, 7.0]
+    assert sorted(store.column("noise_db")) == [3.0, 4.0, 5.0, 6.0, 7.0]
+
+
+def test_query_range_across_the_wrap():
+    store = filled(HistoryStore(COLUMNS, capacity=5), 8)
+    segments = store.query(start=1004.0, end=1007.0, columns=["eco2_ppm"])
+    assert [float(t) for ts, _ in segments for t in ts] == [1004.0, 1005.0, 1006.0]
+    assert flatten(segments, "eco2_ppm") == [404.0, 405.0, 406.0]
+    assert store.query(start=2000.0) == []
+
+
+def test_missing_values_and_clock_steps():
+    store = HistoryStore(COLUMNS, capacity=4)
+    assert store.latest() is None
+    store.append({"noise_db": 40.0}, t=1000.0)
+    store.append({"noise_db": None, "eco2_ppm": 420.0, "lux": 1.0}, t=990.0)
+    t, values = store.latest()
+    assert t == 1000.0
+    assert math.isnan(values["noise_db"])
+    assert values["eco2_ppm"] == 420.0
+
+
+def test_sample_evenly_spaced():
+    store = filled(HistoryStore(COLUMNS, capacity=10), 25)
+    assert list(store.sample("noise_db", since=0, n=5)) == [15.0, 17.0, 19.0, 21.0, 23.0]
+    assert list(store.sample("noise_db", since=1022.0, n=5)) == [22.0, 23.0, 24.0]
+    assert store.sample("noise_db", since=5000.0, n=5).shape == (0,)
+
+    times, values = store.sample_rows(since=1020.0, n=2, columns=["eco2_ppm"])
+    assert list(times) == [1020.0, 1022.0]
+    assert list(values) == ["eco2_ppm"]
+    assert list(values["eco2_ppm"]) == [420.0, 422.0]
+
+
+def test_file_survives_reopen(tmp_path):
+    path = str(tmp_path / "history.bin")
+    store = filled(HistoryStore(COLUMNS, capacity=4, path=path), 6)
+    store.close()
+    store = HistoryStore(COLUMNS, capacity=4, path=path)
+    assert len(store) == 4
+    assert flatten(store.query(), "noise_db") == [2.0, 3.0, 4.0, 5.0]
+    store.append({"noise_db": 6.0}, t=1006.0)
+    assert store.latest()[1]["noise_db"] == 6.0
+
+
+def test_other_layout_is_moved_aside(tmp_path):
+    path = tmp_path / "history.bin"
+    filled(HistoryStore(COLUMNS, capacity=4, path=str(path)), 3).close()
+    store = HistoryStore(COLUMNS + ["voc_ppb"], capacity=4, path=str(path))
+    assert len(store) == 0
+    assert (tmp_path / "history.bin.old").exists()
+    assert len(HistoryStore(COLUMNS, capacity=4, path=str(tmp_path / "history.bin.old"))) == 3
@@ -0,0 +1,210 @@
+import gzip
+import http.server
+import json
+import math
+import socket
+import threading
+import time
+import types
+
+import pytest
+import requests
+
+from classsense.http_session import (
+    CircuitBreaker, CircuitOpenError, DnsCache, HttpClient, RetryPolicy, parse_retry_after, to_json,
+)
+from classsense.uploader import Uploader
+
+
+def strict_loads(text):
+    def refuse(name):
+        raise ValueError(f"bare {name} in JSON")
+    return json.loads(text, parse_constant=refuse)
+
+
+class FakeSession:
+    def __init__(self, status=200):
+        self.status = status
+        self.bodies = []
+        self.headers = {}
+
+    def request(self, method, url, timeout=None, data=None, headers=None, **kwargs):
+        if headers and headers.get("Content-Encoding") == "gzip":
+            data = gzip.decompress(data)
+        self.bodies.append(data.decode("utf-8") if isinstance(data, bytes) else data)
+        return types.SimpleNamespace(status_code=self.status, headers={}, raise_for_status=lambda: None)
+
+
+@pytest.fixture
+def client():
+    http = HttpClient(dns_ttl_s=0)
+    http.session = FakeSession()
+    return http
+
+
+def test_to_json_writes_null_for_missing_readings():
+    payload = {"sensors": {"eco2_ppm": math.nan, "noise_db": math.inf, "lux": 1.5}, "bands": [math.nan, 2.0]}
+    assert strict_loads(to_json(payload)) == {
+        "sensors": {"eco2_ppm": None, "noise_db": None, "lux": 1.5},
+        "bands": [None, 2.0],
+    }
+
+
+@pytest.mark.parametrize("fmt", ["json", "ndjson"])
+def test_batch_with_nan_is_valid_json(client, fmt):
+    samples = [{"sensors": {"temperature_c": math.nan}}] + [{"sensors": {"temperature_c": 21.0}}] * 4
+    client.post_batch("http://server/ingest/batch", samples, fmt=fmt)
+    body = client.session.bodies[-1]
+    lines = body.splitlines() if fmt == "ndjson" else [body]
+    decoded = [strict_loads(line) for line in lines]
+    flat = decoded if fmt == "ndjson" else decoded[0]
+    assert [s["sensors"]["temperature_c"] for s in flat] == [None, 21.0, 21.0, 21.0, 21.0]
+
+
+def test_post_json_with_nan_is_valid_json(client):
+    client.post_json("http://server/ingest", {"sensors": {"eco2_ppm": math.nan}})
+    assert strict_loads(client.session.bodies[-1]) == {"sensors": {"eco2_ppm": None}}
+
+
+class RaisingSession(FakeSession):
+    def __init__(self, error):
+        super().__init__()
+        self.error = error
+
+    def request(self, *args, **kwargs):
+        raise self.error
+
+
+def half_open(http):
+    for _ in range(http.breaker.failure_threshold):
+        http.breaker.record_failure()
+    http.breaker._open_until = 0.0
+    assert http.breaker.state == "open"
+
+
+@pytest.mark.parametrize("error", [requests.exceptions.ChunkedEncodingError("cut"), ValueError("bad body")])
+def test_failed_probe_reopens_breaker(error):
+    http = HttpClient(dns_ttl_s=0, retry=RetryPolicy(attempts=1))
+    http.session = RaisingSession(error)
+    half_open(http)
+    with pytest.raises(type(error)):
+        http.request("POST", "http://server/ingest")
+    assert http.breaker.state == "open"
+
+
+def test_successful_probe_closes_breaker(client):
+    half_open(client)
+    client.post_json("http://server/ingest", {"n": 1})
+    assert client.breaker.state == "closed"
+
+
+def test_client_error_does_not_trip_breaker():
+    http = HttpClient(dns_ttl_s=0, retry=RetryPolicy(attempts=1), breaker=CircuitBreaker(failure_threshold=1))
+    http.session = FakeSession(status=400)
+    http.request("POST", "http://server/ingest")
+    assert http.breaker.state == "closed"
+
+
+def test_breaker_opens_after_failures_and_fails_fast():
+    breaker = CircuitBreaker(failure_threshold=2, reset_s=60)
+    breaker.record_failure()
+    breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError) as info:
+        breaker.before_request()
+    assert 0 < info.value.retry_in_s <= 60
+
+
+def test_retry_after_header():
+    assert parse_retry_after("120") == 120.0
+    assert parse_retry_after("") is None
+    assert parse_retry_after("soon") is None
+
+
+class NoContent(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_server():
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), NoContent)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_dns_cache_is_scoped_to_the_session(local_server):
+    original = socket.getaddrinfo
+    http = HttpClient(dns_ttl_s=300)
+    lookups = []
+
+    def resolve(host, port, *args, **kwargs):
+        lookups.append(host)
+        return original("127.0.0.1", port, *args, **kwargs)
+
+    http.dns_cache._resolve = resolve
+    try:
+        for _ in range(2):
+            http.request("GET", f"http://classsense.test:{local_server}/", headers={"Connection": "close"})
+    finally:
+        http.close()
+    assert lookups == ["classsense.test"]
+    # The rest of the process still uses the system resolver
+    assert socket.getaddrinfo is original
+
+
+def test_dns_cache_falls_back_to_a_stale_entry():
+    cache = DnsCache(ttl_s=0)
+    answers = [["10.0.0.7"]]
+
+    def resolve(host, port, *args, **kwargs):
+        if not answers:
+            raise socket.gaierror("no resolver")
+        return answers.pop()
+
+    cache._resolve = resolve
+    assert cache.getaddrinfo("server", 443) == ["10.0.0.7"]
+    assert cache.getaddrinfo("server", 443) == ["10.0.0.7"]
+    with pytest.raises(socket.gaierror):
+        cache.getaddrinfo("other", 443)
+
+
+def slow_retries(status=503):
+    http = HttpClient(dns_ttl_s=0, retry=RetryPolicy(attempts=5), breaker=CircuitBreaker(failure_threshold=10))
+    http.retry.delay = lambda retry: 30.0
+    http.session = FakeSession(status=status)
+    return http
+
+
+def test_stop_event_ends_the_retry_backoff():
+    http = slow_retries()
+    threading.Timer(0.1, http.stop_event.set).start()
+    t0 = time.monotonic()
+    with pytest.raises(requests.HTTPError):
+        http.request("POST", "http://server/ingest")
+    assert time.monotonic() - t0 < 2.0
+    assert len(http.session.bodies) == 1
+
+
+def test_uploader_stop_interrupts_a_retrying_send():
+    http = slow_retries()
+    uploader = Uploader(lambda batch: http.post_json("http://server/ingest", batch[0]), drain_timeout_s=10.0)
+    http.stop_event = uploader.stop_event
+    uploader.start()
+    uploader.put({"n": 1})
+    deadline = time.monotonic() + 2.0
+    while not http.session.bodies and time.monotonic() < deadline:
+        time.sleep(0.01)
+    t0 = time.monotonic()
+    uploader.stop()
+    assert time.monotonic() - t0 < 2.0
+    assert uploader.failed == 1
@@ -0,0 +1,93 @@
+import re
+import types
+import urllib.request
+
+from classsense.metrics import CONTENT_TYPE, Metrics, MetricsServer
+
+
+def test_render_after_failed_request():
+    m = Metrics()
+    m.request(0.1, 200)
+    m.request(0.2, None)
+    m.request(0.3, 503)
+    text = m.render()
+    assert 'classsense_http_request_seconds_count{code="200"} 1' in text
+    assert 'classsense_http_request_seconds_count{code="error"} 1' in text
+    assert 'classsense_http_request_seconds_count{code="503"} 1' in text
+
+
+def test_histogram_buckets_are_cumulative():
+    m = Metrics(buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 5.0):
+        m.read("noise", seconds, ok=True)
+    m.read("noise", 0.05, ok=False)
+    text = m.render()
+    assert 'classsense_read_seconds_bucket{channel="noise",le="0.1"} 2' in text
+    assert 'classsense_read_seconds_bucket{channel="noise",le="1.0"} 3' in text
+    assert 'classsense_read_seconds_bucket{channel="noise",le="+Inf"} 4' in text
+    assert 'classsense_read_failures_total{channel="noise"} 1' in text
+
+
+def test_failing_collector_does_not_break_render():
+    m = Metrics()
+
+    def broken():
+        raise RuntimeError("gone")
+
+    m.collector(broken)
+    m.collector(lambda: [("queue_depth", "gauge", "Depth.", {}, 3)])
+    text = m.render()
+    assert "classsense_queue_depth 3" in text
+
+
+SAMPLE = re.compile(r'^[a-z_]+(\{([a-z_]+="([^"\\]|\\.)*",?)+\})? (-?[0-9.e+-]+|NaN|\+Inf)$')
+
+
+def test_text_format():
+    m = Metrics(buckets=(0.5,))
+    m.read("noise", 0.2, ok=True)
+    m.serialize(3, 1200, 0.01)
+    m.serialize(2, 800, 0.01)
+    m.collector(lambda: [
+        ("channel_stale", "gauge", "1 while stale.", {"channel": 'odd "name"\n'}, True),
+        ("queue_depth", "gauge", "Depth.", {}, None),
+    ])
+    lines = m.render().splitlines()
+
+    seen = []
+    for line in lines:
+        if line.startswith("# HELP "):
+            seen.append(line.split()[2])
+        elif line.startswith("# TYPE "):
+            assert line.split()[2] == seen[-1]
+        else:
+            assert SAMPLE.match(line), line
+            assert line.startswith(seen[-1])
+    # One HELP / TYPE pair per family
+    assert len(seen) == len(set(seen))
+    assert "# TYPE classsense_read_seconds histogram" in lines
+    assert "classsense_read_seconds_sum{channel=\"noise\"} 0.2" in lines
+    assert "classsense_serialized_bytes_total 2000" in lines
+    assert 'classsense_channel_stale{channel="odd \\"name\\"\\n"} 1' in lines
+    assert "classsense_queue_depth NaN" in lines
+
+
+def test_forwards_to_another_probe():
+    calls = []
+    forward = types.SimpleNamespace(read=lambda *args: calls.append(args))
+    Metrics(forward=forward).read("lux", 0.1, ok=False)
+    assert calls == [("lux", 0.1, False)]
+
+
+def test_server_scrape():
+    m = Metrics()
+    m.read("lux", 0.01, ok=True)
+    server = MetricsServer(m, port=0)
+    server.start()
+    try:
+        port = server._httpd.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as res:
+            assert res.headers["Content-Type"] == CONTENT_TYPE
+            assert 'classsense_read_seconds_count{channel="lux"} 1' in res.read().decode("utf-8")
+    finally:
+        server.close()
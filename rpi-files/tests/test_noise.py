@@ -0,0 +1,71 @@
+import math
+
+import pytest
+
+from classsense.noise import NoiseMeter
+
+np = pytest.importorskip("numpy")
+
+RATE = 8000
+
+
+def tone(amplitude, seconds, freq=440.0):
+    t = np.arange(int(RATE * seconds)) / RATE
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+
+def feed(meter, audio):
+    # As the input stream does: one callback per block
+    for i in range(0, len(audio), meter.block_len):
+        block = audio[i:i + meter.block_len]
+        meter._callback(block.reshape(-1, 1), len(block), None, None)
+
+
+@pytest.fixture
+def meter():
+    return NoiseMeter(samplerate=RATE, block_ms=125, history_s=2, db_offset=90.0)
+
+
+def test_no_levels_before_audio(meter):
+    assert meter.levels(1.0) is None
+
+
+def test_leq_of_a_sine(meter):
+    feed(meter, tone(0.1, 1.0))
+    levels = meter.levels(1.0)
+    # Mean square of a sine is A^2 / 2
+    assert levels["leq"] == pytest.approx(10 * math.log10(0.1 ** 2 / 2) + 90.0, abs=0.1)
+    # A steady tone: every block has the same level
+    for key in ("lmax", "lmin", "l10", "l90"):
+        assert levels[key] == pytest.approx(levels["leq"], abs=0.1)
+
+
+def test_levels_cover_only_the_window(meter):
+    feed(meter, tone(0.5, 1.0))
+    feed(meter, tone(0.01, 0.5))
+    quiet = meter.levels(0.5)
+    both = meter.levels(1.5)
+    assert quiet["lmax"] == pytest.approx(10 * math.log10(0.01 ** 2 / 2) + 90.0, abs=0.5)
+    assert both["lmax"] == pytest.approx(10 * math.log10(0.5 ** 2 / 2) + 90.0, abs=0.5)
+    assert both["lmin"] == pytest.approx(quiet["lmin"], abs=0.5)
+
+
+def test_read_new_hands_out_each_frame_once(meter):
+    audio = np.arange(3000, dtype=np.float32)
+    feed(meter, audio)
+    frames = meter.read_new(1024)
+    assert frames.shape == (2, 1024)
+    assert np.array_equal(frames.ravel(), audio[:2048])
+    assert meter.read_new(1024).shape == (0, 1024)
+    feed(meter, np.arange(3000, 4000, dtype=np.float32))
+    assert np.array_equal(meter.read_new(1024).ravel(), np.arange(2048, 3072))
+
+
+def test_read_new_skips_overwritten_audio(meter):
+    size = meter._ring.shape[0]
+    feed(meter, np.arange(size + 4000, dtype=np.float32))
+    frames = meter.read_new(1000)
+    # Only what is still in the ring, wrapped around its end
+    assert frames.shape == (size // 1000, 1000)
+    assert frames[0, 0] == 4000
+    assert frames[-1, -1] == size + 3999
@@ -0,0 +1,109 @@
+import types
+
+import pytest
+
+from classsense.outbox import Outbox
+from classsense.uploader import Uploader
+
+
+def http_error(status):
+    error = RuntimeError(f"{status} from server")
+    error.response = types.SimpleNamespace(status_code=status)
+    return error
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    box = Outbox(str(tmp_path / "outbox.sqlite3"), flush_rows=1000, flush_interval_s=3600)
+    yield box
+    box.close()
+
+
+def test_replay_in_order_and_ack(outbox):
+    outbox.extend([{"n": i} for i in range(5)])
+    outbox.flush()
+    outbox.extend([{"n": 5}, {"n": 6}])
+    rows = outbox.peek(6)
+    assert [p["n"] for _, p in rows] == [0, 1, 2, 3, 4, 5]
+    outbox.ack(rows)
+    assert [p["n"] for _, p in outbox.peek(10)] == [6]
+    assert len(outbox) == 1
+
+
+def test_peek_does_not_flush(outbox):
+    outbox.extend([{"n": 1}])
+    assert outbox.peek(10) == [(None, {"n": 1})]
+    assert outbox.flush_due_in() is not None
+    outbox.ack(outbox.peek(10))
+    assert len(outbox) == 0
+    assert outbox.flush_due_in() is None
+
+
+def test_survives_reopen(tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    box = Outbox(path)
+    box.extend([{"n": 1}, {"n": 2}])
+    box.close()
+    box = Outbox(path)
+    assert [p["n"] for _, p in box.peek(10)] == [1, 2]
+    box.close()
+
+
+def test_quota_drops_oldest(tmp_path):
+    max_bytes = 64 * 1024
+    box = Outbox(str(tmp_path / "outbox.sqlite3"), max_bytes=max_bytes, flush_rows=20)
+    for i in range(0, 200, 20):
+        box.extend([{"n": n, "pad": "x" * 500} for n in range(i, i + 20)])
+        # Measured on disk, with page and WAL overhead, not by body length
+        assert box.disk_bytes() <= max_bytes
+    kept = [p["n"] for _, p in box.peek(200)]
+    assert kept == list(range(200 - len(kept), 200))
+    assert 20 <= len(kept) < 128
+    box.close()
+
+
+def test_quota_counts_the_wal(tmp_path):
+    box = Outbox(str(tmp_path / "outbox.sqlite3"), max_bytes=10 ** 9, flush_rows=10)
+    box.extend([{"n": n, "pad": "x" * 500} for n in range(10)])
+    assert box.disk_bytes() > (tmp_path / "outbox.sqlite3-wal").stat().st_size > 0
+    box.close()
+
+
+def test_rejected_sample_does_not_block_backlog(outbox):
+    sent = []
+
+    def send(batch):
+        if any(p.get("bad") for p in batch):
+            raise http_error(400)
+        sent.extend(batch)
+
+    uploader = Uploader(send, outbox=outbox, replay_interval_s=0)
+    outbox.extend([{"n": 0, "bad": True}] + [{"n": i} for i in range(1, 6)])
+    outbox.flush()
+    uploader._replay()
+    assert len(outbox) == 0
+    assert uploader.rejected == 1
+    assert uploader.sent == 5
+    assert [p["n"] for p in sent] == [1, 2, 3, 4, 5]
+
+
+def test_rejected_delivery_is_not_kept(outbox):
+    def send(batch):
+        raise http_error(422)
+
+    uploader = Uploader(send, outbox=outbox)
+    uploader._deliver([{"n": 1}, {"n": 2}])
+    assert len(outbox) == 0
+    assert uploader.rejected == 2
+
+
+def test_transient_failures_are_kept(outbox):
+    def send(batch):
+        raise http_error(503)
+
+    uploader = Uploader(send, outbox=outbox, retry_interval_s=0)
+    uploader._deliver([{"n": 1}])
+    uploader._replay()
+    assert len(outbox) == 1
+    assert uploader.failed == 0
+    assert uploader.rejected == 0
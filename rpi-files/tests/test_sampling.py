@@ -0,0 +1,212 @@
+import math
+import time
+import threading
+
+import pytest
+
+from classsense.sampling import SamplingEngine, Scheduler, SensorChannel
+
+
+def test_channel_lookup():
+    engine = SamplingEngine([SensorChannel("light", lambda: 1.0)])
+    try:
+        assert engine.channel("light").name == "light"
+        with pytest.raises(KeyError):
+            engine.channel("noise")
+        with pytest.raises(KeyError):
+            engine.submit("noise")
+    finally:
+        engine.close()
+
+
+def test_snapshot_has_latest_values_and_defaults():
+    engine = SamplingEngine([
+        SensorChannel("light", lambda: 42.0, deadline_s=1.0),
+        SensorChannel("noise", lambda: 50.0),
+    ])
+    try:
+        engine.submit("light")
+        deadline = time.monotonic() + 2.0
+        while engine.snapshot()["values"]["light"] != 42.0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        values = engine.snapshot()["values"]
+        assert values["light"] == 42.0
+        assert math.isnan(values["noise"])
+    finally:
+        engine.close()
+
+
+
+def wait_for(predicate, timeout_s=2.0):
+    deadline = time.monotonic() + timeout_s
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return predicate()
+
+
+def test_reads_run_concurrently():
+    def slow(value):
+        def read():
+            time.sleep(0.2)
+            return value
+        return read
+
+    engine = SamplingEngine([SensorChannel(name, slow(i), deadline_s=1.0) for i, name in enumerate("abc")])
+    try:
+        t0 = time.monotonic()
+        for name in "abc":
+            engine.submit(name)
+        assert wait_for(lambda: engine.snapshot()["values"] == {"a": 0, "b": 1, "c": 2})
+        assert time.monotonic() - t0 < 0.5
+    finally:
+        engine.close()
+
+
+def test_late_read_is_dropped_and_counted():
+    engine = SamplingEngine([SensorChannel("voc", lambda: time.sleep(0.1) or 1.0, deadline_s=0.02)])
+    try:
+        engine.submit("voc")
+        assert wait_for(lambda: engine.health()["voc"]["timeouts"] == 1)
+        assert math.isnan(engine.snapshot()["values"]["voc"])
+        assert engine.health()["voc"]["reads"] == 0
+    finally:
+        engine.close()
+
+def test_hung_driver_keeps_one_worker_across_reinits():
+    release = threading.Event()
+    entered = []
+    light = []
+
+    def hang():
+        entered.append(time.monotonic())
+        release.wait(10)
+        return 0.0
+
+    engine = SamplingEngine(
+        [
+            SensorChannel("voc", hang, deadline_s=0.02, reinit=lambda: None, max_failures=1, backoff_s=0.0),
+            SensorChannel("light", lambda: 1.0, deadline_s=0.5),
+        ],
+        on_sample=lambda name, value: light.append(time.monotonic()) if name == "light" else None,
+    )
+    try:
+        for _ in range(40):
+            engine.submit("voc")
+            engine.submit("light")
+            time.sleep(0.01)
+        half = time.monotonic()
+        for _ in range(20):
+            engine.submit("voc")
+            engine.submit("light")
+            time.sleep(0.01)
+        assert engine.health()["voc"]["reinits"] >= 3
+        assert len(entered) == 1
+        assert any(t > half for t in light)
+        assert engine.snapshot()["values"]["light"] == 1.0
+    finally:
+        release.set()
+        engine.close()
+
+
+def test_health_reports_time_since_good_read():
+    engine = SamplingEngine([SensorChannel("voc", lambda: 1 / 0, max_failures=1)])
+    try:
+        time.sleep(0.05)
+        engine.submit("voc")
+        deadline = time.monotonic() + 2.0
+        while not engine.health()["voc"]["stale"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        h = engine.health()["voc"]
+        assert h["stale"] and h["reads"] == 0
+        assert h["since_read_s"] >= 0.05
+    finally:
+        engine.close()
+
+
+def run_for(scheduler, stop, seconds):
+    timer = threading.Timer(seconds, stop.set)
+    timer.start()
+    try:
+        scheduler.run()
+    finally:
+        timer.cancel()
+
+
+def test_scheduler_runs_each_job_at_its_rate():
+    stop = threading.Event()
+    runs = {"fast": [], "slow": []}
+    scheduler = Scheduler(stop)
+    scheduler.every(0.02, lambda: runs["fast"].append(time.monotonic()), name="fast")
+    scheduler.every(0.1, lambda: runs["slow"].append(time.monotonic()), name="slow")
+    run_for(scheduler, stop, 0.5)
+    assert 18 <= len(runs["fast"]) <= 27
+    assert 5 <= len(runs["slow"]) <= 6
+    # Deadlines follow the clock, not the previous run
+    assert runs["fast"][-1] - runs["fast"][0] == pytest.approx(0.02 * (len(runs["fast"]) - 1), abs=0.03)
+
+
+def test_scheduler_skips_missed_deadlines():
+    stop = threading.Event()
+    runs = []
+    late = []
+
+    def slow():
+        runs.append(time.monotonic())
+        time.sleep(0.055)
+
+    scheduler = Scheduler(stop, on_job=lambda name, late_s, seconds: late.append(late_s))
+    scheduler.every(0.02, slow, name="slow")
+    run_for(scheduler, stop, 0.3)
+    # Every run starts on a 20 ms deadline instead of catching up back to back
+    assert 4 <= len(runs) <= 6
+    assert max(late) < 0.02
+
+
+def test_scheduler_stops_at_once():
+    stop = threading.Event()
+    scheduler = Scheduler(stop)
+    scheduler.every(60, lambda: None, start_delay=60)
+    threading.Timer(0.05, stop.set).start()
+    t0 = time.monotonic()
+    scheduler.run()
+    assert time.monotonic() - t0 < 0.5
+
+
+def test_scheduler_rejects_bad_interval():
+    with pytest.raises(ValueError):
+        Scheduler(threading.Event()).every(0, lambda: None)
+
+
+def test_set_interval_speeds_up_at_once():
+    stop = threading.Event()
+    runs = []
+    scheduler = Scheduler(stop)
+    scheduler.every(0.2, lambda: runs.append(time.monotonic()), name="tick")
+    scheduler.every(60, lambda: scheduler.set_interval("tick", 0.02), name="adapt", start_delay=0.05)
+    t0 = time.monotonic()
+    run_for(scheduler, stop, 0.3)
+    # One run at the start, then every 20 ms from the change on
+    assert runs[1] - t0 == pytest.approx(0.05, abs=0.02)
+    assert 10 <= len(runs) <= 15
+
+
+def test_set_interval_slows_down():
+    stop = threading.Event()
+    runs = []
+    scheduler = Scheduler(stop)
+    scheduler.every(0.02, lambda: runs.append(time.monotonic()), name="tick")
+    scheduler.every(60, lambda: scheduler.set_interval("tick", 0.2), name="adapt", start_delay=0.1)
+    t0 = time.monotonic()
+    run_for(scheduler, stop, 0.45)
+    after = [t - t0 for t in runs if t - t0 > 0.11]
+    assert 1 <= len(after) <= 2
+    assert after[0] == pytest.approx(0.3, abs=0.03)
+
+
+def test_set_interval_rejects_bad_interval():
+    scheduler = Scheduler(threading.Event())
+    scheduler.every(1.0, lambda: None, name="tick")
+    with pytest.raises(ValueError):
+        scheduler.set_interval("tick", 0)
+    scheduler.set_interval("other", 2.0)
+    assert [job[2] for job in scheduler._jobs] == [1.0]
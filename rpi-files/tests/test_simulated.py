@@ -0,0 +1,78 @@
+import configparser
+import json
+
+import pytest
+
+from classsense import drivers
+from classsense.simulated import RecordedTrace, SimulatedDisplay, SyntheticTrace
+
+pytest.importorskip("numpy")
+
+ROWS = [
+    {"timestamp": "2024-03-04T08:00:00+00:00", "sensors": {"brightness_lux": 300.0, "eco2_ppm": 450, "noise_db": 40.0}},
+    {"timestamp": "2024-03-04T08:00:10+00:00", "sensors": {"brightness_lux": 310.0, "eco2_ppm": 600, "noise_db": 55.0}},
+    {"timestamp": "2024-03-04T08:00:20+00:00", "sensors": {"brightness_lux": 320.0, "eco2_ppm": 750, "noise_db": 60.0}},
+]
+
+
+@pytest.fixture
+def trace_path(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    path.write_text("\n".join(json.dumps(row) for row in ROWS) + "\n")
+    return str(path)
+
+
+def config(trace_path, **simulate):
+    cfg = configparser.ConfigParser()
+    cfg.read_dict({"sampling": {}, "simulate": {"trace": trace_path, "latency_scale": "0", **simulate}})
+    return cfg
+
+
+def test_synthetic_trace_is_repeatable_with_a_seed():
+    a, b = SyntheticTrace(seed=1), SyntheticTrace(seed=1)
+    assert a.fields(600.0) == b.fields(600.0)
+    # CO2 builds up during the lesson and is aired out in the break
+    lesson, late, aired = (SyntheticTrace(seed=1).fields(t)["eco2_ppm"] for t in (60.0, 2600.0, 3500.0))
+    assert lesson < late and aired < late
+
+
+def test_recorded_trace_keeps_its_pace_and_loops(trace_path):
+    trace = RecordedTrace(trace_path)
+    assert trace.fields(15.0)["eco2_ppm"] == 600
+    assert trace.fields(35.0)["eco2_ppm"] == 450
+    assert RecordedTrace(trace_path, speed=2.0).fields(6.0)["eco2_ppm"] == 600
+
+
+def test_empty_trace(tmp_path):
+    path = tmp_path / "empty.jsonl"
+    path.write_text("\n")
+    with pytest.raises(ValueError):
+        RecordedTrace(str(path))
+
+
+def test_simulated_twin_reads_the_trace(trace_path):
+    drv = drivers.create("sim_sgp30", config(trace_path))
+    real = drivers.create("sgp30", config(trace_path))
+    assert drv.channel == real.channel
+    assert list(drv.metrics) == list(real.metrics)
+    with pytest.raises(RuntimeError):
+        drv.read()
+    drv.open()
+    eco2, voc = drv.read()
+    assert eco2 == 450
+
+
+def test_injected_failures(trace_path):
+    drv = drivers.create("sim_ltr559", config(trace_path, fail_rate_lux="1"))
+    drv.open()
+    with pytest.raises(IOError, match="injected"):
+        drv.read()
+
+
+def test_simulated_display_counts_spi_bytes():
+    from PIL import Image
+
+    disp = SimulatedDisplay(spi_speed_hz=1e12)
+    assert (disp.width, disp.height) == (160, 80)
+    disp.display(Image.new("RGB", (disp.width, disp.height)))
+    assert disp.bytes_sent == 160 * 80 * 2
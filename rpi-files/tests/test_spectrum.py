@@ -0,0 +1,75 @@
+import math
+
+import pytest
+
+from classsense.noise import NoiseMeter
+from classsense.spectrum import SpectralAnalyzer, a_weighting_db
+
+np = pytest.importorskip("numpy")
+
+RATE = 16000
+FFT = 2048
+
+
+def tone(amplitude, freq, seconds):
+    t = np.arange(int(RATE * seconds)) / RATE
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+
+def frames(audio):
+    k = len(audio) // FFT
+    return audio[:k * FFT].reshape(k, FFT)
+
+
+def test_a_weighting_curve():
+    # IEC 61672 table values
+    weights = a_weighting_db([100.0, 1000.0, 4000.0])
+    assert weights == pytest.approx([-19.1, 0.0, 1.0], abs=0.1)
+
+
+def test_band_labels():
+    assert SpectralAnalyzer(RATE, FFT).band_labels == ["31.5", "63", "125", "250", "500", "1000", "2000", "4000"]
+    assert len(SpectralAnalyzer(RATE, FFT, bands="third-octave").band_labels) == 25
+    with pytest.raises(ValueError):
+        SpectralAnalyzer(RATE, FFT, bands="sixth-octave")
+
+
+def test_no_levels_before_audio():
+    assert SpectralAnalyzer(RATE, FFT).levels(1.0) is None
+
+
+def test_tone_level_and_band():
+    analyzer = SpectralAnalyzer(RATE, FFT, db_offset=94.0)
+    analyzer.process(frames(tone(0.1, 1000.0, 2.0)))
+    levels = analyzer.levels(1.0)
+    expected = 10 * math.log10(0.1 ** 2 / 2) + 94.0
+    # No A-weighting at 1 kHz
+    assert levels["laeq"] == pytest.approx(expected, abs=0.5)
+    assert levels["bands"]["1000"] == pytest.approx(expected, abs=0.5)
+    assert max(levels["bands"], key=levels["bands"].get) == "1000"
+
+
+def test_low_tone_is_weighted_down():
+    analyzer = SpectralAnalyzer(RATE, FFT, db_offset=94.0)
+    analyzer.process(frames(tone(0.1, 125.0, 2.0)))
+    levels = analyzer.levels(1.0)
+    assert levels["bands"]["125"] - levels["laeq"] == pytest.approx(16.1, abs=1.0)
+
+
+def test_levels_cover_only_the_window():
+    analyzer = SpectralAnalyzer(RATE, FFT, history_s=4)
+    analyzer.process(frames(tone(0.5, 1000.0, 2.0)))
+    analyzer.process(frames(tone(0.01, 1000.0, 1.0)))
+    assert analyzer.levels(0.5)["laeq"] < analyzer.levels(3.0)["laeq"] - 20
+
+
+def test_update_reads_the_meter_incrementally():
+    meter = NoiseMeter(samplerate=RATE, block_ms=128, history_s=4)
+    audio = tone(0.1, 1000.0, 1.0)
+    for i in range(0, len(audio), meter.block_len):
+        block = audio[i:i + meter.block_len]
+        meter._callback(block.reshape(-1, 1), len(block), None, None)
+    analyzer = SpectralAnalyzer(RATE, FFT)
+    analyzer.update(meter)
+    analyzer.update(meter)
+    assert analyzer._filled == len(audio) // FFT
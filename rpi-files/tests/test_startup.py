@@ -0,0 +1,54 @@
+import logging
+import os
+import subprocess
+import sys
+import time
+
+from classsense.startup import Startup
+
+
+def test_steps_run_in_parallel():
+    startup = Startup()
+
+    def step(value):
+        def run():
+            time.sleep(0.2)
+            return value
+        return run
+
+    t0 = time.monotonic()
+    results = startup.run_parallel({"lcd": step(1), "network": step(2), "sgp30": step(3)})
+    assert results == {"lcd": 1, "network": 2, "sgp30": 3}
+    assert time.monotonic() - t0 < 0.35
+    assert sorted(name for name, _ in startup.phases) == ["lcd", "network", "sgp30"]
+    assert all(seconds >= 0.2 for _, seconds in startup.phases)
+
+
+def test_failed_step_does_not_stop_the_others():
+    def broken():
+        raise OSError("no I2C bus")
+
+    results = Startup().run_parallel({"bme280": broken, "network": lambda: "ok"})
+    assert results == {"bme280": None, "network": "ok"}
+
+
+def test_milestone_is_logged_once(caplog):
+    startup = Startup(started=time.monotonic() - 1.0)
+    with caplog.at_level(logging.INFO, logger="ClassSense.startup"):
+        startup.milestone("first upload")
+        startup.milestone("first upload")
+    messages = [r.getMessage() for r in caplog.records]
+    assert len(messages) == 1
+    assert messages[0].startswith("Startup: first upload after 1.")
+
+
+def test_sensor_libraries_are_imported_lazily():
+    # Importing the drivers must not pull in numpy or a sensor library
+    code = (
+        "import sys, classsense.drivers;"
+        "print(' '.join(m for m in ('numpy', 'sounddevice', 'ST7735', 'ltr559', 'bme280', 'sgp30')"
+        " if m in sys.modules))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert out.stdout.strip() == ""
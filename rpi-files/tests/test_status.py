@@ -0,0 +1,52 @@
+import json
+import math
+import socket
+
+import pytest
+
+from classsense.status import StatusHub, StatusServer
+
+
+def get(path, socket_path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(socket_path)
+        s.sendall(f"GET {path} HTTP/1.0\r\nHost: localhost\r\n\r\n".encode())
+        data = b""
+        while chunk := s.recv(65536):
+            data += chunk
+    head, _, body = data.partition(b"\r\n\r\n")
+    return head.decode(), body
+
+
+@pytest.fixture
+def server(tmp_path):
+    hub = StatusHub(lambda: {"sensors": {"eco2_ppm": 600, "temperature_c": math.nan}})
+    srv = StatusServer(hub, socket_path=str(tmp_path / "status.sock"))
+    srv.start()
+    yield srv
+    srv.close()
+
+
+def test_status_is_valid_json_without_cors_by_default(server):
+    server.hub.event({"type": "anomaly", "metric": "eco2_ppm"})
+    head, body = get("/status", server.socket_path)
+    assert head.startswith("HTTP/1.0 200")
+    assert "Access-Control-Allow-Origin" not in head
+    assert json.loads(body) == {
+        "sensors": {"eco2_ppm": 600, "temperature_c": None},
+        "events": [{"type": "anomaly", "metric": "eco2_ppm"}],
+    }
+
+
+def test_history_disabled_and_unknown_paths(server):
+    assert get("/history", server.socket_path)[0].startswith("HTTP/1.0 404")
+    assert get("/nope", server.socket_path)[0].startswith("HTTP/1.0 404")
+
+
+def test_slow_stream_is_dropped():
+    hub = StatusHub(lambda: {}, stream_queue=2)
+    stream = hub.subscribe()
+    for _ in range(3):
+        hub.tick()
+    assert stream.closed
+    assert hub.streams == 0
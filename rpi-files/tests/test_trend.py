@@ -0,0 +1,66 @@
+import pytest
+
+from classsense import trend
+from classsense.history import HistoryStore
+from classsense.trend import MetricRing, TrendMetric, TrendView
+
+np = pytest.importorskip("numpy")
+ImageFont = pytest.importorskip("PIL.ImageFont")
+
+W, H, LABEL_W = 160, 80, 40
+
+
+@pytest.fixture
+def view():
+    metrics = [TrendMetric("eco2", "CO2", min_span=50), TrendMetric("noise", "dB", min_span=5)]
+    return TrendView(W, H, metrics, ImageFont.load_default(), minutes=1, period_s=1, label_w=LABEL_W)
+
+
+def lit(frame, color, rows):
+    """Columns of the plot area that have a pixel of `color` in `rows`."""
+    plot = frame[rows, LABEL_W:]
+    return np.flatnonzero(np.all(plot == color, axis=2).any(axis=0))
+
+
+def test_ring_keeps_the_newest_values():
+    ring = MetricRing(3)
+    for value in (1, None, 3, 4):
+        ring.append(value)
+    values = ring.values()
+    assert np.isnan(values[0])
+    assert list(values[1:]) == [3.0, 4.0]
+
+
+def test_sparkline_is_right_aligned(view):
+    for i in range(10):
+        view.append({"eco2": 600.0, "noise": 40.0 + i})
+    frame = view.render()
+    plot_w = W - LABEL_W - 1
+    # Ten readings fill the last ten columns of both rows
+    assert list(lit(frame, trend.LINE_COLOR, slice(0, H // 2))) == list(range(plot_w - 10, plot_w))
+    rising = lit(frame, trend.RISING_COLOR, slice(H // 2, H))
+    assert list(rising) == list(range(plot_w - 10, plot_w))
+
+
+def test_missing_readings_leave_gaps(view):
+    for value in (600.0, None, 610.0):
+        view.append({"eco2": value, "noise": 40.0})
+    columns = lit(view.render(), trend.LINE_COLOR, slice(0, H // 2))
+    plot_w = W - LABEL_W - 1
+    assert list(columns) == [plot_w - 3, plot_w - 1]
+
+
+def test_frame_is_reused(view):
+    view.append({"eco2": 600.0, "noise": 40.0})
+    assert view.render() is view.render()
+
+
+def test_follows_the_history(view):
+    store = HistoryStore(["eco2_ppm"], capacity=100)
+    for i in range(30):
+        store.append({"eco2_ppm": 500.0 + 10 * i})
+    view.follow(store, {"eco2": "eco2_ppm"})
+    # Appended values of followed metrics are ignored
+    view.append({"eco2": 9999.0, "noise": 40.0})
+    frame = view.render()
+    assert len(lit(frame, trend.RISING_COLOR, slice(0, H // 2))) == 30
@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+from classsense.uploader import Uploader
+
+
+def test_drop_oldest_keeps_newest():
+    uploader = Uploader(lambda batch: None, max_queue=3)
+    accepted = [uploader.put({"n": i}) for i in range(5)]
+    assert accepted == [True, True, True, False, False]
+    assert [p["n"] for p in uploader._queue] == [2, 3, 4]
+    assert uploader.dropped == 2
+
+
+def test_coalesce_replaces_newest():
+    uploader = Uploader(lambda batch: None, max_queue=3, overflow="coalesce")
+    for i in range(5):
+        uploader.put({"n": i})
+    # The backlog is kept, the freshest reading takes the last slot
+    assert [p["n"] for p in uploader._queue] == [0, 1, 4]
+    assert uploader.dropped == 2
+
+
+def test_queue_holds_at_least_one_batch():
+    uploader = Uploader(lambda batch: None, max_queue=2, batch_size=5)
+    for i in range(5):
+        assert uploader.put({"n": i})
+    assert uploader.depth() == 5
+
+
+def test_unknown_overflow_policy():
+    with pytest.raises(ValueError):
+        Uploader(lambda batch: None, overflow="drop-newest")
+
+
+def test_worker_sends_batches_in_order():
+    batches = []
+    done = threading.Event()
+
+    def send(batch):
+        batches.append([p["n"] for p in batch])
+        if len(batches) == 2:
+            done.set()
+
+    uploader = Uploader(send, batch_size=3)
+    uploader.start()
+    for i in range(7):
+        uploader.put({"n": i})
+    assert done.wait(2.0)
+    uploader.stop()
+    # The partial batch is drained on stop
+    assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+    assert uploader.sent == 7
+
+
+def test_failed_sends_are_counted_without_outbox():
+    def send(batch):
+        raise ConnectionError("down")
+
+    uploader = Uploader(send, batch_size=2)
+    uploader.start()
+    uploader.put({"n": 1})
+    uploader.put({"n": 2})
+    uploader.put({"n": 3})
+    uploader.stop()
+    assert uploader.failed == 3
+    assert uploader.sent == 0
@@ -0,0 +1,54 @@
+import socket
+
+import pytest
+
+from classsense.watchdog import SystemdWatchdog, sensors_alive
+
+
+def health(stale, since_read_s):
+    return {"reads": 1, "failures": 0, "timeouts": 0, "reinits": 0, "stale": stale, "since_read_s": since_read_s}
+
+
+def test_alive_while_one_channel_reads():
+    assert sensors_alive({"voc": health(True, 500.0), "light": health(False, 0.5)}, 60)
+
+
+def test_stale_channel_within_the_limit_is_alive():
+    assert sensors_alive({"voc": health(True, 30.0), "light": health(True, 500.0)}, 60)
+
+
+def test_dead_when_every_channel_is_silent():
+    assert not sensors_alive({"voc": health(True, 61.0), "light": health(True, 500.0)}, 60)
+
+
+def test_no_channels_is_alive():
+    assert sensors_alive({}, 60)
+
+
+@pytest.fixture
+def notify_socket(tmp_path, monkeypatch):
+    path = str(tmp_path / "notify")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(path)
+    sock.setblocking(False)
+    monkeypatch.setenv("NOTIFY_SOCKET", path)
+    yield sock
+    sock.close()
+
+
+def received(sock):
+    out = []
+    while True:
+        try:
+            out.append(sock.recv(64).decode("utf-8"))
+        except BlockingIOError:
+            return out
+
+
+def test_ping_only_while_check_passes(notify_socket):
+    ok = [True]
+    watchdog = SystemdWatchdog(check=lambda: ok[0])
+    watchdog.ping()
+    ok[0] = False
+    watchdog.ping()
+    assert received(notify_socket) == ["WATCHDOG=1"]
@@ -0,0 +1,73 @@
+import os
+import re
+
+import pytest
+
+from classsense import wire
+
+msgpack = pytest.importorskip("msgpack")
+
+K = wire.KEY_IDS
+
+
+def decode(body):
+    return msgpack.unpackb(body, raw=False, strict_map_key=False)
+
+
+def expand(obj):
+    """Inverse of the key table, as the server does it."""
+    if isinstance(obj, dict):
+        return {wire.KEYS_V1[k] if isinstance(k, int) else k: expand(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [expand(v) for v in obj]
+    return obj
+
+
+def sample(i, **sensors):
+    return {
+        "device_id": "pi-1",
+        "class_pin": "4711",
+        "timestamp": f"2024-01-01T00:00:0{i}Z",
+        "sensors": {"noise_db": 40.0 + i, **sensors},
+        "meta": {"app": "classsense", "version": "1"},
+    }
+
+
+def test_round_trip():
+    payloads = [sample(0), sample(1, noise_bands_db=[30.0, 31.5]), sample(2)]
+    version, shared, samples = decode(wire.encode_batch(payloads))
+    assert version == wire.SCHEMA_VERSION
+    shared = expand(shared)
+    assert [{**shared, **expand(s)} for s in samples] == payloads
+
+
+def test_shared_fields_sent_once():
+    payloads = [sample(0), sample(1)]
+    _, shared, samples = decode(wire.encode_batch(payloads))
+    assert set(shared) == {K["device_id"], K["class_pin"], K["meta"]}
+    assert all(set(s) == {K["timestamp"], K["sensors"]} for s in samples)
+
+
+def test_single_sample_has_nothing_shared():
+    _, shared, samples = decode(wire.encode_batch([sample(0)]))
+    assert shared == {}
+    assert set(samples[0]) == {K["device_id"], K["class_pin"], K["timestamp"], K["sensors"], K["meta"]}
+
+
+def test_known_keys_become_ids_at_any_depth():
+    payload = {"stats": {"metrics": {"noise_db": {"n": 3, "p95": 41.0}}}, "extra": {"noise_db": 1}}
+    _, _, (encoded,) = decode(wire.encode_batch([payload]))
+    assert encoded == {
+        K["stats"]: {K["metrics"]: {K["noise_db"]: {K["n"]: 3, K["p95"]: 41.0}}},
+        "extra": {K["noise_db"]: 1},
+    }
+
+
+def test_key_table_matches_server():
+    # webserver/server.js decodes with its own copy of the table
+    server = os.path.join(os.path.dirname(__file__), "..", "..", "webserver", "server.js")
+    if not os.path.exists(server):
+        pytest.skip("webserver not checked out")
+    with open(server, encoding="utf-8") as f:
+        table = re.search(r"const WIRE_KEYS = \{\s*1: \[(.*?)\]", f.read(), re.S).group(1)
+    assert re.findall(r'"([^"]+)"', table) == wire.KEYS_V1
@@ -6,6 +6,8 @@
  * - API:
  *   POST /api/classes -> {pin}
  *   POST /api/classes/:pin/ingest OR POST /ingest (JSON with class_pin)
+ *   POST /api/classes/:pin/ingest/batch OR POST /ingest/batch (JSON array, NDJSON
+ *     or MessagePack schema v1)
  *   GET  /api/classes/:pin/state
  *   POST /api/classes/:pin/emotions
  *
@@ -18,6 +20,7 @@ const http = require("http");
 const fs = require("fs");
 const path = require("path");
 const url = require("url");
+const zlib = require("zlib");
 
 const WEB_PORT = Number(process.env.WEB_PORT || 4227);
 const API_PORT = process.env.API_PORT ? Number(process.env.API_PORT) : null;
@@ -41,8 +44,24 @@ const EMOTION_LIMIT = Number.isFinite(Number(process.env.EMOTION_LIMIT))
   ? Number(process.env.EMOTION_LIMIT)
   : 10000;
 
+// Anomaly events from the devices are short-lived alerts: only the most
+// recent ones are kept per class, in memory for either store
+const EVENT_LIMIT = Number.isFinite(Number(process.env.EVENT_LIMIT))
+  ? Number(process.env.EVENT_LIMIT)
+  : 100;
+
+// Largest request body, before and after gzip decompression (bytes)
+const BODY_LIMIT = Number.isFinite(Number(process.env.BODY_LIMIT))
+  ? Number(process.env.BODY_LIMIT)
+  : 4 * 1024 * 1024;
+
 const utcNow = () => new Date().toISOString();
 
+function pushEvent(list, payload) {
+  list.push({ received_at: utcNow(), payload });
+  return list.slice(-EVENT_LIMIT);
+}
+
 function generatePin() {
   return Math.floor(Math.random() * 100000)
     .toString()
@@ -66,6 +85,7 @@ function createMemoryStore() {
         last_sensor: null,
         last_sensor_at: null,
         emotions: [],
+        events: [],
       };
       return pin;
     },
@@ -81,6 +101,11 @@ function createMemoryStore() {
       cls.emotions.push({ received_at: utcNow(), payload });
       cls.emotions = cls.emotions.slice(-EMOTION_LIMIT);
     },
+    async addEvent(pin, payload) {
+      const cls = classes[pin];
+      if (!cls) throw new Error("class_not_found");
+      cls.events = pushEvent(cls.events, payload);
+    },
     async getState(pin) {
       const cls = classes[pin];
       if (!cls) throw new Error("class_not_found");
@@ -91,6 +116,7 @@ function createMemoryStore() {
         last_sensor: cls.last_sensor,
         last_sensor_at: cls.last_sensor_at,
         emotions: cls.emotions,
+        events: cls.events,
       };
     },
   };
@@ -114,6 +140,8 @@ function createPgStore(pool) {
     throw new Error("pin_generation_failed");
   };
 
+  const events = {};
+
   const ensureClass = async (pin) => {
     const { rows } = await pool.query("SELECT pin FROM classes WHERE pin = $1", [pin]);
     if (!rows.length) throw new Error("class_not_found");
@@ -141,6 +169,10 @@ function createPgStore(pool) {
         throw e;
       }
     },
+    async addEvent(pin, payload) {
+      await ensureClass(pin);
+      events[pin] = pushEvent(events[pin] || [], payload);
+    },
     async getState(pin) {
       const { rows } = await pool.query(
         "SELECT pin, created_at, metadata, last_sensor, last_sensor_at FROM classes WHERE pin = $1",
@@ -159,6 +191,7 @@ function createPgStore(pool) {
         last_sensor: cls.last_sensor,
         last_sensor_at: cls.last_sensor_at,
         emotions: emo.rows,
+        events: events[pin] || [],
       };
     },
   };
@@ -193,10 +226,12 @@ function sendJson(res, code, payload) {
     "Content-Type": "application/json",
     "Content-Length": data.length,
     "Access-Control-Allow-Origin": "*",
-    "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Class-Pin",
+    "Access-Control-Allow-Headers": "Content-Type, Content-Encoding, Authorization, X-Class-Pin",
     "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
   });
   res.end(data);
+  // `return sendJson(...)` in handleApi marks the request as handled
+  return true;
 }
 
 function serveStatic(req, res, pathname) {
@@ -249,24 +284,231 @@ function serveStatic(req, res, pathname) {
   res.end(data);
 }
 
-function parseBody(req) {
+// Bodies over BODY_LIMIT, compressed or decompressed, are refused with 413
+// without being kept in memory (the rest of the upload is read and dropped).
+function readBody(req) {
   return new Promise((resolve) => {
+    const tooLarge = { _status: 413, _error: "body_too_large" };
+    if (Number(req.headers["content-length"]) > BODY_LIMIT) {
+      req.resume();
+      return resolve(tooLarge);
+    }
     let buf = [];
+    let size = 0;
     req
-      .on("data", (chunk) => buf.push(chunk))
+      .on("data", (chunk) => {
+        if (!buf) return;
+        size += chunk.length;
+        if (size > BODY_LIMIT) {
+          buf = null;
+          return resolve(tooLarge);
+        }
+        buf.push(chunk);
+      })
       .on("end", () => {
-        const raw = Buffer.concat(buf).toString("utf-8");
-        if (!raw) return resolve({});
-        try {
-          resolve(JSON.parse(raw));
-        } catch (e) {
-          resolve({ _error: "invalid_json" });
+        if (!buf) return;
+        let raw = Buffer.concat(buf);
+        if ((req.headers["content-encoding"] || "").toLowerCase() === "gzip") {
+          try {
+            raw = zlib.gunzipSync(raw, { maxOutputLength: BODY_LIMIT });
+          } catch (e) {
+            return resolve(e.code === "ERR_BUFFER_TOO_LARGE" ? tooLarge : { _error: "invalid_gzip" });
+          }
         }
+        resolve({ raw: raw.toString("utf-8"), buffer: raw });
       })
-      .on("error", () => resolve({}));
+      .on("error", () => resolve({ raw: "" }));
   });
 }
 
+async function parseBody(req) {
+  const { raw, _status, _error } = await readBody(req);
+  if (_error) return { _status, _error };
+  if (!raw) return {};
+  try {
+    return JSON.parse(raw);
+  } catch (e) {
+    return { _error: "invalid_json" };
+  }
+}
+
+// Compact binary samples (rpi-files/classsense/wire.py). A body is the
+// MessagePack array [schema_version, shared, samples]; map keys in the key
+// table of the version are small integers, and `shared` holds the top-level
+// fields common to all samples. Key tables never change within a version.
+const MSGPACK_TYPE = "application/vnd.classsense+msgpack";
+const WIRE_KEYS = {
+  1: [
+    "device_id", "timestamp", "class_pin", "sensors", "meta", "app", "version",
+    "brightness_lux", "eco2_ppm", "voc_ppb", "temperature_c", "noise_db",
+    "noise_lmax_db", "noise_lmin_db", "noise_l10_db", "noise_l90_db", "noise_bands_db",
+    "stats", "start", "end", "metrics", "n", "min", "max", "mean", "std", "p95",
+    "heartbeat_s",
+  ],
+};
+
+// Minimal MessagePack decoder (no extension types).
+function decodeMsgpack(buf) {
+  let pos = 0;
+  const need = (n) => {
+    if (pos + n > buf.length) throw new Error("truncated");
+  };
+  const uint = (n) => {
+    need(n);
+    const v = n === 8 ? Number(buf.readBigUInt64BE(pos)) : buf.readUIntBE(pos, n);
+    pos += n;
+    return v;
+  };
+  const int = (n) => {
+    need(n);
+    const v = n === 8 ? Number(buf.readBigInt64BE(pos)) : buf.readIntBE(pos, n);
+    pos += n;
+    return v;
+  };
+  const str = (n) => {
+    need(n);
+    const v = buf.toString("utf-8", pos, pos + n);
+    pos += n;
+    return v;
+  };
+  const bin = (n) => {
+    need(n);
+    const v = buf.subarray(pos, pos + n);
+    pos += n;
+    return v;
+  };
+  // Every element takes at least one byte, so lengths past the end are bogus
+  const count = (n) => {
+    if (n > buf.length - pos) throw new Error("truncated");
+    return n;
+  };
+  const array = (n) => {
+    const out = new Array(count(n));
+    for (let i = 0; i < n; i += 1) out[i] = next();
+    return out;
+  };
+  const map = (n) => {
+    const out = new Map();
+    count(n);
+    for (let i = 0; i < n; i += 1) {
+      const key = next();
+      out.set(key, next());
+    }
+    return out;
+  };
+  const next = () => {
+    need(1);
+    const b = buf[pos];
+    pos += 1;
+    if (b <= 0x7f) return b;
+    if (b >= 0xe0) return b - 0x100;
+    if ((b & 0xf0) === 0x80) return map(b & 0x0f);
+    if ((b & 0xf0) === 0x90) return array(b & 0x0f);
+    if ((b & 0xe0) === 0xa0) return str(b & 0x1f);
+    switch (b) {
+      case 0xc0: return null;
+      case 0xc2: return false;
+      case 0xc3: return true;
+      case 0xc4: return bin(uint(1));
+      case 0xc5: return bin(uint(2));
+      case 0xc6: return bin(uint(4));
+      case 0xca: { need(4); const v = buf.readFloatBE(pos); pos += 4; return v; }
+      case 0xcb: { need(8); const v = buf.readDoubleBE(pos); pos += 8; return v; }
+      case 0xcc: return uint(1);
+      case 0xcd: return uint(2);
+      case 0xce: return uint(4);
+      case 0xcf: return uint(8);
+      case 0xd0: return int(1);
+      case 0xd1: return int(2);
+      case 0xd2: return int(4);
+      case 0xd3: return int(8);
+      case 0xd9: return str(uint(1));
+      case 0xda: return str(uint(2));
+      case 0xdb: return str(uint(4));
+      case 0xdc: return array(uint(2));
+      case 0xdd: return array(uint(4));
+      case 0xde: return map(uint(2));
+      case 0xdf: return map(uint(4));
+      default: throw new Error(`unsupported msgpack type 0x${b.toString(16)}`);
+    }
+  };
+  const value = next();
+  if (pos !== buf.length) throw new Error("trailing bytes");
+  return value;
+}
+
+// Maps with integer keys back to plain objects with field names.
+function expandKeys(value, keys) {
+  if (value instanceof Map) {
+    const out = {};
+    for (const [k, v] of value) {
+      out[typeof k === "number" && keys[k] !== undefined ? keys[k] : String(k)] = expandKeys(v, keys);
+    }
+    return out;
+  }
+  if (Array.isArray(value)) return value.map((v) => expandKeys(v, keys));
+  return value;
+}
+
+function parseWireBatch(type, buffer) {
+  const match = type.match(/;\s*v=(\d+)/);
+  const version = match ? Number(match[1]) : null;
+  const keys = WIRE_KEYS[version];
+  if (!keys) return { _status: 415, _error: "unsupported_schema_version" };
+  try {
+    const doc = decodeMsgpack(buffer);
+    if (!Array.isArray(doc) || doc.length !== 3 || doc[0] !== version) throw new Error("bad envelope");
+    const shared = expandKeys(doc[1], keys);
+    const samples = expandKeys(doc[2], keys).map((sample) => ({ ...shared, ...sample }));
+    return { samples };
+  } catch (e) {
+    return { _error: "invalid_msgpack" };
+  }
+}
+
+// Batch bodies are a JSON array, NDJSON (one sample per line) or MessagePack
+// (see parseWireBatch), oldest first.
+async function parseBatchBody(req) {
+  const { raw, buffer, _status, _error } = await readBody(req);
+  if (_error) return { _status, _error };
+  const type = (req.headers["content-type"] || "").toLowerCase();
+  if (type.startsWith(MSGPACK_TYPE)) return parseWireBatch(type, buffer);
+  try {
+    if (type.startsWith("application/x-ndjson")) {
+      const samples = raw
+        .split("\n")
+        .filter((line) => line.trim())
+        .map((line) => JSON.parse(line));
+      return { samples };
+    }
+    const parsed = raw ? JSON.parse(raw) : [];
+    return { samples: Array.isArray(parsed) ? parsed : [parsed] };
+  } catch (e) {
+    return { _error: "invalid_json" };
+  }
+}
+
+async function ingestBatch(res, pin, samples) {
+  if (!samples.length) return sendJson(res, 400, { error: "empty_batch" });
+  try {
+    // Only the latest sample is kept as last_sensor
+    await dataStore.upsertSensor(pin, samples[samples.length - 1]);
+    sendJson(res, 200, { status: "ingest_ok", count: samples.length });
+  } catch (e) {
+    sendJson(res, 404, { error: "class_not_found" });
+  }
+}
+
+async function recordEvent(res, pin, event) {
+  try {
+    await dataStore.addEvent(pin, event);
+    console.log(`[${utcNow()}] event for class ${pin}: ${event.type || "event"} ${event.metric || ""}`);
+    sendJson(res, 200, { status: "event_recorded" });
+  } catch (e) {
+    sendJson(res, 404, { error: "class_not_found" });
+  }
+}
+
 async function handleApi(req, res, pathname) {
   if (req.method === "OPTIONS") {
     sendJson(res, 204, {});
@@ -276,7 +518,7 @@ async function handleApi(req, res, pathname) {
   // POST /api/classes
   if (req.method === "POST" && pathname === "/api/classes") {
     const body = await parseBody(req);
-    if (body._error) return sendJson(res, 400, { error: body._error });
+    if (body._error) return sendJson(res, body._status || 400, { error: body._error });
     try {
       const pin = await dataStore.createClass(body || {});
       sendJson(res, 201, { pin });
@@ -289,7 +531,7 @@ async function handleApi(req, res, pathname) {
   // POST /ingest
   if (req.method === "POST" && pathname === "/ingest") {
     const body = await parseBody(req);
-    if (body._error) return sendJson(res, 400, { error: body._error });
+    if (body._error) return sendJson(res, body._status || 400, { error: body._error });
     const pin = req.headers["x-class-pin"] || body.class_pin;
     if (!pin) return sendJson(res, 400, { error: "missing_class_pin" });
     try {
@@ -301,12 +543,33 @@ async function handleApi(req, res, pathname) {
     return true;
   }
 
+  // POST /ingest/batch
+  if (req.method === "POST" && pathname === "/ingest/batch") {
+    const body = await parseBatchBody(req);
+    if (body._error) return sendJson(res, body._status || 400, { error: body._error });
+    const first = body.samples[0] || {};
+    const pin = req.headers["x-class-pin"] || first.class_pin;
+    if (!pin) return sendJson(res, 400, { error: "missing_class_pin" });
+    await ingestBatch(res, pin, body.samples);
+    return true;
+  }
+
+  // POST /ingest/events
+  if (req.method === "POST" && pathname === "/ingest/events") {
+    const body = await parseBody(req);
+    if (body._error) return sendJson(res, body._status || 400, { error: body._error });
+    const pin = req.headers["x-class-pin"] || body.class_pin;
+    if (!pin) return sendJson(res, 400, { error: "missing_class_pin" });
+    await recordEvent(res, pin, body);
+    return true;
+  }
+
   // Regex helpers
   const ingestMatch = pathname.match(/^\/api\/classes\/(\d{5})\/ingest$/);
   if (req.method === "POST" && ingestMatch) {
     const pin = ingestMatch[1];
     const body = await parseBody(req);
-    if (body._error) return sendJson(res, 400, { error: body._error });
+    if (body._error) return sendJson(res, body._status || 400, { error: body._error });
     try {
       await dataStore.upsertSensor(pin, body);
       sendJson(res, 200, { status: "ingest_ok" });
@@ -316,6 +579,14 @@ async function handleApi(req, res, pathname) {
     return true;
   }
 
+  const batchMatch = pathname.match(/^\/api\/classes\/(\d{5})\/ingest\/batch$/);
+  if (req.method === "POST" && batchMatch) {
+    const body = await parseBatchBody(req);
+    if (body._error) return sendJson(res, body._status || 400, { error: body._error });
+    await ingestBatch(res, batchMatch[1], body.samples);
+    return true;
+  }
+
   const stateMatch = pathname.match(/^\/api\/classes\/(\d{5})\/state$/);
   if (req.method === "GET" && stateMatch) {
     try {
@@ -327,10 +598,18 @@ async function handleApi(req, res, pathname) {
     return true;
   }
 
+  const eventsMatch = pathname.match(/^\/api\/classes\/(\d{5})\/events$/);
+  if (req.method === "POST" && eventsMatch) {
+    const body = await parseBody(req);
+    if (body._error) return sendJson(res, body._status || 400, { error: body._error });
+    await recordEvent(res, eventsMatch[1], body);
+    return true;
+  }
+
   const emotionsMatch = pathname.match(/^\/api\/classes\/(\d{5})\/emotions$/);
   if (req.method === "POST" && emotionsMatch) {
     const body = await parseBody(req);
-    if (body._error) return sendJson(res, 400, { error: body._error });
+    if (body._error) return sendJson(res, body._status || 400, { error: body._error });
     try {
       await dataStore.addEmotion(emotionsMatch[1], body);
       sendJson(res, 200, { status: "recorded" });
@@ -0,0 +1,100 @@
+// Batch ingest route: plain, gzip and oversized bodies.
+// Run with `node --test webserver/test/` (Node 18+, no dependencies).
+
+const test = require("node:test");
+const assert = require("node:assert");
+const http = require("http");
+const net = require("net");
+const path = require("path");
+const zlib = require("zlib");
+const { spawn } = require("child_process");
+
+const BODY_LIMIT = 64 * 1024;
+
+function freePort() {
+  return new Promise((resolve) => {
+    const srv = net.createServer().listen(0, () => {
+      const { port } = srv.address();
+      srv.close(() => resolve(port));
+    });
+  });
+}
+
+function request(port, method, pathname, body, headers = {}) {
+  return new Promise((resolve, reject) => {
+    const req = http.request({ port, method, path: pathname, headers }, (res) => {
+      const chunks = [];
+      res.on("data", (c) => chunks.push(c));
+      res.on("end", () => {
+        const text = Buffer.concat(chunks).toString("utf-8");
+        resolve({ status: res.statusCode, body: text ? JSON.parse(text) : null });
+      });
+    });
+    // The server may answer 413 before the whole body is sent
+    req.on("error", reject);
+    req.end(body);
+  });
+}
+
+let server;
+let port;
+let pin;
+
+test.before(async () => {
+  port = await freePort();
+  server = spawn(process.execPath, [path.join(__dirname, "..", "server.js")], {
+    env: { ...process.env, WEB_PORT: String(port), BODY_LIMIT: String(BODY_LIMIT),
+           PG_CONNECTION_STRING: "", DATABASE_URL: "" },
+    stdio: ["ignore", "pipe", "inherit"],
+  });
+  await new Promise((resolve) => server.stdout.on("data", (d) => d.toString().includes("listening") && resolve()));
+  pin = (await request(port, "POST", "/api/classes", "{}", { "Content-Type": "application/json" })).body.pin;
+});
+
+test.after(() => server.kill());
+
+const samples = (n) => Array.from({ length: n }, (_, i) => ({ sensors: { noise_db: 40 + i } }));
+const batchPath = () => `/api/classes/${pin}/ingest/batch`;
+
+test("plain JSON batch", async () => {
+  const res = await request(port, "POST", batchPath(), JSON.stringify(samples(3)),
+    { "Content-Type": "application/json" });
+  assert.deepStrictEqual(res, { status: 200, body: { status: "ingest_ok", count: 3 } });
+});
+
+test("gzip NDJSON batch", async () => {
+  const body = zlib.gzipSync(samples(5).map((s) => JSON.stringify(s)).join("\n"));
+  const res = await request(port, "POST", batchPath(), body,
+    { "Content-Type": "application/x-ndjson", "Content-Encoding": "gzip" });
+  assert.deepStrictEqual(res, { status: 200, body: { status: "ingest_ok", count: 5 } });
+});
+
+test("oversized body is refused", async () => {
+  const body = JSON.stringify(samples(BODY_LIMIT / 10));
+  assert.ok(body.length > BODY_LIMIT);
+  const res = await request(port, "POST", batchPath(), body, { "Content-Type": "application/json" });
+  assert.deepStrictEqual(res, { status: 413, body: { error: "body_too_large" } });
+});
+
+test("oversized body without Content-Length is refused", async () => {
+  const body = JSON.stringify(samples(BODY_LIMIT / 10));
+  const res = await request(port, "POST", batchPath(), body,
+    { "Content-Type": "application/json", "Transfer-Encoding": "chunked" });
+  assert.strictEqual(res.status, 413);
+});
+
+test("gzip bomb is refused", async () => {
+  const body = zlib.gzipSync(Buffer.alloc(64 * BODY_LIMIT, " "));
+  assert.ok(body.length < BODY_LIMIT);
+  const res = await request(port, "POST", batchPath(), body,
+    { "Content-Type": "application/json", "Content-Encoding": "gzip" });
+  assert.deepStrictEqual(res, { status: 413, body: { error: "body_too_large" } });
+});
+
+test("msgpack with a bogus array length is refused", async () => {
+  // [1, {}, <array of 2^32 - 1 elements>] in 8 bytes
+  const body = Buffer.from([0x93, 0x01, 0x80, 0xdd, 0xff, 0xff, 0xff, 0xff]);
+  const res = await request(port, "POST", batchPath(), body,
+    { "Content-Type": "application/vnd.classsense+msgpack; v=1" });
+  assert.deepStrictEqual(res, { status: 400, body: { error: "invalid_msgpack" } });
+});